@@ -0,0 +1,560 @@
+"""
+Awaitable versions of the helpers in qanary_queries and language_queries for asyncio based components
+(e.g., FastAPI). All requests of an event loop share one aiohttp session, so a single worker can keep many
+pipeline requests in flight without blocking the event loop.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+from qanary_helpers.instrumentation import measure_call, measure_query
+from qanary_helpers.language_queries import (
+    QuestionTextWithLanguage,
+    _detected_language_query,
+    _question_languages_query,
+    _question_translations_query,
+    _resolve_texts_by_language,
+    _texts_by_language,
+    _texts_by_question,
+    _texts_in_languages_query,
+    _translated_texts_query,
+    create_annotation_of_question_language,
+    create_annotation_of_question_translation,
+)
+from qanary_helpers.qanary_queries import (
+    QuestionTextResult,
+    _question_uris_in_graphs_query,
+    _question_uris_query,
+    _raw_question_url,
+)
+from qanary_helpers.query_templates import track_query
+from qanary_helpers.results import SPARQL_RESULTS_TSV, decode_select_results, parse_tsv_header, parse_tsv_row
+from qanary_helpers.text_cache import get_question_text_cache
+from qanary_helpers.triplestore import SPARQL_RESULTS_JSON, is_update_query, parse_triplestore_endpoint
+
+__all__ = [
+    "AsyncTriplestoreClient", "get_session", "configure_session", "close_session", "get_triplestore_client",
+    "get_text_question_from_uri", "get_text_questions_from_uris", "QuestionTextResult",
+    "get_text_question_in_graph", "select_from_triplestore", "select_rows_from_triplestore",
+    "iter_select_from_triplestore", "insert_into_triplestore", "query_triplestore", "get_texts_with_detected_language_in_triplestore",
+    "get_translated_texts_in_triplestore", "get_texts_in_languages_in_triplestore", "get_detected_languages_of_question", "get_translations_of_question",
+    "QuestionTextWithLanguage", "QanaryQuestionContext", "prefetch_question_contexts",
+    # pure query builders without I/O, re-exported unchanged
+    "create_annotation_of_question_language", "create_annotation_of_question_translation",
+]
+
+_session_options = {"limit": 100, "limit_per_host": 0, "timeout": 60}
+_sessions = {}
+_clients = {}
+
+
+def configure_session(limit=100, limit_per_host=0, timeout=60):
+    """
+    Configures the shared session, applied to sessions created afterwards
+
+    Keyword arguments:
+    limit -- maximum number of simultaneous connections (0 for no limit)
+    limit_per_host -- maximum number of simultaneous connections to one host (0 for no limit)
+    timeout -- total timeout of a request in seconds
+    """
+    _session_options.update(limit=limit, limit_per_host=limit_per_host, timeout=timeout)
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Returns the shared aiohttp session of the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        for other_loop in [other_loop for other_loop in _sessions if other_loop.is_closed()]:
+            del _sessions[other_loop]
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=_session_options["limit"],
+                                           limit_per_host=_session_options["limit_per_host"]),
+            timeout=aiohttp.ClientTimeout(total=_session_options["timeout"])
+        )
+        _sessions[loop] = session
+    return session
+
+
+async def close_session():
+    """Closes the shared session of the running event loop (e.g., on component shutdown)"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+class AsyncTriplestoreClient:
+    """
+    Asynchronous client for one triplestore endpoint. The endpoint URL and credentials are parsed once, requests
+    are sent through the shared session of the running event loop.
+    """
+
+    def __init__(self, triplestore_endpoint):
+        """
+        Keyword arguments:
+        triplestore_endpoint -- URL of the triplestore endpoint
+        """
+        self.endpoint, self.username, self.password = parse_triplestore_endpoint(triplestore_endpoint)
+        self.auth = aiohttp.BasicAuth(self.username, self.password) if self.username is not None else None
+        logging.info("found: endpoint=%s", self.endpoint)
+
+    async def query(self, sparql_query):
+        """
+        Executes a SPARQL query or update on the endpoint and returns the result object
+
+        Keyword arguments:
+        sparql_query -- a query to execute on the endpoint
+        """
+        if is_update_query(sparql_query):
+            operation = "update"
+            data = {"update": sparql_query}
+            headers = None
+        else:
+            operation = "select"
+            data = {"query": sparql_query}
+            headers = {"Accept": SPARQL_RESULTS_JSON}
+
+        with track_query(sparql_query), measure_query(operation, self.endpoint, sparql_query) as call:
+            async with get_session().post(self.endpoint, data=data, headers=headers, auth=self.auth) as response:
+                call.status = response.status
+                response.raise_for_status()
+                call.bytes_in = len(await response.read())
+                if "json" in response.headers.get("Content-Type", ""):
+                    results = await response.json(content_type=None)
+                else:
+                    results = await response.text()
+        logging.debug("SPARQL results: %s", results)
+        return results
+
+    @asynccontextmanager
+    async def stream_query(self, sparql_query, accept):
+        """
+        Executes a SPARQL query and yields the response without reading its body, e.g., to iterate over chunks
+        of large results with constant memory
+
+        Keyword arguments:
+        sparql_query -- a query to execute on the endpoint
+        accept -- the requested result format (e.g., "text/tab-separated-values")
+        """
+        with track_query(sparql_query), measure_query("select", self.endpoint, sparql_query) as call:
+            async with get_session().post(self.endpoint, data={"query": sparql_query}, headers={"Accept": accept},
+                                          auth=self.auth) as response:
+                call.status = response.status
+                try:
+                    response.raise_for_status()
+                    yield response
+                finally:
+                    call.bytes_in = response.content.total_bytes
+
+
+def get_triplestore_client(triplestore_endpoint) -> AsyncTriplestoreClient:
+    """
+    Returns the shared asynchronous client for a triplestore endpoint
+
+    Keyword arguments:
+    triplestore_endpoint -- URL of the triplestore endpoint
+    """
+    client = _clients.get(triplestore_endpoint)
+    if client is None:
+        client = _clients[triplestore_endpoint] = AsyncTriplestoreClient(triplestore_endpoint)
+    return client
+
+
+async def get_text_question_from_uri(triplestore_endpoint: str, question_uri: str) -> str:
+    """Retrieves the textual representation for a question identified by a URI
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    question_uri (str) -- URI of the question
+
+    Returns:
+    str -- The question text
+
+    Raises:
+    aiohttp.ClientResponseError -- if the question text could not be retrieved
+    """
+    cache = get_question_text_cache()
+    if cache is not None:
+        question_text = cache.get(question_uri)
+        if question_text is not None:
+            return question_text
+
+    question_text = await _fetch_text(_raw_question_url(triplestore_endpoint, question_uri))
+    if cache is not None:
+        cache.put(question_uri, question_text)
+    return question_text
+
+
+async def _fetch_text(url):
+    with measure_call("raw_text", url) as call:
+        async with get_session().get(url) as response:
+            call.status = response.status
+            # error pages must not be taken (and cached) as question texts
+            response.raise_for_status()
+            call.bytes_in = len(await response.read())
+            return await response.text()
+
+
+async def get_text_questions_from_uris(triplestore_endpoint: str, question_uris: list,
+                                       max_concurrency: int = 8) -> list:
+    """Retrieves the textual representations of many questions concurrently
+
+    Texts in the question text cache are not fetched again. A failing fetch does not fail the whole batch,
+    its error is reported in the corresponding result.
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    question_uris (list) -- URIs of the questions
+    max_concurrency (int) -- maximum number of concurrent fetches
+
+    Returns:
+    list -- QuestionTextResult objects in the order of question_uris
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    cache = get_question_text_cache()
+
+    async def fetch(question_uri):
+        if cache is not None:
+            question_text = cache.get(question_uri)
+            if question_text is not None:
+                return QuestionTextResult(question_uri, question_text)
+        async with semaphore:
+            try:
+                question_text = await _fetch_text(_raw_question_url(triplestore_endpoint, question_uri))
+            except Exception as e:
+                logging.warning("fetching the text of question %s failed: %s", question_uri, e)
+                return QuestionTextResult(question_uri, None, e)
+        if cache is not None:
+            cache.put(question_uri, question_text)
+        return QuestionTextResult(question_uri, question_text)
+
+    return list(await asyncio.gather(*(fetch(question_uri) for question_uri in question_uris)))
+
+
+async def _fetch_missing_texts(triplestore_endpoint: str, texts: dict, max_concurrency: int = 8,
+                               errors: dict = None):
+    """Fetches the texts of the questions in {question URI: text or None} that have no text yet, the texts that
+    could not be fetched stay None"""
+    missing = [question_uri for question_uri, question_text in texts.items() if question_text is None]
+    for result in await get_text_questions_from_uris(triplestore_endpoint, missing, max_concurrency):
+        if result.error is not None:
+            logging.warning("question %s is left out, its text could not be fetched: %s", result.uri, result.error)
+            if errors is not None:
+                errors[result.uri] = result.error
+        texts[result.uri] = result.text
+
+
+async def get_text_question_in_graph(triplestore_endpoint, graph, max_concurrency=8, errors=None):
+    """
+    Retrieves the questions from the triplestore returns an array, the question texts are fetched concurrently
+
+    Keyword arguments:
+    triplestore_endpoint -- URL of the triplestore endpoint
+    graph -- URI of the graph to query inside of the triplestore
+    max_concurrency -- maximum number of concurrent fetches of question texts
+    errors -- if given, the exceptions of the failed fetches are stored in it by question URI; questions whose
+              text could not be fetched are logged at WARNING and left out
+    """
+    results = await select_from_triplestore(triplestore_endpoint, _question_uris_query(graph))
+    texts = dict.fromkeys(result['questionURI']['value'] for result in results["results"]["bindings"])
+    await _fetch_missing_texts(triplestore_endpoint, texts, max_concurrency, errors)
+
+    questions = list()
+    for question_uri, question_text in texts.items():
+        if question_text is None:
+            continue
+        logging.info("found question: \"%s\"", question_text)
+        questions.append({"uri": question_uri, "text": question_text})
+    return questions
+
+
+async def select_from_triplestore(triplestore_endpoint, sparql_query):
+    """
+    Executes SELECT query on triplestore and returns the result object
+
+    Keyword arguments:
+    triplestore_endpoint -- URL of the triplestore endpoint
+    sparql_query -- a query to execute on the endpoint
+    """
+    # required for Stardog
+    return await query_triplestore(triplestore_endpoint + "/query", sparql_query)
+
+
+async def select_rows_from_triplestore(triplestore_endpoint, sparql_query):
+    """
+    Executes SELECT query on triplestore and returns the results as list of rows, see qanary_helpers.results
+
+    Keyword arguments:
+    triplestore_endpoint -- URL of the triplestore endpoint
+    sparql_query -- a query to execute on the endpoint
+    """
+    return decode_select_results(await select_from_triplestore(triplestore_endpoint, sparql_query))
+
+
+async def iter_select_from_triplestore(triplestore_endpoint, sparql_query, encoding="utf-8"):
+    """
+    Executes SELECT query on triplestore and yields the result rows while the response is received, so large
+    results are never held in memory (requests the SPARQL TSV results format, see qanary_helpers.results)
+
+    Keyword arguments:
+    triplestore_endpoint -- URL of the triplestore endpoint
+    sparql_query -- a query to execute on the endpoint
+    encoding -- character encoding of the response
+    """
+    client = get_triplestore_client(triplestore_endpoint + "/query")
+    async with client.stream_query(sparql_query, SPARQL_RESULTS_TSV) as response:
+        row = None
+        pending = b""
+        async for chunk in response.content.iter_chunked(65536):
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if row is None:
+                    row = parse_tsv_header(line.decode(encoding))
+                else:
+                    yield parse_tsv_row(row, line.decode(encoding))
+        if pending and row is not None:
+            yield parse_tsv_row(row, pending.decode(encoding))
+
+
+async def insert_into_triplestore(triplestore_endpoint, sparql_query):
+    """
+    Executes INSERT query on triplestore and returns the result object
+
+    Keyword arguments:
+    triplestore_endpoint -- URL of the triplestore endpoint
+    sparql_query -- a query to execute on the endpoint
+    """
+    # required for Stardog
+    return await query_triplestore(triplestore_endpoint + "/update", sparql_query)
+
+
+async def query_triplestore(triplestore_endpoint, sparql_query):
+    """
+    Executes query on the triplestore and returns the result object
+
+    Keyword arguments:
+    triplestore_endpoint -- URL of the triplestore endpoint
+    sparql_query -- a query to execute on the endpoint
+    """
+    return await get_triplestore_client(triplestore_endpoint).query(sparql_query)
+
+
+async def get_texts_with_detected_language_in_triplestore(triplestore_endpoint: str, graph_uri: str, lang: str,
+                                                          text_predicate: str = None, max_concurrency: int = 8,
+                                                          errors: dict = None) -> list[QuestionTextWithLanguage]:
+    """Retrieves question texts from the triplestore for which a specific language has been detected.
+
+    Only the question URIs (and texts) are selected, each question is returned once and the missing texts are
+    fetched concurrently.
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    graph_uri (str) -- URI of the graph to query inside of the triplestore
+    lang (str) -- Expected detected language
+    text_predicate (str) -- if the question texts are stored in the graph, the predicate linking a question to
+                            its text; they are then resolved by the same query instead of being fetched
+    max_concurrency (int) -- maximum number of concurrent fetches of question texts, questions whose text could
+                             not be fetched are logged at WARNING and left out
+    errors (dict) -- if given, the exceptions of the failed fetches are stored in it by question URI
+
+    Returns:
+    list -- A list of appropriate QuestionTextWithLanguage objects with information from the triplestore.
+    """
+    results = await select_from_triplestore(triplestore_endpoint,
+                                            _detected_language_query(graph_uri, lang, text_predicate))
+    texts = _texts_by_question(results["results"]["bindings"])
+    await _fetch_missing_texts(triplestore_endpoint, texts, max_concurrency, errors)
+    return [QuestionTextWithLanguage(uri=question_uri, text=question_text, lang=lang)
+            for question_uri, question_text in texts.items() if question_text is not None]
+
+
+async def get_translated_texts_in_triplestore(triplestore_endpoint: str, graph_uri: str,
+                                              lang: str) -> list[QuestionTextWithLanguage]:
+    """Retrieves question texts from the triplestore that were translated into a specific language.
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    graph_uri (str) -- URI of the graph to query inside of the triplestore
+    lang (str) -- Target language of the translation
+
+    Returns:
+    list -- A list of appropriate QuestionTextWithLanguage objects with information from the triplestore.
+    """
+    results = await select_from_triplestore(triplestore_endpoint, _translated_texts_query(graph_uri, lang))
+    return QuestionTextWithLanguage.from_bindings(results["results"]["bindings"], lang)
+
+
+async def get_texts_in_languages_in_triplestore(triplestore_endpoint: str, graph_uri: str, languages: set,
+                                                text_predicate: str = None, max_concurrency: int = 8,
+                                                errors: dict = None) -> dict[str, list[QuestionTextWithLanguage]]:
+    """Retrieves the translated question texts and the question texts with a detected language for several
+    languages with one query, the missing texts are fetched once and concurrently.
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    graph_uri (str) -- URI of the graph to query inside of the triplestore
+    languages (set) -- Languages of the requested texts
+    text_predicate (str) -- see get_texts_with_detected_language_in_triplestore
+    max_concurrency (int) -- see get_texts_with_detected_language_in_triplestore
+    errors (dict) -- see get_texts_with_detected_language_in_triplestore
+
+    Returns:
+    dict -- {language: list of QuestionTextWithLanguage objects}, translations first, for every requested language
+    """
+    results = await select_from_triplestore(triplestore_endpoint,
+                                            _texts_in_languages_query(graph_uri, languages, text_predicate))
+    texts_by_language, texts = _texts_by_language(results["results"]["bindings"], languages)
+    await _fetch_missing_texts(triplestore_endpoint, texts, max_concurrency, errors)
+    return _resolve_texts_by_language(texts_by_language, texts)
+
+
+async def get_detected_languages_of_question(triplestore_endpoint: str, graph_uri: str,
+                                             question_uri: str) -> list[str]:
+    """Retrieves the languages that have been detected for a question.
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    graph_uri (str) -- URI of the graph to query inside of the triplestore
+    question_uri (str) -- URI of the question inside of the triplestore
+
+    Returns:
+    list -- The detected languages (e.g., "en")
+    """
+    results = await select_from_triplestore(triplestore_endpoint,
+                                            _question_languages_query(graph_uri, question_uri))
+    return [result["hasBody"]["value"] for result in results["results"]["bindings"]]
+
+
+async def get_translations_of_question(triplestore_endpoint: str, graph_uri: str,
+                                       question_uri: str) -> list[QuestionTextWithLanguage]:
+    """Retrieves all translations of a question.
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    graph_uri (str) -- URI of the graph to query inside of the triplestore
+    question_uri (str) -- URI of the question inside of the triplestore
+
+    Returns:
+    list -- A list of QuestionTextWithLanguage objects, one per translation
+    """
+    results = await select_from_triplestore(triplestore_endpoint,
+                                            _question_translations_query(graph_uri, question_uri))
+    return [QuestionTextWithLanguage(question_uri, result["hasBody"]["value"], result["hasBody"].get("xml:lang", ""))
+            for result in results["results"]["bindings"]]
+
+
+class QanaryQuestionContext:
+    """
+    Awaitable version of qanary_helpers.question_context.QanaryQuestionContext. Each piece of data is fetched
+    at most once, concurrent callers wait for the same pending request.
+    """
+
+    def __init__(self, triplestore_endpoint: str, graph_uri: str):
+        """
+        Keyword arguments:
+        triplestore_endpoint (str) -- URL of the triplestore endpoint
+        graph_uri (str) -- URI of the graph of the current question answering process
+        """
+        self.triplestore_endpoint = triplestore_endpoint
+        self.graph_uri = graph_uri
+        self._tasks = {}
+
+    @classmethod
+    def from_request(cls, request_json: dict) -> "QanaryQuestionContext":
+        """Creates the context from the JSON payload of an /annotatequestion request
+
+        Keyword arguments:
+        request_json (dict) -- payload containing "urn:qanary#endpoint" and "urn:qanary#inGraph" in "values"
+        """
+        values = request_json["values"]
+        return cls(values["urn:qanary#endpoint"], values["urn:qanary#inGraph"])
+
+    def prefill(self, **values):
+        """Sets pieces of data that are already known (question_uri, question_text, detected_languages,
+        translations) instead of fetching them, must be called within the event loop"""
+        loop = asyncio.get_running_loop()
+        for name, value in values.items():
+            future = self._tasks[name] = loop.create_future()
+            future.set_result(value)
+
+    def _memoize(self, name, coroutine_function):
+        task = self._tasks.get(name)
+        # failed lookups are not cached, the next caller tries again
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            task = self._tasks[name] = asyncio.ensure_future(coroutine_function())
+        return task
+
+    async def get_question_uri(self) -> str:
+        """Returns the URI of the question in the graph"""
+        async def fetch():
+            results = await select_from_triplestore(self.triplestore_endpoint, _question_uris_query(self.graph_uri))
+            bindings = results["results"]["bindings"]
+            if not bindings:
+                raise ValueError("No question found in graph {0}".format(self.graph_uri))
+            return bindings[0]["questionURI"]["value"]
+        return await self._memoize("question_uri", fetch)
+
+    async def get_question_text(self) -> str:
+        """Returns the raw text of the question"""
+        async def fetch():
+            return await get_text_question_from_uri(self.triplestore_endpoint, await self.get_question_uri())
+        return await self._memoize("question_text", fetch)
+
+    async def get_detected_languages(self) -> list[str]:
+        """Returns the languages detected for the question by previous components"""
+        async def fetch():
+            return await get_detected_languages_of_question(self.triplestore_endpoint, self.graph_uri,
+                                                            await self.get_question_uri())
+        return await self._memoize("detected_languages", fetch)
+
+    async def get_translations(self) -> dict[str, str]:
+        """Returns the translations of the question created by previous components as {language: text}"""
+        async def fetch():
+            translations = await get_translations_of_question(self.triplestore_endpoint, self.graph_uri,
+                                                              await self.get_question_uri())
+            return {translation.get_language(): translation.get_text() for translation in translations}
+        return await self._memoize("translations", fetch)
+
+    async def get_translation(self, lang: str):
+        """Returns the translation of the question into a language, or None if there is no such translation
+
+        Keyword arguments:
+        lang (str) -- language of the translation
+        """
+        return (await self.get_translations()).get(lang)
+
+
+async def prefetch_question_contexts(contexts: list):
+    """Resolves the question URIs and texts of many question contexts with one query and one bulk text fetch per
+    triplestore endpoint, e.g., for concurrent requests processed as a batch. Questions that could not be resolved
+    are left to be fetched by the contexts themselves.
+
+    Keyword arguments:
+    contexts (list) -- QanaryQuestionContext objects
+    """
+    contexts_by_endpoint = {}
+    for context in contexts:
+        contexts_by_endpoint.setdefault(context.triplestore_endpoint, []).append(context)
+    await asyncio.gather(*(_prefetch_question_contexts(triplestore_endpoint, endpoint_contexts)
+                           for triplestore_endpoint, endpoint_contexts in contexts_by_endpoint.items()))
+
+
+async def _prefetch_question_contexts(triplestore_endpoint: str, contexts: list):
+    results = await select_from_triplestore(triplestore_endpoint,
+                                            _question_uris_in_graphs_query({context.graph_uri for context in contexts}))
+    question_uris = {}
+    for binding in results["results"]["bindings"]:
+        question_uris.setdefault(binding["graph"]["value"], binding["questionURI"]["value"])
+    question_texts = {result.uri: result.text for result in await get_text_questions_from_uris(
+        triplestore_endpoint, list(dict.fromkeys(question_uris.values()))) if result.error is None}
+
+    for context in contexts:
+        question_uri = question_uris.get(context.graph_uri)
+        if question_uri is None:
+            continue
+        context.prefill(question_uri=question_uri)
+        if question_uri in question_texts:
+            context.prefill(question_text=question_texts[question_uri])
@@ -0,0 +1,319 @@
+import logging
+import math
+import re
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import count
+from typing import ClassVar, NamedTuple, Optional
+from uuid import uuid4
+
+from qanary_helpers.qanary_queries import insert_into_triplestore
+from qanary_helpers.query_templates import _LANGUAGE_TAG, escape_iri, escape_literal
+
+QA = "http://www.wdaqua.eu/qa#"
+OA = "http://www.w3.org/ns/openannotation/core/"
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+PREFIXES = {"qa": QA, "oa": OA, "rdf": RDF, "xsd": XSD}
+SPARQL_PROLOGUE = "".join("PREFIX {0}: <{1}>\n".format(prefix, namespace) for prefix, namespace in PREFIXES.items())
+
+_LOCAL_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_-]*$")
+
+
+class IRI(NamedTuple):
+    """An IRI term"""
+    value: str
+
+
+class Literal(NamedTuple):
+    """A literal term, optionally with a datatype IRI or a language tag"""
+    value: str
+    datatype: Optional[str] = None
+    lang: Optional[str] = None
+
+
+class BlankNode(NamedTuple):
+    """A blank node term, the label is only valid within one request"""
+    label: str
+
+
+def serialize_term(term, prefixes: Optional[dict] = None) -> str:
+    """Serializes a term for SPARQL (with prefixes) or N-Triples (without prefixes)
+
+    Keyword arguments:
+    term -- an IRI, Literal or BlankNode
+    prefixes (dict) -- namespaces to abbreviate as {prefix: namespace}
+    """
+    if isinstance(term, IRI):
+        if prefixes:
+            for prefix, namespace in prefixes.items():
+                if term.value.startswith(namespace) and _LOCAL_NAME.match(term.value[len(namespace):]):
+                    return prefix + ":" + term.value[len(namespace):]
+        return escape_iri(term.value)
+    if isinstance(term, Literal):
+        if term.lang is not None:
+            if not _LANGUAGE_TAG.match(term.lang):
+                raise ValueError("Invalid language tag: {0}".format(term.lang))
+            return escape_literal(term.value) + "@" + term.lang
+        if term.datatype is not None:
+            return escape_literal(term.value) + "^^" + serialize_term(IRI(term.datatype), prefixes)
+        return escape_literal(term.value)
+    if isinstance(term, BlankNode):
+        return "_:" + term.label
+    raise TypeError("Not an RDF term: {0!r}".format(term))
+
+
+def serialize_triples(triples, prefixes: Optional[dict] = None) -> str:
+    """Serializes (subject, predicate, object) term triples, one triple per line"""
+    return "".join("{0} {1} {2} .\n".format(serialize_term(s, prefixes), serialize_term(p, prefixes),
+                                            serialize_term(o, prefixes)) for s, p, o in triples)
+
+
+_blank_node_ids = count()
+
+
+@dataclass
+class Annotation(ABC):
+    """
+    Base class of qa: annotations of a question. Subclasses define the annotation type and the triples
+    describing the annotation body; the annotation node, oa:hasTarget, oa:annotatedBy and oa:annotatedAt are
+    common to all annotations.
+    """
+
+    annotation_type: ClassVar[str]
+
+    def target(self):
+        """Returns the term of the annotation target and additional triples describing it"""
+        return IRI(self.question_uri), []
+
+    @abstractmethod
+    def body_triples(self, node):
+        """Returns the triples describing the annotation body"""
+
+    def triples(self, annotated_at: Optional[datetime] = None) -> list:
+        """Returns all triples of the annotation
+
+        Keyword arguments:
+        annotated_at (datetime) -- time of the annotation, defaults to now
+        """
+        node = IRI("urn:uuid:{0}".format(uuid4()))
+        annotated_at = annotated_at or datetime.now(timezone.utc)
+        target, target_triples = self.target()
+        return [
+            (node, IRI(RDF + "type"), IRI(QA + self.annotation_type)),
+            (node, IRI(OA + "hasTarget"), target),
+            *target_triples,
+            *self.body_triples(node),
+            (node, IRI(OA + "annotatedBy"), IRI("urn:qanary:{0}".format(self.app_name))),
+            (node, IRI(OA + "annotatedAt"), Literal(annotated_at.isoformat(), XSD + "dateTime")),
+        ]
+
+    def to_ntriples(self) -> str:
+        """Serializes the annotation as N-Triples"""
+        return serialize_triples(self.triples())
+
+    def to_insert_query(self, graph_uri: str) -> str:
+        """Creates an INSERT DATA query writing the annotation into a graph
+
+        Keyword arguments:
+        graph_uri (str) -- URI of the graph of the current question answering process
+        """
+        return create_insert_query({graph_uri: self.triples()})
+
+
+@dataclass
+class QuestionLanguageAnnotation(Annotation):
+    """qa:AnnotationOfQuestionLanguage, the language detected for a question"""
+    annotation_type: ClassVar[str] = "AnnotationOfQuestionLanguage"
+    question_uri: str
+    language: str
+    app_name: str
+
+    def body_triples(self, node):
+        return [(node, IRI(OA + "hasBody"), Literal(self.language, XSD + "string"))]
+
+
+@dataclass
+class QuestionTranslationAnnotation(Annotation):
+    """qa:AnnotationOfQuestionTranslation, a translation of a question"""
+    annotation_type: ClassVar[str] = "AnnotationOfQuestionTranslation"
+    question_uri: str
+    translation: str
+    language: str
+    app_name: str
+
+    def body_triples(self, node):
+        return [(node, IRI(OA + "hasBody"), Literal(self.translation, lang=self.language))]
+
+
+def _score_literal(score) -> Literal:
+    """Returns the xsd:float literal of a score, the datatype of all qa:score values"""
+    score = float(score)
+    if not math.isfinite(score):
+        raise ValueError("The score of an annotation must be a finite number: {0!r}".format(score))
+    # repr yields a valid xsd:float lexical form for finite values, e.g. "0.5" or "1e-05"
+    return Literal(repr(score), XSD + "float")
+
+
+@dataclass
+class AnswerSPARQLAnnotation(Annotation):
+    """qa:AnnotationOfAnswerSPARQL, a SPARQL query computing the answer of a question"""
+    annotation_type: ClassVar[str] = "AnnotationOfAnswerSPARQL"
+    question_uri: str
+    sparql_query: str
+    app_name: str
+    score: float = 1.0
+
+    def body_triples(self, node):
+        return [
+            (node, IRI(OA + "hasBody"), Literal(self.sparql_query, XSD + "string")),
+            (node, IRI(QA + "score"), _score_literal(self.score)),
+        ]
+
+
+@dataclass
+class InstanceAnnotation(Annotation):
+    """qa:AnnotationOfInstance, a resource recognized in the span [start, end) of the question text"""
+    annotation_type: ClassVar[str] = "AnnotationOfInstance"
+    question_uri: str
+    resource_uri: str
+    start: int
+    end: int
+    app_name: str
+    score: Optional[float] = None
+
+    def target(self):
+        target = BlankNode("target{0}".format(next(_blank_node_ids)))
+        selector = BlankNode("selector{0}".format(next(_blank_node_ids)))
+        return target, [
+            (target, IRI(RDF + "type"), IRI(OA + "SpecificResource")),
+            (target, IRI(OA + "hasSource"), IRI(self.question_uri)),
+            (target, IRI(OA + "hasSelector"), selector),
+            (selector, IRI(RDF + "type"), IRI(OA + "TextPositionSelector")),
+            (selector, IRI(OA + "start"), Literal(str(int(self.start)), XSD + "nonNegativeInteger")),
+            (selector, IRI(OA + "end"), Literal(str(int(self.end)), XSD + "nonNegativeInteger")),
+        ]
+
+    def body_triples(self, node):
+        triples = [(node, IRI(OA + "hasBody"), IRI(self.resource_uri))]
+        if self.score is not None:
+            triples.append((node, IRI(QA + "score"), _score_literal(self.score)))
+        return triples
+
+
+def create_insert_query(triples_by_graph: dict) -> str:
+    """Creates one INSERT DATA query writing triples into one or more graphs
+
+    Keyword arguments:
+    triples_by_graph (dict) -- {graph URI: list of (subject, predicate, object) terms}
+    """
+    graphs = "".join("GRAPH {0} {{\n{1}}}\n".format(escape_iri(graph_uri), serialize_triples(triples, PREFIXES))
+                     for graph_uri, triples in triples_by_graph.items())
+    return "{0}INSERT DATA {{\n{1}}}".format(SPARQL_PROLOGUE, graphs)
+
+
+class AnnotationBatch:
+    """
+    Collects annotations and writes them to the triplestore as one SPARQL UPDATE request, i.e., one HTTP round
+    trip and one triplestore transaction for many annotations. The batch is flushed automatically once
+    flush_size annotations are pending, explicitly by flush() and when leaving the context manager without
+    an exception.
+    """
+
+    def __init__(self, triplestore_endpoint: str, flush_size: int = 100):
+        """
+        Keyword arguments:
+        triplestore_endpoint (str) -- URL of the triplestore endpoint
+        flush_size (int) -- number of pending annotations that triggers a flush
+        """
+        self.triplestore_endpoint = triplestore_endpoint
+        self.flush_size = flush_size
+        self.triples_written = 0
+        self._annotations = {}
+        self._updates = []
+        self._count = 0
+        self._triples = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, sparql_update: str, triples: int):
+        """Adds a SPARQL update query (e.g., INSERT) to the batch
+
+        Keyword arguments:
+        sparql_update (str) -- the update query
+        triples (int) -- number of triples written by the query
+        """
+        with self._lock:
+            self._updates.append(sparql_update.strip())
+            self._count += 1
+            self._triples += triples
+            full = self._count >= self.flush_size
+        if full:
+            self.flush()
+
+    def add_annotation(self, graph_uri: str, annotation: Annotation):
+        """Adds an annotation to the batch
+
+        Keyword arguments:
+        graph_uri (str) -- URI of the graph of the current question answering process
+        annotation (Annotation) -- the annotation
+        """
+        triples = annotation.triples()
+        with self._lock:
+            self._annotations.setdefault(graph_uri, []).extend(triples)
+            self._count += 1
+            self._triples += len(triples)
+            full = self._count >= self.flush_size
+        if full:
+            self.flush()
+
+    def add_question_translation(self, graph_uri: str, question_uri: str, translation: str,
+                                 translation_language: str, app_name: str):
+        """Adds an annotation of a question translation, see QuestionTranslationAnnotation"""
+        self.add_annotation(graph_uri, QuestionTranslationAnnotation(question_uri, translation,
+                                                                     translation_language, app_name))
+
+    def add_question_language(self, graph_uri: str, question_uri: str, language: str, app_name: str):
+        """Adds an annotation of a question language, see QuestionLanguageAnnotation"""
+        self.add_annotation(graph_uri, QuestionLanguageAnnotation(question_uri, language, app_name))
+
+    def flush(self) -> int:
+        """Writes all pending annotations in one request, on failure they stay pending
+
+        Returns:
+        int -- The number of triples written
+        """
+        with self._lock:
+            annotations, updates, pending, triples = self._annotations, self._updates, self._count, self._triples
+            self._annotations, self._updates, self._count, self._triples = {}, [], 0, 0
+        if not pending:
+            return 0
+
+        operations = ([create_insert_query(annotations)] if annotations else []) + updates
+        try:
+            # SPARQL 1.1 Update: several operations, each with its own prologue, separated by ";"
+            insert_into_triplestore(self.triplestore_endpoint, " ;\n".join(operations))
+        except Exception:
+            # keep the annotations for the next flush
+            with self._lock:
+                for graph_uri, graph_triples in annotations.items():
+                    self._annotations.setdefault(graph_uri, [])[:0] = graph_triples
+                self._updates[:0] = updates
+                self._count += pending
+                self._triples += triples
+            raise
+        logging.info("annotation batch: wrote %d annotations (%d triples)", pending, triples)
+        self.triples_written += triples
+        return triples
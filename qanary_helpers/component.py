@@ -0,0 +1,361 @@
+"""
+Base class of Qanary components served by FastAPI. A component implements only the async process(context)
+method; the base class parses the /annotatequestion requests, limits the number of concurrently processed and
+accepted requests (HTTP 503 beyond max_in_flight), writes the returned annotations in one request, serves /health
+(and /metrics), registers the component at the Qanary pipeline and shuts down gracefully. CPU-bound work can be
+offloaded to an InferenceExecutor; concurrent requests can be processed in micro-batches.
+"""
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+try:
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, PlainTextResponse
+except ImportError as e:
+    raise ImportError("qanary_helpers.component requires FastAPI: pip install qanary-helpers[component]") from e
+
+from qanary_helpers import aio
+from qanary_helpers.annotations import create_insert_query
+from qanary_helpers.inference import InferenceExecutor
+from qanary_helpers.instrumentation import mount_metrics
+from qanary_helpers.registration import Registration
+from qanary_helpers.registrator import AsyncRegistrator
+
+
+class MicroBatcher:
+    """
+    Collects the items submitted within a time window (or until max_size items are collected) and passes them to
+    the handler as one batch. The handler returns one error (or None) per item, which is raised in the caller
+    that submitted the item.
+    """
+
+    def __init__(self, handler, window: float = 0.01, max_size: int = 32):
+        """
+        Keyword arguments:
+        handler -- coroutine function handling a list of items
+        window (float) -- seconds to wait for further items after the first item of a batch
+        max_size (int) -- maximum number of items per batch
+        """
+        self.handler = handler
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, item):
+        """Adds an item to the current batch and waits until the batch is handled"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._handle(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, batch):
+        self.batches += 1
+        try:
+            errors = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            errors = [e] * len(batch)
+        for (_, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+
+class QanaryComponent(ABC):
+    """
+    Base class of a Qanary component, e.g.:
+
+        class MyComponent(QanaryComponent):
+            async def process(self, context):
+                question_text = await context.get_question_text()
+                return [AnswerSPARQLAnnotation(await context.get_question_uri(), query, self.app_name)]
+
+        MyComponent.from_env().run()
+    """
+
+    def __init__(self, name: str, description: str = "", service_url: str = None, admin_server_url: str = None,
+                 admin_server_user: str = None, admin_server_password: str = None, registration_interval: int = 10,
+                 max_in_flight: int = 64, max_concurrency: int = 16, shutdown_timeout: float = 30,
+                 metrics: bool = True, metadata: dict = None, executor: InferenceExecutor = None,
+                 batch_window: float = None, max_batch_size: int = 32, registration_heartbeat: bool = False):
+        """
+        Keyword arguments:
+        name (str) -- name of the component
+        description (str) -- description of the component
+        service_url (str) -- URL of the component visible to the Qanary pipeline
+        admin_server_url (str) -- URL of the Qanary pipeline (Spring Boot Admin server), None to not register
+        admin_server_user (str) -- admin username of the Qanary pipeline
+        admin_server_password (str) -- admin password of the Qanary pipeline
+        registration_interval (int) -- seconds between the registration calls
+        max_in_flight (int) -- maximum number of accepted requests, further requests are rejected with HTTP 503
+        max_concurrency (int) -- maximum number of requests processed concurrently, further requests wait
+        shutdown_timeout (float) -- seconds to wait for accepted requests (and the items of the executor) on shutdown
+        metrics (bool) -- serve the instrumentation of outbound calls at /metrics
+        metadata (dict) -- additional metadata of the registration
+        executor (InferenceExecutor) -- worker processes for the CPU-bound work of process(), started and
+                                        stopped with the component
+        batch_window (float) -- if set, requests arriving within this many seconds (e.g., 0.01) are processed as
+                                one batch: their questions are resolved by one query and one bulk text fetch and
+                                all annotations are written by one SPARQL UPDATE
+        max_batch_size (int) -- maximum number of requests per batch
+        registration_heartbeat (bool) -- after the registration, only check that the Qanary pipeline knows the
+                                         component and register again if it does not
+        """
+        self.name = name
+        self.description = description
+        self.service_url = service_url
+        self.admin_server_url = admin_server_url
+        self.admin_server_user = admin_server_user
+        self.admin_server_password = admin_server_password
+        self.registration_interval = registration_interval
+        self.max_in_flight = max_in_flight
+        self.max_concurrency = max_concurrency
+        self.shutdown_timeout = shutdown_timeout
+        self.metrics = metrics
+        self.metadata = metadata or {}
+        self.executor = executor
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.registration_heartbeat = registration_heartbeat
+        self.in_flight = 0
+        self.accepting = False
+        self._semaphore = None
+        self._idle = None
+        self._registrator = None
+        self._batcher = None
+        self._app = None
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "QanaryComponent":
+        """Creates the component from the environment variables SERVICE_NAME_COMPONENT,
+        SERVICE_DESCRIPTION_COMPONENT, SERVICE_HOST, SPRING_BOOT_ADMIN_URL, SPRING_BOOT_ADMIN_USERNAME and
+        SPRING_BOOT_ADMIN_PASSWORD, keyword arguments take precedence
+
+        Raises:
+        KeyError -- if SERVICE_NAME_COMPONENT is not set, or SERVICE_HOST is not set although the component
+                    registers at SPRING_BOOT_ADMIN_URL
+        """
+        settings = {
+            "name": os.environ.get("SERVICE_NAME_COMPONENT"),
+            "description": os.environ.get("SERVICE_DESCRIPTION_COMPONENT", ""),
+            "service_url": os.environ.get("SERVICE_HOST"),
+            "admin_server_url": os.environ.get("SPRING_BOOT_ADMIN_URL"),
+            "admin_server_user": os.environ.get("SPRING_BOOT_ADMIN_USERNAME"),
+            "admin_server_password": os.environ.get("SPRING_BOOT_ADMIN_PASSWORD"),
+        }
+        settings.update(kwargs)
+        missing = [] if settings["name"] else ["SERVICE_NAME_COMPONENT"]
+        if settings["admin_server_url"] and not settings["service_url"]:
+            missing.append("SERVICE_HOST")
+        if missing:
+            raise KeyError("The component requires the environment variables {0}".format(", ".join(missing)))
+        return cls(**settings)
+
+    @property
+    def app_name(self) -> str:
+        """Name of the component as used in annotations (oa:annotatedBy)"""
+        return self.name.replace(" ", "-")
+
+    @abstractmethod
+    async def process(self, context: aio.QanaryQuestionContext):
+        """Processes one question, implemented by the component
+
+        Keyword arguments:
+        context (QanaryQuestionContext) -- access to the question and previous annotations
+
+        Returns:
+        list -- Annotation objects to write into the graph of the question, or None
+        """
+
+    async def startup(self):
+        """Called once before the first request, e.g., to load models"""
+
+    async def shutdown(self):
+        """Called once after the last request"""
+
+    @property
+    def app(self) -> FastAPI:
+        """The FastAPI application of the component"""
+        if self._app is None:
+            self._app = self.create_app()
+        return self._app
+
+    def create_app(self) -> FastAPI:
+        """Creates the FastAPI application with the routes /annotatequestion, /health and /metrics"""
+        app = FastAPI(title=self.name, description=self.description, lifespan=self._lifespan)
+        app.add_api_route("/annotatequestion", self._annotate_question, methods=["POST"])
+        app.add_api_route("/health", self._health, methods=["GET"])
+        if self.metrics:
+            mount_metrics(app)
+        return app
+
+    def run(self, host: str = "0.0.0.0", port: int = None, **uvicorn_options):
+        """Serves the component with uvicorn
+
+        Keyword arguments:
+        host (str) -- interface to listen on
+        port (int) -- port to listen on, defaults to the environment variable SERVICE_PORT
+        uvicorn_options -- further options of uvicorn.run
+        """
+        try:
+            import uvicorn
+        except ImportError as e:
+            raise ImportError("run requires uvicorn: pip install qanary-helpers[component]") from e
+
+        if port is None:
+            port = int(os.environ["SERVICE_PORT"])
+        uvicorn.run(self.app, host=host, port=port, **uvicorn_options)
+
+    def registration(self) -> Registration:
+        """Returns the registration of the component at the Qanary pipeline"""
+        metadata = {
+            "start": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "description": self.description,
+            "written in": "Python",
+        }
+        metadata.update(self.metadata)
+        return Registration(name=self.name, serviceUrl=self.service_url, healthUrl=f"{self.service_url}/health",
+                            metadata=metadata)
+
+    @asynccontextmanager
+    async def _lifespan(self, app):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        if self.batch_window is not None:
+            self._batcher = MicroBatcher(self._process_batch, self.batch_window, self.max_batch_size)
+        if self.executor is not None:
+            await self.executor.start()
+        try:
+            await self.startup()
+            try:
+                if self.admin_server_url:
+                    self._registrator = AsyncRegistrator(self.admin_server_url, self.admin_server_user,
+                                                         self.admin_server_password, self.registration(),
+                                                         self.registration_interval,
+                                                         heartbeat=self.registration_heartbeat)
+                    self._registrator.start()
+                self.accepting = True
+                yield
+            finally:
+                self.accepting = False
+                if self._registrator is not None:
+                    await self._registrator.stop()
+                    self._registrator = None
+                try:
+                    await asyncio.wait_for(self._idle.wait(), self.shutdown_timeout)
+                except asyncio.TimeoutError:
+                    logging.warning("component: shutting down with %d requests in flight", self.in_flight)
+                await self.shutdown()
+        finally:
+            # also if the startup failed
+            if self.executor is not None:
+                await self.executor.close(self.shutdown_timeout)
+            await aio.close_session()
+
+    async def _annotate_question(self, request: Request):
+        if not self.accepting or self.in_flight >= self.max_in_flight:
+            return PlainTextResponse("overloaded" if self.accepting else "shutting down", status_code=503,
+                                     headers={"Retry-After": "1"})
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            try:
+                request_json = await request.json()
+                context = aio.QanaryQuestionContext.from_request(request_json)
+            except (ValueError, KeyError, TypeError):
+                return PlainTextResponse("a JSON payload with urn:qanary#endpoint and urn:qanary#inGraph in "
+                                         "values is required", status_code=400)
+            if self._batcher is not None:
+                await self._batcher.submit(context)
+            else:
+                annotations = await self._process(context)
+                if annotations:
+                    await self.write_annotations(context, annotations)
+            return JSONResponse(content=request_json)
+        except asyncio.QueueFull:
+            return PlainTextResponse("overloaded", status_code=503, headers={"Retry-After": "1"})
+        except Exception:
+            logging.exception("component: processing the question failed")
+            return PlainTextResponse("processing the question failed", status_code=500)
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.set()
+
+    async def _process(self, context):
+        async with self._semaphore:
+            return await self.process(context)
+
+    async def _process_batch(self, contexts: list) -> list:
+        # one query and one bulk text fetch for all questions, one UPDATE for all annotations (per endpoint)
+        try:
+            await aio.prefetch_question_contexts(contexts)
+        except Exception as e:
+            logging.warning("component: resolving the questions of a batch failed, resolving them one by one: %s", e)
+        outcomes = await asyncio.gather(*(self._process(context) for context in contexts), return_exceptions=True)
+
+        triples_by_endpoint = {}
+        for context, outcome in zip(contexts, outcomes):
+            if outcome and not isinstance(outcome, BaseException):
+                graph_triples = triples_by_endpoint.setdefault(context.triplestore_endpoint, {})
+                graph_triples.setdefault(context.graph_uri, []).extend(
+                    triple for annotation in outcome for triple in annotation.triples())
+        endpoints = list(triples_by_endpoint)
+        writes = await asyncio.gather(
+            *(aio.insert_into_triplestore(endpoint, create_insert_query(triples_by_endpoint[endpoint]))
+              for endpoint in endpoints),
+            return_exceptions=True
+        )
+        write_errors = dict(zip(endpoints, writes))
+
+        # the error of each request, if any
+        errors = []
+        for context, outcome in zip(contexts, outcomes):
+            if isinstance(outcome, BaseException):
+                errors.append(outcome)
+            elif outcome and isinstance(write_errors[context.triplestore_endpoint], BaseException):
+                errors.append(write_errors[context.triplestore_endpoint])
+            else:
+                errors.append(None)
+        return errors
+
+    async def write_annotations(self, context: aio.QanaryQuestionContext, annotations: list):
+        """Writes annotations into the graph of the question with one INSERT DATA request
+
+        Keyword arguments:
+        context (QanaryQuestionContext) -- context of the question
+        annotations (list) -- Annotation objects
+        """
+        triples = [triple for annotation in annotations for triple in annotation.triples()]
+        await aio.insert_into_triplestore(context.triplestore_endpoint,
+                                          create_insert_query({context.graph_uri: triples}))
+
+    async def _health(self):
+        if not self.accepting:
+            return PlainTextResponse("shutting down", status_code=503)
+        return PlainTextResponse("alive")
+
@@ -0,0 +1,168 @@
+"""
+Export of whole Qanary graphs (e.g., for offline analysis or caching) via CONSTRUCT queries. The RDF is
+streamed in chunks, so memory use is constant regardless of the graph size.
+
+Large graphs can be exported in LIMIT/OFFSET pages of N-Triples (one triple per line), and an interrupted paged
+export can be resumed from its first incomplete page. ORDER BY only fixes the order of the solutions, not how a
+response is serialized, so exports are never resumed from a byte offset. Blank node labels are chosen per
+response, i.e. the same label in two pages may denote different nodes; graphs with blank nodes are therefore
+rejected by the paged export and have to be exported by one query.
+"""
+import logging
+import os
+
+from qanary_helpers.query_templates import register_query
+from qanary_helpers.triplestore import get_triplestore_client
+
+N_TRIPLES = "application/n-triples"
+TURTLE = "text/turtle"
+
+
+_CONSTRUCT_GRAPH = """
+        CONSTRUCT {{ ?s ?p ?o }}
+        WHERE {{
+            GRAPH {graph} {{ ?s ?p ?o }}
+        }}
+        ORDER BY ?s ?p ?o
+    """
+_CONSTRUCT_GRAPH_QUERIES = {
+    (False, False): register_query("construct_graph", _CONSTRUCT_GRAPH, graph="iri"),
+    (True, False): register_query("construct_graph_limit", _CONSTRUCT_GRAPH + "LIMIT {limit}\n",
+                                  graph="iri", limit="integer"),
+    (False, True): register_query("construct_graph_offset", _CONSTRUCT_GRAPH + "OFFSET {offset}\n",
+                                  graph="iri", offset="integer"),
+    (True, True): register_query("construct_graph_page", _CONSTRUCT_GRAPH + "LIMIT {limit}\nOFFSET {offset}\n",
+                                 graph="iri", limit="integer", offset="integer"),
+}
+
+
+_GRAPH_HAS_BLANK_NODES = register_query("graph_has_blank_nodes", """
+        ASK {{
+            GRAPH {graph} {{ ?s ?p ?o FILTER(isBlank(?s) || isBlank(?o)) }}
+        }}
+    """, graph="iri")
+
+
+def construct_graph_query(graph_uri: str, limit: int = None, offset: int = 0) -> str:
+    """Returns the CONSTRUCT query for all triples of a graph in a stable order
+
+    Keyword arguments:
+    graph_uri (str) -- URI of the graph to export
+    limit (int) -- maximum number of triples, None for all
+    offset (int) -- number of triples to skip
+    """
+    params = {"graph": graph_uri}
+    if limit is not None:
+        params["limit"] = limit
+    if offset:
+        params["offset"] = offset
+    return _CONSTRUCT_GRAPH_QUERIES[limit is not None, bool(offset)].bind(**params)
+
+
+def iter_graph_export(triplestore_endpoint: str, graph_uri: str, rdf_format: str = N_TRIPLES,
+                      chunk_size: int = 65536, page_size: int = None, start_page: int = 0):
+    """Yields the serialized triples of a graph as chunks of bytes
+
+    Without page_size the graph is exported by one CONSTRUCT query. With page_size the graph is exported by one
+    CONSTRUCT query per page of page_size triples, starting at start_page; paging requires N-Triples and a graph
+    without blank nodes (see the module documentation).
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    graph_uri (str) -- URI of the graph to export
+    rdf_format (str) -- requested RDF serialization, e.g. N_TRIPLES or TURTLE
+    chunk_size (int) -- maximum size of the yielded chunks
+    page_size (int) -- number of triples per page, None to export the graph by one query
+    start_page (int) -- first page to export (only with page_size)
+
+    Raises:
+    ValueError -- if paging is requested for another format than N-Triples or for a graph with blank nodes
+    """
+    client = get_triplestore_client(triplestore_endpoint + "/query")
+
+    if page_size is None:
+        with client.stream_query(construct_graph_query(graph_uri), rdf_format) as response:
+            yield from response.iter_content(chunk_size=chunk_size)
+        return
+
+    if rdf_format != N_TRIPLES:
+        raise ValueError("Paged graph export requires N-Triples, not {0}".format(rdf_format))
+    if client.select(_GRAPH_HAS_BLANK_NODES.bind(graph=graph_uri)).get("boolean"):
+        raise ValueError("The graph {0} contains blank nodes, which cannot be exported in pages: their labels "
+                         "are not stable across queries. Export it by one query.".format(graph_uri))
+    page = start_page
+    while True:
+        triples = 0
+        query = construct_graph_query(graph_uri, limit=page_size, offset=page * page_size)
+        with client.stream_query(query, rdf_format) as response:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                triples += chunk.count(b"\n")
+                yield chunk
+        logging.debug("graph export: page %d of %s with %d triples", page, graph_uri, triples)
+        if triples < page_size:
+            return
+        page += 1
+
+
+def export_graph_to_file(triplestore_endpoint: str, graph_uri: str, path: str, rdf_format: str = N_TRIPLES,
+                         resume: bool = False, page_size: int = None, chunk_size: int = 65536) -> int:
+    """Exports the triples of a graph into a file
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    graph_uri (str) -- URI of the graph to export
+    path (str) -- file to write
+    rdf_format (str) -- requested RDF serialization, e.g. N_TRIPLES or TURTLE
+    resume (bool) -- continue an interrupted paged export into the same file (from its first incomplete page)
+                     instead of overwriting it, requires page_size and N-Triples
+    page_size (int) -- number of triples per page, None to export the graph by one query
+    chunk_size (int) -- size of the chunks written to the file
+
+    Returns:
+    int -- The number of bytes written by this call
+    """
+    if resume and (page_size is None or rdf_format != N_TRIPLES):
+        raise ValueError("Resuming a graph export requires a paged N-Triples export (page_size)")
+
+    start_page = 0
+    if resume and os.path.exists(path):
+        # continue with the first incomplete page, dropping its triples already written
+        start_page = _count_lines(path) // page_size
+        _truncate_after_lines(path, start_page * page_size)
+        logging.info("graph export: resuming %s at page %d", path, start_page)
+
+    written = 0
+    with open(path, "ab" if resume else "wb") as f:
+        for chunk in iter_graph_export(triplestore_endpoint, graph_uri, rdf_format, chunk_size,
+                                       page_size=page_size, start_page=start_page):
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def _count_lines(path, chunk_size=65536):
+    lines = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            lines += chunk.count(b"\n")
+    return lines
+
+
+def _truncate_after_lines(path, lines, chunk_size=65536):
+    position = 0
+    with open(path, "r+b") as f:
+        while lines > 0:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            newlines = chunk.count(b"\n")
+            if newlines < lines:
+                lines -= newlines
+                position += len(chunk)
+                continue
+            end = -1
+            for _ in range(lines):
+                end = chunk.index(b"\n", end + 1)
+            position += end + 1
+            lines = 0
+        f.truncate(position)
@@ -0,0 +1,180 @@
+"""
+Offloading of CPU-bound work (e.g., NER, translation or classification models) of a component to a pool of warm
+worker processes, so the event loop and the GIL of the server process stay free. Each worker initializes its model
+once; questions arriving concurrently are batched into one call of the inference function.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# model of the worker process, created by the initializer
+_worker_state = None
+
+
+def _initialize_worker(initializer, initargs):
+    global _worker_state
+    _worker_state = initializer(*initargs) if initializer is not None else None
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _infer_batch(infer, items):
+    results = infer(_worker_state, items)
+    if len(results) != len(items):
+        raise ValueError("The inference function returned {0} results for {1} items".format(len(results),
+                                                                                          len(items)))
+    return results
+
+
+class InferenceExecutor:
+    """
+    Runs an inference function in a pool of worker processes. The function is called as infer(state, items)
+    with the state returned by initializer(*initargs) in the worker process and a list of items, and returns one
+    result per item. Both functions must be picklable, i.e. defined at module level.
+
+        executor = InferenceExecutor(predict, initializer=load_model, initargs=("model.bin",))
+        await executor.start()
+        label = await executor.submit(question_text)
+    """
+
+    def __init__(self, infer, initializer=None, initargs=(), max_workers: int = None, max_batch_size: int = 16,
+                 max_batch_delay: float = 0.005, max_queue_size: int = 256, mp_context=None):
+        """
+        Keyword arguments:
+        infer -- the inference function, infer(state, items) -> list of results
+        initializer -- creates the state (e.g., loads the model) once per worker process
+        initargs (tuple) -- arguments of the initializer
+        max_workers (int) -- number of worker processes, defaults to the number of CPUs
+        max_batch_size (int) -- maximum number of items per call of the inference function
+        max_batch_delay (float) -- seconds to wait for further items before an incomplete batch is run
+        max_queue_size (int) -- maximum number of waiting items, submit raises asyncio.QueueFull beyond
+        mp_context -- multiprocessing context of the pool (e.g., multiprocessing.get_context("spawn"))
+        """
+        self.infer = infer
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self.max_queue_size = max_queue_size
+        self.mp_context = mp_context
+        self.batches = 0
+        self._pool = None
+        self._queue = None
+        self._dispatchers = []
+
+    async def start(self):
+        """Starts the worker processes and waits until all of them are initialized"""
+        if self._pool is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.mp_context,
+                                         initializer=_initialize_worker, initargs=(self.initializer, self.initargs))
+        # concurrent tasks make the pool start all workers
+        pids = await asyncio.gather(*(loop.run_in_executor(self._pool, _warm_up) for _ in range(self.max_workers)))
+        logging.info("inference: %d worker processes ready (%s)", len(set(pids)), sorted(set(pids)))
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._dispatchers = [asyncio.ensure_future(self._dispatch(self._pool, self._queue))
+                             for _ in range(self.max_workers)]
+
+    async def close(self, timeout: float = None) -> bool:
+        """Completes the waiting items and stops the worker processes
+
+        Keyword arguments:
+        timeout (float) -- seconds to wait for the waiting items, None to wait forever. Items not completed by then
+                           fail with a RuntimeError and the worker processes are terminated.
+
+        Returns:
+        bool -- True, if all waiting items were completed
+        """
+        if self._pool is None:
+            return True
+        pool, queue, dispatchers = self._pool, self._queue, self._dispatchers
+        self._pool, self._queue, self._dispatchers = None, None, []
+
+        completed = True
+        try:
+            await asyncio.wait_for(queue.join(), timeout)
+        except asyncio.TimeoutError:
+            completed = False
+            logging.warning("inference: stopping with unfinished items after %s seconds", timeout)
+        for dispatcher in dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*dispatchers, return_exceptions=True)
+        while not queue.empty():
+            _, future = queue.get_nowait()
+            _fail(future, RuntimeError("The inference executor was closed before the item was completed"))
+
+        if completed:
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+        else:
+            # a hung inference would keep its worker (and the shutdown of the pool) busy forever
+            for process in list((pool._processes or {}).values()):
+                process.terminate()
+            pool.shutdown(wait=False, cancel_futures=True)
+        return completed
+
+    @property
+    def queue_size(self) -> int:
+        """Number of waiting items"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item):
+        """Runs the inference for one item, batched with concurrently submitted items
+
+        Keyword arguments:
+        item -- input of the inference function (must be picklable)
+
+        Returns:
+        The result of the inference function for the item
+        """
+        if self._queue is None:
+            raise RuntimeError("The inference executor is not started")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _dispatch(self, pool, queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            try:
+                deadline = loop.time() + self.max_batch_delay
+                while len(batch) < self.max_batch_size:
+                    if not queue.empty():
+                        batch.append(queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                items = [item for item, _ in batch]
+                try:
+                    results = await loop.run_in_executor(pool, _infer_batch, self.infer, items)
+                except Exception as e:
+                    for _, future in batch:
+                        _fail(future, e)
+                else:
+                    for (_, future), result in zip(batch, results):
+                        if not future.done():
+                            future.set_result(result)
+                self.batches += 1
+            except asyncio.CancelledError:
+                # closed while the batch was collected or run
+                for _, future in batch:
+                    _fail(future, RuntimeError("The inference executor was closed before the item was completed"))
+                raise
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+
+def _fail(future, exception):
+    if not future.done():
+        future.set_exception(exception)
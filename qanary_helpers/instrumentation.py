@@ -0,0 +1,210 @@
+"""
+Instrumentation of the outbound calls of a component: SPARQL queries and updates, raw question text fetches and
+the registration at the admin server. Every call is reported as a CallRecord (duration, bytes sent and received,
+status and query template) to the registered instruments. By default a HistogramCollector keeps latency
+histograms and byte counters in memory, which export_prometheus renders in the Prometheus text format, e.g., for a
+/metrics route mounted by mount_metrics.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class CallRecord(NamedTuple):
+    """Measurement of one outbound call"""
+    operation: str  # "select", "update", "raw_text" or "registration"
+    target: str  # URL of the called endpoint
+    duration: float  # seconds
+    bytes_out: int
+    bytes_in: int
+    status: str  # HTTP status code, or the exception type if no response was received
+    template: Optional[str] = None  # name of the query template
+
+
+class CallMeasurement:
+    """Mutable state of a call in progress, the caller sets the status and the received bytes"""
+    __slots__ = ("bytes_in", "status")
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.status = None
+
+
+_instruments = []
+_instruments_lock = threading.Lock()
+
+
+def add_instrument(instrument):
+    """Registers a callable that receives a CallRecord for every outbound call"""
+    with _instruments_lock:
+        _instruments.append(instrument)
+
+
+def remove_instrument(instrument):
+    """Unregisters an instrument, unknown instruments are ignored"""
+    with _instruments_lock:
+        if instrument in _instruments:
+            _instruments.remove(instrument)
+
+
+@contextmanager
+def measure_call(operation: str, target: str, bytes_out: int = 0, template: Optional[str] = None):
+    """Measures an outbound call and reports it to the instruments
+
+    Keyword arguments:
+    operation (str) -- kind of call, e.g. "select"
+    target (str) -- URL of the called endpoint
+    bytes_out (int) -- size of the request body
+    template (str) -- name of the query template, if any
+    """
+    measurement = CallMeasurement()
+    start = time.perf_counter()
+    try:
+        yield measurement
+    except BaseException as e:
+        if measurement.status is None:
+            measurement.status = type(e).__name__
+        raise
+    finally:
+        if _instruments:
+            _report(CallRecord(operation, target, time.perf_counter() - start, bytes_out, measurement.bytes_in,
+                               str(measurement.status), template))
+
+
+def measure_query(operation: str, target: str, sparql_query):
+    """Measures the execution of a SPARQL query or update, see measure_call
+
+    Keyword arguments:
+    operation (str) -- "select" or "update"
+    target (str) -- URL of the triplestore endpoint
+    sparql_query -- the query, a PreparedQuery or str
+    """
+    template = getattr(sparql_query, "template", None)
+    return measure_call(operation, target, len(sparql_query.encode("utf-8")),
+                        template.name if template is not None else None)
+
+
+def _report(record: CallRecord):
+    for instrument in list(_instruments):
+        try:
+            instrument(record)
+        except Exception as e:
+            logging.warning("instrumentation: %r failed: %s", instrument, e)
+
+
+class HistogramCollector:
+    """
+    Collects latency histograms, call counts and byte counters per operation, query template and status
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Keyword arguments:
+        buckets -- upper bounds of the latency histogram buckets in seconds, ascending
+        """
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record: CallRecord):
+        key = (record.operation, record.template or "", record.status)
+        index = bisect.bisect_left(self.buckets, record.duration)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [count per bucket (the last one is +Inf), sum of durations, bytes out, bytes in]
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0]
+            series[0][index] += 1
+            series[1] += record.duration
+            series[2] += record.bytes_out
+            series[3] += record.bytes_in
+
+    def clear(self):
+        """Removes all collected measurements"""
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self) -> dict:
+        """Returns {(operation, template, status): {"count", "sum", "buckets", "bytes_out", "bytes_in"}}, the
+        bucket counts are cumulative as in Prometheus"""
+        with self._lock:
+            series = {key: (list(counts), total, bytes_out, bytes_in)
+                      for key, (counts, total, bytes_out, bytes_in) in self._series.items()}
+        snapshot = {}
+        for key, (counts, total, bytes_out, bytes_in) in series.items():
+            cumulative, running = [], 0
+            for bucket_count in counts:
+                running += bucket_count
+                cumulative.append(running)
+            snapshot[key] = {"count": running, "sum": total, "buckets": cumulative,
+                             "bytes_out": bytes_out, "bytes_in": bytes_in}
+        return snapshot
+
+
+_default_collector = HistogramCollector()
+add_instrument(_default_collector)
+
+
+def get_default_collector() -> HistogramCollector:
+    """Returns the collector registered by default"""
+    return _default_collector
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def export_prometheus(collector: HistogramCollector = None, prefix: str = "qanary_outbound") -> str:
+    """Renders the measurements of a collector in the Prometheus text exposition format
+
+    Keyword arguments:
+    collector (HistogramCollector) -- the collector, defaults to the default collector
+    prefix (str) -- prefix of the metric names
+    """
+    collector = collector or _default_collector
+    snapshot = sorted(collector.snapshot().items())
+    bounds = [repr(float(bound)) for bound in collector.buckets] + ["+Inf"]
+    lines = [
+        "# HELP {0}_call_duration_seconds Duration of outbound calls.".format(prefix),
+        "# TYPE {0}_call_duration_seconds histogram".format(prefix),
+    ]
+    labels = {}
+    for key, series in snapshot:
+        labels[key] = 'operation="{0}",template="{1}",status="{2}"'.format(*(_label_value(part) for part in key))
+        for bound, bucket_count in zip(bounds, series["buckets"]):
+            lines.append('{0}_call_duration_seconds_bucket{{{1},le="{2}"}} {3}'.format(
+                prefix, labels[key], bound, bucket_count))
+        lines.append("{0}_call_duration_seconds_sum{{{1}}} {2!r}".format(prefix, labels[key], series["sum"]))
+        lines.append("{0}_call_duration_seconds_count{{{1}}} {2}".format(prefix, labels[key], series["count"]))
+    for name, field, description in (("request_bytes", "bytes_out", "Bytes sent by outbound calls."),
+                                      ("response_bytes", "bytes_in", "Bytes received by outbound calls.")):
+        lines.append("# HELP {0}_{1}_total {2}".format(prefix, name, description))
+        lines.append("# TYPE {0}_{1}_total counter".format(prefix, name))
+        for key, series in snapshot:
+            lines.append("{0}_{1}_total{{{2}}} {3}".format(prefix, name, labels[key], series[field]))
+    return "\n".join(lines) + "\n"
+
+
+def mount_metrics(app, path: str = "/metrics", collector: HistogramCollector = None):
+    """Adds a route serving the measurements in the Prometheus text format to a FastAPI app
+
+    Keyword arguments:
+    app -- the FastAPI application
+    path (str) -- path of the route
+    collector (HistogramCollector) -- the collector, defaults to the default collector
+    """
+    try:
+        from fastapi.responses import Response
+    except ImportError as e:
+        raise ImportError("mount_metrics requires FastAPI: pip install qanary-helpers[component]") from e
+
+    def metrics():
+        return Response(export_prometheus(collector), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    app.add_api_route(path, metrics, methods=["GET"], include_in_schema=False)
@@ -1,21 +1,30 @@
-from qanary_helpers.qanary_queries import select_from_triplestore, get_text_question_from_uri
+from qanary_helpers.qanary_queries import select_from_triplestore, get_text_question_from_uri, get_text_questions_from_uris
+from qanary_helpers.annotations import QuestionLanguageAnnotation, QuestionTranslationAnnotation
+from qanary_helpers.query_templates import register_query
 import logging
+from dataclasses import dataclass
 
 
+@dataclass(frozen=True)
 class QuestionTextWithLanguage:
-    """Holds data of question texts in the triplestore that have an associated language, either through previous translation or language recognition."""
+    """Holds data of question texts in the triplestore that have an associated language, either through previous translation or language recognition.
 
-    def __init__(self, uri: str, text: str, lang: str):
-        """Inits QuestionTextWithLanguage with question URI, question text and question language.
+    Instances are immutable, compare by value and are hashable, e.g., to deduplicate them or to use them as cache keys.
 
-        Keyword arguments:
-        uri (str) -- URI of the question inside of the triplestore
-        text (str) -- Textual representation of the question
-        lang (str) -- Language of the question text
-        """
-        self.uri = uri
-        self.text = text
-        self.lang = lang
+    Keyword arguments:
+    uri (str) -- URI of the question inside of the triplestore
+    text (str) -- Textual representation of the question
+    lang (str) -- Language of the question text
+    """
+    __slots__ = ("uri", "text", "lang")
+
+    uri: str
+    text: str
+    lang: str
+
+    def __reduce__(self):
+        # frozen instances with __slots__ cannot be restored by the default pickle protocol
+        return QuestionTextWithLanguage, (self.uri, self.text, self.lang)
 
     def get_uri(self):
         return self.uri
@@ -26,45 +35,94 @@ class QuestionTextWithLanguage:
     def get_language(self):
         return self.lang
 
+    @classmethod
+    def from_bindings(cls, bindings: list, lang: str = None, uri_variable: str = "hasTarget",
+                      text_variable: str = "hasBody") -> list["QuestionTextWithLanguage"]:
+        """Creates one record per binding of a SELECT result.
+
+        Keyword arguments:
+        bindings (list) -- the bindings, i.e. results["results"]["bindings"]
+        lang (str) -- Language of all texts, None to take the language tag of each text
+        uri_variable (str) -- variable bound to the question URI
+        text_variable (str) -- variable bound to the question text
+
+        Returns:
+        list -- The QuestionTextWithLanguage objects in the order of the bindings
+        """
+        if lang is not None:
+            return [cls(binding[uri_variable]["value"], binding[text_variable]["value"], lang) for binding in bindings]
+        return [cls(binding[uri_variable]["value"], binding[text_variable]["value"],
+                    binding[text_variable].get("xml:lang", "")) for binding in bindings]
+
+    @classmethod
+    def from_text_results(cls, results: list, lang: str) -> list["QuestionTextWithLanguage"]:
+        """Creates one record per successfully fetched question text, see get_text_questions_from_uris.
+
+        Keyword arguments:
+        results (list) -- QuestionTextResult objects
+        lang (str) -- Language of all texts
+
+        Returns:
+        list -- The QuestionTextWithLanguage objects in the order of the results, failed fetches are left out
+        """
+        return [cls(result.uri, result.text, lang) for result in results if result.error is None]
+
 
-def get_texts_with_detected_language_in_triplestore(triplestore_endpoint: str, graph_uri: str, lang: str) -> list[QuestionTextWithLanguage]:
+def get_texts_with_detected_language_in_triplestore(triplestore_endpoint: str, graph_uri: str, lang: str, max_workers: int = None, text_predicate: str = None, errors: dict = None) -> list[QuestionTextWithLanguage]:
     """Retrieves question texts from the triplestore for which a specific language has been detected.
 
+    Only the question URIs (and texts) are selected, each question is returned once and its text is fetched
+    at most once.
+
     Keyword arguments:
     triplestore_endpoint (str) -- URL of the triplestore endpoint
     graph_uri (str) -- URI of the graph to query inside of the triplestore
     lang (str) -- Expected detected language
+    max_workers (int) -- if set, the question texts are fetched concurrently, questions whose text could not be
+                         fetched are logged at WARNING and left out
+    text_predicate (str) -- if the question texts are stored in the graph, the predicate linking a question to
+                            its text; they are then resolved by the same query instead of being fetched
+    errors (dict) -- if given, the exceptions of the failed fetches are stored in it by question URI
 
     Returns:
     list -- A list of appropriate QuestionTextWithLanguage objects with information from the triplestore.
     """
-    source_texts = list()
-    sparql_find_ld = """
-        PREFIX qa: <http://www.wdaqua.eu/qa#>
-        PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
-        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-
-        SELECT *
-        FROM <{graph}>
-        WHERE {{
-        ?annotationId a qa:AnnotationOfQuestionLanguage .
-        ?annotationId oa:hasTarget ?hasTarget ;
-          oa:hasBody ?hasBody ;
-          oa:annotatedBy ?annotatedBy ;
-          oa:annotatedAt ?annotatedAt .
-        FILTER(STR(?hasBody) = \"{lang}\")
-        }}
-    """.format(
-        graph = graph_uri,
-        lang=lang
-    )
+    sparql_find_ld = _detected_language_query(graph_uri, lang, text_predicate)
     results = select_from_triplestore(triplestore_endpoint, sparql_find_ld)
-    for result in results["results"]["bindings"]:
-        question_uri = result["hasTarget"]["value"]
-        question_text = get_text_question_from_uri(triplestore_endpoint=triplestore_endpoint, question_uri=question_uri)
-        source_texts.append(QuestionTextWithLanguage(uri=question_uri, text=question_text, lang=lang))
+    texts = _texts_by_question(results["results"]["bindings"])
+    _fetch_missing_texts(triplestore_endpoint, texts, max_workers, errors)
+
+    return [QuestionTextWithLanguage(uri=question_uri, text=question_text, lang=lang)
+            for question_uri, question_text in texts.items() if question_text is not None]
+
+
+def _fetch_missing_texts(triplestore_endpoint: str, texts: dict, max_workers: int = None, errors: dict = None):
+    """Fetches the texts of the questions in {question URI: text or None} that have no text yet"""
+    missing = [question_uri for question_uri, question_text in texts.items() if question_text is None]
+
+    if max_workers is None:
+        for question_uri in missing:
+            texts[question_uri] = get_text_question_from_uri(triplestore_endpoint=triplestore_endpoint, question_uri=question_uri)
+        return
+
+    for result in get_text_questions_from_uris(triplestore_endpoint, missing, max_workers):
+        if result.error is not None:
+            logging.warning("question %s is left out, its text could not be fetched: %s", result.uri, result.error)
+            if errors is not None:
+                errors[result.uri] = result.error
+        texts[result.uri] = result.text
 
-    return source_texts
+
+def _texts_by_question(bindings: list) -> dict:
+    """Returns {question URI: text or None} in the order of the bindings, each question once"""
+    texts = dict()
+    for binding in bindings:
+        question_uri = binding["hasTarget"]["value"]
+        if "text" in binding:
+            texts[question_uri] = binding["text"]["value"]
+        else:
+            texts.setdefault(question_uri, None)
+    return texts
 
 
 def get_translated_texts_in_triplestore(triplestore_endpoint: str, graph_uri: str, lang: str) -> list[QuestionTextWithLanguage]:
@@ -78,32 +136,228 @@ def get_translated_texts_in_triplestore(triplestore_endpoint: str, graph_uri: st
     Returns:
     list -- A list of appropriate QuestionTextWithLanguage objects with information from the triplestore.
     """
-    source_texts = list()
-    sparql_find_ld = """
+    sparql_find_ld = _translated_texts_query(graph_uri, lang)
+    results = select_from_triplestore(triplestore_endpoint, sparql_find_ld)
+    return QuestionTextWithLanguage.from_bindings(results["results"]["bindings"], lang)
+
+
+def get_texts_in_languages_in_triplestore(triplestore_endpoint: str, graph_uri: str, languages: set, max_workers: int = None, text_predicate: str = None, errors: dict = None) -> dict[str, list[QuestionTextWithLanguage]]:
+    """Retrieves the translated question texts and the question texts with a detected language for several
+    languages with one query.
+
+    The raw texts of questions with a detected language are fetched once, even if several languages were
+    detected for a question.
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    graph_uri (str) -- URI of the graph to query inside of the triplestore
+    languages (set) -- Languages of the requested texts
+    max_workers (int) -- if set, the question texts are fetched concurrently, questions whose text could not be
+                         fetched are logged at WARNING and left out
+    text_predicate (str) -- see get_texts_with_detected_language_in_triplestore
+    errors (dict) -- see get_texts_with_detected_language_in_triplestore
+
+    Returns:
+    dict -- {language: list of QuestionTextWithLanguage objects}, translations first, for every requested language
+    """
+    results = select_from_triplestore(triplestore_endpoint,
+                                      _texts_in_languages_query(graph_uri, languages, text_predicate))
+    texts_by_language, texts = _texts_by_language(results["results"]["bindings"], languages)
+    _fetch_missing_texts(triplestore_endpoint, texts, max_workers, errors)
+
+    return _resolve_texts_by_language(texts_by_language, texts)
+
+
+def _texts_by_language(bindings: list, languages) -> tuple:
+    """Splits the bindings of _texts_in_languages_query into {language: [(question URI, translation or None)]}
+    and {question URI: text or None} for the questions with a detected language"""
+    texts_by_language = {lang: [] for lang in languages}
+    texts = dict()
+    for binding in bindings:
+        questions = texts_by_language.setdefault(binding["lang"]["value"], [])
+        question_uri = binding["hasTarget"]["value"]
+        if "translation" in binding:
+            questions.append((question_uri, binding["translation"]["value"]))
+            continue
+        questions.append((question_uri, None))
+        if "text" in binding:
+            texts[question_uri] = binding["text"]["value"]
+        else:
+            texts.setdefault(question_uri, None)
+    return texts_by_language, texts
+
+
+def _resolve_texts_by_language(texts_by_language: dict, texts: dict) -> dict:
+    """Creates the QuestionTextWithLanguage objects, questions without text are left out"""
+    resolved = dict()
+    for lang, questions in texts_by_language.items():
+        translated = [QuestionTextWithLanguage(question_uri, translation, lang)
+                      for question_uri, translation in questions if translation is not None]
+        detected = [QuestionTextWithLanguage(question_uri, texts[question_uri], lang)
+                    for question_uri, translation in questions
+                    if translation is None and texts.get(question_uri) is not None]
+        resolved[lang] = translated + detected
+    return resolved
+
+
+def get_detected_languages_of_question(triplestore_endpoint: str, graph_uri: str, question_uri: str) -> list[str]:
+    """Retrieves the languages that have been detected for a question.
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    graph_uri (str) -- URI of the graph to query inside of the triplestore
+    question_uri (str) -- URI of the question inside of the triplestore
+
+    Returns:
+    list -- The detected languages (e.g., "en")
+    """
+    results = select_from_triplestore(triplestore_endpoint, _question_languages_query(graph_uri, question_uri))
+    return [result["hasBody"]["value"] for result in results["results"]["bindings"]]
+
+
+def get_translations_of_question(triplestore_endpoint: str, graph_uri: str, question_uri: str) -> list[QuestionTextWithLanguage]:
+    """Retrieves all translations of a question.
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    graph_uri (str) -- URI of the graph to query inside of the triplestore
+    question_uri (str) -- URI of the question inside of the triplestore
+
+    Returns:
+    list -- A list of QuestionTextWithLanguage objects, one per translation
+    """
+    results = select_from_triplestore(triplestore_endpoint, _question_translations_query(graph_uri, question_uri))
+    return [QuestionTextWithLanguage(question_uri, result["hasBody"]["value"], result["hasBody"].get("xml:lang", ""))
+            for result in results["results"]["bindings"]]
+
+
+_QUESTION_LANGUAGES = register_query("question_languages", """
+        PREFIX qa: <http://www.wdaqua.eu/qa#>
+        PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
+
+        SELECT DISTINCT ?hasBody
+        FROM {graph}
+        WHERE {{
+            ?annotationId a qa:AnnotationOfQuestionLanguage ;
+                          oa:hasTarget {question_uri} ;
+                          oa:hasBody ?hasBody .
+        }}
+    """, graph="iri", question_uri="iri")
+
+_QUESTION_TRANSLATIONS = register_query("question_translations", """
+        PREFIX qa: <http://www.wdaqua.eu/qa#>
+        PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
+
+        SELECT DISTINCT ?hasBody
+        FROM {graph}
+        WHERE {{
+            ?annotationId a qa:AnnotationOfQuestionTranslation ;
+                          oa:hasTarget {question_uri} ;
+                          oa:hasBody ?hasBody .
+        }}
+    """, graph="iri", question_uri="iri")
+
+_TEXTS_IN_LANGUAGES = """
+        PREFIX qa: <http://www.wdaqua.eu/qa#>
+        PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
+
+        SELECT DISTINCT ?lang ?hasTarget ?translation%(text_variable)s
+        FROM {graph}
+        WHERE {{
+            {{
+                ?annotationId a qa:AnnotationOfQuestionTranslation ;
+                              oa:hasTarget ?hasTarget ;
+                              oa:hasBody ?translation ;
+                              oa:annotatedBy ?annotatedBy ;
+                              oa:annotatedAt ?annotatedAt .
+                BIND(lang(?translation) AS ?lang)
+                FILTER(?lang IN ({languages}))
+            }}
+            UNION
+            {{
+                ?annotationId a qa:AnnotationOfQuestionLanguage ;
+                              oa:hasTarget ?hasTarget ;
+                              oa:hasBody ?hasBody .
+                BIND(STR(?hasBody) AS ?lang)
+                FILTER(?lang IN ({languages}))
+                %(text_pattern)s
+            }}
+        }}
+    """
+_TEXTS_IN_LANGUAGES_QUERIES = {
+    False: register_query("texts_in_languages", _TEXTS_IN_LANGUAGES % {"text_variable": "", "text_pattern": ""},
+                          graph="iri", languages="langs"),
+    True: register_query("texts_in_languages_with_text", _TEXTS_IN_LANGUAGES % {
+        "text_variable": " ?text", "text_pattern": "OPTIONAL {{ ?hasTarget {text_predicate} ?text }}"},
+        graph="iri", languages="langs", text_predicate="iri"),
+}
+
+_DETECTED_LANGUAGE = """
+        PREFIX qa: <http://www.wdaqua.eu/qa#>
+        PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
+
+        SELECT DISTINCT ?hasTarget%(text_variable)s
+        FROM {graph}
+        WHERE {{
+        ?annotationId a qa:AnnotationOfQuestionLanguage ;
+          oa:hasTarget ?hasTarget ;
+          oa:hasBody ?hasBody .
+        FILTER(STR(?hasBody) = {lang})
+        %(text_pattern)s
+        }}
+    """
+_DETECTED_LANGUAGE_QUERIES = {
+    False: register_query("detected_language", _DETECTED_LANGUAGE % {"text_variable": "", "text_pattern": ""},
+                          graph="iri", lang="lang"),
+    True: register_query("detected_language_with_text", _DETECTED_LANGUAGE % {
+        "text_variable": " ?text", "text_pattern": "OPTIONAL {{ ?hasTarget {text_predicate} ?text }}"},
+        graph="iri", lang="lang", text_predicate="iri"),
+}
+
+_TRANSLATED_TEXTS = register_query("translated_texts", """
         PREFIX qa: <http://www.wdaqua.eu/qa#>
         PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
 
         SELECT *
-        FROM <{graph}>
+        FROM {graph}
         WHERE {{
             ?annotationId a qa:AnnotationOfQuestionTranslation .
             ?annotationId oa:hasTarget ?hasTarget ;
                           oa:hasBody ?hasBody ;
                           oa:annotatedBy ?annotatedBy ;
                           oa:annotatedAt ?annotatedAt .
-            FILTER(lang(?hasBody) = \"{lang}\").
+            FILTER(lang(?hasBody) = {lang}).
         }}
-    """.format(
-        graph = graph_uri,
-        lang=lang
-    )
-    results = select_from_triplestore(triplestore_endpoint, sparql_find_ld)
-    for result in results["results"]["bindings"]:
-        question_uri = result["hasTarget"]["value"]
-        question_text = result["hasBody"]["value"]
-        source_texts.append(QuestionTextWithLanguage(question_uri, question_text, lang))
+    """, graph="iri", lang="lang")
+
+
+def _question_languages_query(graph: str, question_uri: str) -> str:
+    """Returns the SELECT query for the detected languages of one question"""
+    return _QUESTION_LANGUAGES.bind(graph=graph, question_uri=question_uri)
+
+
+def _question_translations_query(graph: str, question_uri: str) -> str:
+    """Returns the SELECT query for all translations of one question"""
+    return _QUESTION_TRANSLATIONS.bind(graph=graph, question_uri=question_uri)
 
-    return source_texts
+
+def _texts_in_languages_query(graph: str, languages, text_predicate: str = None) -> str:
+    """Returns the SELECT query for translations into and detected languages of several languages"""
+    if text_predicate:
+        return _TEXTS_IN_LANGUAGES_QUERIES[True].bind(graph=graph, languages=languages, text_predicate=text_predicate)
+    return _TEXTS_IN_LANGUAGES_QUERIES[False].bind(graph=graph, languages=languages)
+
+
+def _detected_language_query(graph: str, lang: str, text_predicate: str = None) -> str:
+    """Returns the SELECT query for the questions with a detected language (and their texts)"""
+    if text_predicate:
+        return _DETECTED_LANGUAGE_QUERIES[True].bind(graph=graph, lang=lang, text_predicate=text_predicate)
+    return _DETECTED_LANGUAGE_QUERIES[False].bind(graph=graph, lang=lang)
+
+
+def _translated_texts_query(graph: str, lang: str) -> str:
+    """Returns the SELECT query for annotations of question translations into a language"""
+    return _TRANSLATED_TEXTS.bind(graph=graph, lang=lang)
 
 
 def create_annotation_of_question_translation(graph_uri: str, question_uri: str, translation: str, translation_language: str, app_name: str) -> str:
@@ -119,33 +373,13 @@ def create_annotation_of_question_translation(graph_uri: str, question_uri: str,
     Returns:
     str -- The generated INSERT query
     """
-
-    SPARQLqueryAnnotationOfQuestionTranslation = """
-        PREFIX qa: <http://www.wdaqua.eu/qa#>
-        PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
-        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-
-        INSERT {{
-        GRAPH <{uuid}> {{
-            ?a a qa:AnnotationOfQuestionTranslation ;
-                oa:hasTarget <{qanary_question_uri}> ;
-                oa:hasBody "{translation_result}"@{target_lang} ;
-                oa:annotatedBy <urn:qanary:{app_name}> ;
-                oa:annotatedAt ?time .
-            }}
-        }}
-        WHERE {{
-            BIND (IRI(str(RAND())) AS ?a) .
-            BIND (now() as ?time)
-        }}
-    """.format(
-        uuid=graph_uri,
-        qanary_question_uri=question_uri,
-        translation_result=translation,
-        target_lang=translation_language,
+    SPARQLqueryAnnotationOfQuestionTranslation = QuestionTranslationAnnotation(
+        question_uri=question_uri,
+        translation=translation,
+        language=translation_language,
         app_name=app_name
-    )
-    logging.info(f'SPARQL: {SPARQLqueryAnnotationOfQuestionTranslation}')
+    ).to_insert_query(graph_uri)
+    logging.debug("SPARQL: %s", SPARQLqueryAnnotationOfQuestionTranslation)
     return SPARQLqueryAnnotationOfQuestionTranslation
 
 
@@ -161,31 +395,10 @@ def create_annotation_of_question_language(graph_uri: str, question_uri: str, la
     Returns:
     str -- The generated INSERT query
     """
-
-    SPARQLqueryAnnotationOfQuestionLanguage = """
-        PREFIX qa: <http://www.wdaqua.eu/qa#>
-        PREFIX oa: <http://www.w3.org/ns/openannotation/core/>
-        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-
-        INSERT {{
-        GRAPH <{uuid}> {{
-            ?b a qa:AnnotationOfQuestionLanguage ;
-                oa:hasTarget <{qanary_question_uri}> ;
-                oa:hasBody "{src_lang}"^^xsd:string ;
-                oa:annotatedBy <urn:qanary:{app_name}> ;
-                oa:annotatedAt ?time .
-            }}
-        }}
-        WHERE {{
-            BIND (IRI(str(RAND())) AS ?b) .
-            BIND (now() as ?time)
-        }}
-    """.format(
-        uuid=graph_uri,
-        qanary_question_uri=question_uri,
-        src_lang=language,
+    SPARQLqueryAnnotationOfQuestionLanguage = QuestionLanguageAnnotation(
+        question_uri=question_uri,
+        language=language,
         app_name=app_name
-    )
-
-    logging.info(f'SPARQL: {SPARQLqueryAnnotationOfQuestionLanguage}')
+    ).to_insert_query(graph_uri)
+    logging.debug("SPARQL: %s", SPARQLqueryAnnotationOfQuestionLanguage)
     return SPARQLqueryAnnotationOfQuestionLanguage
@@ -1,2 +1,3 @@
-from .component_logging import MLFlowLogger, QanaryComponentLogger
+from .component_logging import AsyncMLFlowLogger, MLFlowLogger, QanaryComponentLogger
+from .queued_logging import QueuedLogger
 from .config import mlflow_host, mlflow_port, mlflow_port_artifact, ssl, sftp
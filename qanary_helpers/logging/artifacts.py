@@ -0,0 +1,77 @@
+import gzip
+import hashlib
+import os
+from typing import IO, Iterable, Tuple, Union
+
+ArtifactData = Union[str, bytes, bytearray, memoryview, IO, Iterable[Union[str, bytes]]]
+
+CHUNK_SIZE = 1024 * 1024
+
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def iter_chunks(data: ArtifactData, chunk_size: int = CHUNK_SIZE) -> Iterable[bytes]:
+    """
+    Yields the data as chunks of bytes without copying it as a whole, strings are encoded as UTF-8
+
+    :param data: string, bytes, binary or text file object, or iterable of strings or bytes
+    :param chunk_size: maximum size of the chunks read from strings, bytes and file objects
+    """
+    if isinstance(data, str):
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size].encode('utf-8')
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        view = memoryview(data)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+    elif hasattr(data, 'read'):
+        while True:
+            chunk = data.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+    else:
+        for chunk in data:
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def _compressor(file: IO, compression: str):
+    if compression == 'gzip':
+        # without name and mtime, the same content is always compressed to the same bytes
+        return gzip.GzipFile(filename='', fileobj=file, mode='wb', mtime=0)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("zstd compression requires the zstandard package: pip install zstandard") from e
+        return zstandard.ZstdCompressor().stream_writer(file, closefd=False)
+    raise ValueError(f"Unknown compression {compression!r}, use None, 'gzip' or 'zstd'")
+
+
+def spool_artifact(data: ArtifactData, directory: str, file_name: str, compression: str = None) -> Tuple[str, str]:
+    """
+    Writes the data to a file in one pass, compressing it and computing the SHA-256 hash of the uncompressed content
+
+    :param data: string, bytes, file object or iterable of strings or bytes
+    :param directory: directory of the file
+    :param file_name: name of the file, the suffix of the compression is appended
+    :param compression: None, 'gzip' or 'zstd'
+    :return: path of the file and hex digest of the content
+    """
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression {compression!r}, use None, 'gzip' or 'zstd'")
+
+    path = os.path.join(directory, file_name + COMPRESSION_SUFFIXES[compression])
+    digest = hashlib.sha256()
+
+    with open(path, 'wb') as file:
+        writer = _compressor(file, compression) if compression else file
+        try:
+            for chunk in iter_chunks(data):
+                digest.update(chunk)
+                writer.write(chunk)
+        finally:
+            if writer is not file:
+                writer.close()
+
+    return path, digest.hexdigest()
@@ -1,15 +1,57 @@
 import os
+import asyncio
+import json
+import threading
+import time as time_module
 import mlflow
+from mlflow import MlflowClient
+from mlflow.entities import Metric, Param, RunTag
+from mlflow.exceptions import MlflowException
 from .config import mlflow_uri, test_params, sftp, mlflow_host, mlflow_port_artifact, test_dicts
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import Any, Dict, List, Union
-from uuid import uuid4
-from shutil import rmtree
+from tempfile import TemporaryDirectory
+from .artifacts import ArtifactData, spool_artifact
 from .get_ssh_key import load_ssh_host_key
 import logging
 
 logging.getLogger("paramiko").setLevel(logging.WARNING)
 
+TRAINING_EXPERIMENT = 'AutoML Model Training'
+TESTING_EXPERIMENT = 'AutoML Model Testing'
+ANNOTATION_EXPERIMENT = 'AutoML Component Annotations'
+
+# limits of one MlflowClient.log_batch request
+MAX_PARAMS_PER_BATCH = 100
+MAX_TAGS_PER_BATCH = 100
+MAX_METRICS_PER_BATCH = 1000
+
+
+def log_batch(client: MlflowClient, run_id: str, params: Dict[str, Any] = None, metrics: Dict[str, float] = None,
+              tags: Dict[str, Any] = None):
+    """
+    Logs params, metrics and tags of a run with as few requests as the limits of the MLflow batch API allow
+
+    :param client: MLflow client
+    :param run_id: ID of the run
+    :param params: dictionary of [param_name, value] pairs
+    :param metrics: dictionary of [metric_name, value] pairs
+    :param tags: dictionary of [tag_name, value] pairs
+    """
+    timestamp = int(time_module.time() * 1000)
+    params = [Param(key, str(value)) for key, value in (params or {}).items()]
+    metrics = [Metric(key, float(value), timestamp, 0) for key, value in (metrics or {}).items()]
+    tags = [RunTag(key, str(value)) for key, value in (tags or {}).items()]
+
+    while params or metrics or tags:
+        client.log_batch(run_id, metrics=metrics[:MAX_METRICS_PER_BATCH], params=params[:MAX_PARAMS_PER_BATCH],
+                         tags=tags[:MAX_TAGS_PER_BATCH])
+        params = params[MAX_PARAMS_PER_BATCH:]
+        metrics = metrics[MAX_METRICS_PER_BATCH:]
+        tags = tags[MAX_TAGS_PER_BATCH:]
+
 
 class QanaryComponentLogger(ABC):
     """
@@ -39,7 +81,7 @@ class QanaryComponentLogger(ABC):
     @abstractmethod
     def log_test_results(self, questions: List[Dict[str, Union[str, float]]]) -> Any:
         """
-        Logging test results for all test questions. Each question dictionary requires the keys
+        Logging test results for all test questions of a test run. Each question dictionary requires the keys
         "input", "true_target", "predicted_target", "model_uuid" and "runtime"
 
         :param questions: list of parameters that have to be logged for each question
@@ -63,7 +105,8 @@ class MLFlowLogger(QanaryComponentLogger):
     """
     Class providing a Logging service for Qanary components with MLFlow
     """
-    def __init__(self, uri=mlflow_uri, use_sftp=sftp, ssh_host=mlflow_host, ssh_port=mlflow_port_artifact):
+    def __init__(self, uri=mlflow_uri, use_sftp=sftp, ssh_host=mlflow_host, ssh_port=mlflow_port_artifact,
+                 dataset_compression=None, deduplicate_datasets=False):
         """
         Initializes a Logger for Qanary components with MLFlow. Default setup connects to http://localhost:5000 with
         local artifact storage.
@@ -72,80 +115,192 @@ class MLFlowLogger(QanaryComponentLogger):
         :param use_sftp: True, if MLFlow uses SFTP artifact storage, else False
         :param ssh_host: SFTP hostname
         :param ssh_port: SSH port of SFTP storage host
+        :param dataset_compression: compression of the logged datasets, None, 'gzip' or 'zstd' (requires zstandard)
+        :param deduplicate_datasets: True, if datasets already uploaded by an earlier training run should not be
+                                     uploaded again (the run then refers to the earlier artifact, see artifact_uri)
         """
         mlflow.set_tracking_uri(uri)
+        self.client = MlflowClient(uri)
+        self.dataset_compression = dataset_compression
+        self.deduplicate_datasets = deduplicate_datasets
+        # experiment name -> ID, resolved on first use
+        self._experiment_ids = {}
+        self._experiment_lock = threading.Lock()
 
         if use_sftp:
             load_ssh_host_key(ssh_host, ssh_port)
 
-    def log_train_results(self, model_uuid: str, train_data: str, test_data: str, hyperparameters: Dict[str, Any],
-                          config: Dict[str, Any], metrics: Dict[str, float], component_name: str, component_type: str,
-                          hardware: str, model: str, time: float) -> Any:
-        mlflow.set_experiment('AutoML Model Training')
-
-        temp_path = str(uuid4())
-        os.mkdir(temp_path)
+    def experiment_id(self, name: str) -> str:
+        """
+        Returns the ID of an experiment, which is created if it does not exist. The ID is resolved once per logger.
 
-        datasets = []
+        :param name: name of the experiment
+        :return: ID of the experiment
+        """
+        experiment_id = self._experiment_ids.get(name)
+        if experiment_id is not None:
+            return experiment_id
+
+        with self._experiment_lock:
+            if name not in self._experiment_ids:
+                experiment = self.client.get_experiment_by_name(name)
+                if experiment is None:
+                    try:
+                        self._experiment_ids[name] = self.client.create_experiment(name)
+                    except MlflowException:
+                        # created concurrently by another process
+                        self._experiment_ids[name] = self.client.get_experiment_by_name(name).experiment_id
+                else:
+                    self._experiment_ids[name] = experiment.experiment_id
+            return self._experiment_ids[name]
+
+    def log_artifact_data(self, run_id: str, data: ArtifactData, artifact_path: str, compression: str = None,
+                          deduplicate: bool = False) -> str:
+        """
+        Logs data as artifact of a run without writing it to the working directory. The data is spooled to a
+        temporary file in one pass (MLflow uploads artifacts from files), compressed and hashed on the way.
+        The SHA-256 hash of the content is stored in the tag "artifact_sha256.<artifact_path>" of the run.
+
+        :param run_id: ID of the run
+        :param data: string, bytes, file object or iterable of strings or bytes
+        :param artifact_path: path of the artifact in the run, e.g. "datasets/dataset_train.txt", the suffix of the
+                              compression is appended
+        :param compression: None, 'gzip' or 'zstd' (requires the zstandard package)
+        :param deduplicate: True, if the artifact should not be uploaded again if a run of the same experiment
+                            already has an artifact with this path and content. The run is then tagged with the URI
+                            of the existing artifact ("artifact_uri.<artifact_path>").
+        :return: URI of the artifact
+        """
+        directory, file_name = os.path.split(artifact_path)
+
+        with TemporaryDirectory() as temp_path:
+            path, digest = spool_artifact(data, temp_path, file_name, compression)
+            artifact_path = os.path.join(directory, os.path.basename(path)) if directory else os.path.basename(path)
+
+            artifact_uri = self._find_artifact(run_id, artifact_path, digest) if deduplicate else None
+            if artifact_uri is None:
+                self.client.log_artifact(run_id, path, directory or None)
+                artifact_uri = f'runs:/{run_id}/{artifact_path}'
+                tags = {f'artifact_sha256.{artifact_path}': digest}
+            else:
+                tags = {f'artifact_sha256.{artifact_path}': digest, f'artifact_uri.{artifact_path}': artifact_uri}
+
+        log_batch(self.client, run_id, tags=tags)
+        return artifact_uri
+
+    def _find_artifact(self, run_id: str, artifact_path: str, digest: str) -> Union[str, None]:
+        experiment_id = self.client.get_run(run_id).info.experiment_id
+        runs = self.client.search_runs([experiment_id],
+                                       filter_string=f"tags.`artifact_sha256.{artifact_path}` = '{digest}'",
+                                       max_results=1, order_by=['attributes.start_time ASC'])
+        if not runs:
+            return None
+        # the artifact of the first run, which uploaded it
+        return runs[0].data.tags.get(f'artifact_uri.{artifact_path}', f'runs:/{runs[0].info.run_id}/{artifact_path}')
+
+    def artifact_uri(self, run_id: str, artifact_path: str) -> str:
+        """
+        Returns the URI of an artifact of a run, resolving artifacts deduplicated by log_artifact_data
 
-        for dataset, suffix in zip([train_data, test_data], ['train', 'test']):
-            temp_dataset = f'{temp_path}/dataset_{suffix}.txt'
+        :param run_id: ID of the run
+        :param artifact_path: path of the artifact in the run
+        :return: URI of the artifact, e.g. "runs:/<run_id>/datasets/dataset_train.txt"
+        """
+        tags = self.client.get_run(run_id).data.tags
+        return tags.get(f'artifact_uri.{artifact_path}', f'runs:/{run_id}/{artifact_path}')
 
-            # store dataset to filesystem
-            with open(temp_dataset, 'w') as f:
-                f.write(dataset)
+    @contextmanager
+    def start_run(self, experiment_name: str):
+        """
+        Creates a run with the MLflow client and terminates it on exit (as FAILED on exceptions). The run is passed
+        by ID, so concurrent runs do not share the active run state of the mlflow module.
 
-                datasets.append(temp_dataset)
+        :param experiment_name: name of the experiment of the run
+        :return: ID of the run
+        """
+        run_id = self.client.create_run(self.experiment_id(experiment_name)).info.run_id
+        try:
+            yield run_id
+        except BaseException:
+            self.client.set_terminated(run_id, 'FAILED')
+            raise
+        self.client.set_terminated(run_id, 'FINISHED')
 
-        with mlflow.start_run() as run:
+    def log_train_results(self, model_uuid: str, train_data: str, test_data: str, hyperparameters: Dict[str, Any],
+                          config: Dict[str, Any], metrics: Dict[str, float], component_name: str, component_type: str,
+                          hardware: str, model: str, time: float) -> Any:
+        with self.start_run(TRAINING_EXPERIMENT) as run_id:
             # Log train parameters and model results
-            try:
-                mlflow.log_param('model_uuid', model_uuid)
+            for dataset, suffix in zip([train_data, test_data], ['train', 'test']):
+                self.log_artifact_data(run_id, dataset, f'datasets/dataset_{suffix}.txt',
+                                       compression=self.dataset_compression, deduplicate=self.deduplicate_datasets)
 
-                for dataset in datasets:
-                    mlflow.log_artifact(dataset, 'datasets')
+            self.client.log_dict(run_id, metrics, 'model_metrics.json')
+            self.client.log_dict(run_id, config, 'config.json')
 
-                for parameter in hyperparameters:
-                    mlflow.log_param(parameter, hyperparameters[parameter])
+            # all params and the numeric metrics with one request
+            params = {'model_uuid': model_uuid, **hyperparameters, 'component_name': component_name,
+                      'component_type': component_type, 'hardware': hardware, 'model': model, 'time': time}
+            numeric_metrics = {name: value for name, value in metrics.items()
+                               if isinstance(value, (int, float)) and not isinstance(value, bool)}
+            log_batch(self.client, run_id, params=params, metrics=numeric_metrics)
 
-                mlflow.log_dict(metrics, 'model_metrics.json')
-                mlflow.log_dict(config, 'config.json')
-                mlflow.log_param('component_name', component_name)
-                mlflow.log_param('component_type', component_type)
-                mlflow.log_param('hardware', hardware)
-                mlflow.log_param('model', model)
-                mlflow.log_param('time', time)
-            # delete temp dataset file
-            finally:
-                rmtree(temp_path)
-
-            return run.info.run_id
+            return run_id
 
     def log_test_results(self, questions: List[Dict[str, Any]]) -> Any:
-        mlflow.set_experiment('AutoML Model Testing')
+        with self.start_run(TESTING_EXPERIMENT) as run_id:
+            # one JSON line per question instead of one run per question
+            records = '\n'.join(json.dumps({key: question[key] for key in test_params + test_dicts})
+                                for question in questions)
+            self.client.log_text(run_id, records + '\n', 'test_results.jsonl')
+
+            runtimes = [float(question['runtime']) for question in questions]
+            log_batch(self.client, run_id,
+                      params={'model_uuid': ','.join(sorted({question['model_uuid'] for question in questions}))},
+                      metrics={'questions': len(questions),
+                               'mean_runtime': sum(runtimes) / len(runtimes) if runtimes else 0.0})
 
-        run_ids = []
+            return run_id
 
-        for question in questions:
-            with mlflow.start_run() as run:
-                # log all provided data as parameters
-                for test_param in test_params:
-                    mlflow.log_param(test_param, question[test_param])
+    def log_annotation(self, model_uuid: str, question: str, predicted_target: str, qanary_graph_id: str) -> Any:
+        with self.start_run(ANNOTATION_EXPERIMENT) as run_id:
+            log_batch(self.client, run_id, params={'model_uuid': model_uuid, 'input': question,
+                                                   'predicted_target': predicted_target,
+                                                   'qanary_graph_id': qanary_graph_id})
+
+            return run_id
 
-                for test_dict in test_dicts:
-                    mlflow.log_dict(question[test_dict], f'{test_dict}.json')
 
-                run_ids.append(run.info.run_id)
+class AsyncMLFlowLogger:
+    """
+    Class providing the logging methods of a MLFlowLogger as coroutines for components running in an event loop.
+    The requests to MLflow run in a thread pool, so many annotations are logged in parallel.
+    """
+    def __init__(self, logger: MLFlowLogger = None, max_workers: int = 8):
+        """
+        :param logger: the MLFlowLogger, defaults to MLFlowLogger()
+        :param max_workers: maximum number of runs logged in parallel
+        """
+        self.logger = logger if logger is not None else MLFlowLogger()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='AsyncMLFlowLogger')
+
+    async def _run(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
 
-        return run_ids
+    async def log_train_results(self, model_uuid: str, train_data: str, test_data: str,
+                                hyperparameters: Dict[str, Any], config: Dict[str, Any], metrics: Dict[str, float],
+                                component_name: str, component_type: str, hardware: str, model: str,
+                                time: float) -> str:
+        return await self._run(self.logger.log_train_results, model_uuid, train_data, test_data, hyperparameters,
+                               config, metrics, component_name, component_type, hardware, model, time)
 
-    def log_annotation(self, model_uuid: str, question: str, predicted_target: str, qanary_graph_id: str) -> Any:
-        mlflow.set_experiment('AutoML Component Annotations')
+    async def log_test_results(self, questions: List[Dict[str, Any]]) -> str:
+        return await self._run(self.logger.log_test_results, questions)
 
-        with mlflow.start_run() as run:
-            mlflow.log_param('model_uuid', model_uuid)
-            mlflow.log_param('input', question)
-            mlflow.log_param('predicted_target', predicted_target)
-            mlflow.log_param('qanary_graph_id', qanary_graph_id)
+    async def log_annotation(self, model_uuid: str, question: str, predicted_target: str,
+                             qanary_graph_id: str) -> str:
+        return await self._run(self.logger.log_annotation, model_uuid, question, predicted_target, qanary_graph_id)
 
-            return run.info.run_id
+    def close(self):
+        """Waits for the running requests and stops the thread pool"""
+        self._executor.shutdown(wait=True)
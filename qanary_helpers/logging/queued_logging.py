@@ -0,0 +1,167 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Union
+
+from .component_logging import QanaryComponentLogger
+
+DROP = 'drop'
+BLOCK = 'block'
+
+
+class QueuedLogger(QanaryComponentLogger):
+    """
+    Class wrapping a QanaryComponentLogger, so logging does not block the request path: the records are queued in
+    memory and logged by a background thread. The logging methods return a concurrent.futures.Future of the
+    identifier returned by the wrapped logger.
+    """
+    def __init__(self, logger: QanaryComponentLogger, max_queue_size: int = 10000, policy: str = DROP,
+                 block_timeout: float = None, flush_on_exit: bool = True):
+        """
+        Initializes a queued logger and starts its background thread
+
+        :param logger: the logger that logs the records, e.g., a MLFlowLogger
+        :param max_queue_size: maximum number of waiting records
+        :param policy: DROP ('drop') to drop records when the queue is full, BLOCK ('block') to wait for a free
+                       place (for at most block_timeout seconds). Do not block in an event loop.
+        :param block_timeout: seconds to wait for a free place with the BLOCK policy, None to wait forever
+        :param flush_on_exit: True, if the waiting records should be logged when the interpreter exits
+        """
+        if policy not in (DROP, BLOCK):
+            raise ValueError(f"Unknown queue policy {policy!r}, use {DROP!r} or {BLOCK!r}")
+
+        self.logger = logger
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.enqueued = 0
+        self.logged = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._worker = threading.Thread(target=self._drain, name='QueuedLogger', daemon=True)
+        self._worker.start()
+
+        if flush_on_exit:
+            atexit.register(self.close)
+
+    def log_train_results(self, model_uuid: str, train_data: str, test_data: str, hyperparameters: Dict[str, Any],
+                          config: Dict[str, Any], metrics: Dict[str, float], component_name: str, component_type: str,
+                          hardware: str, model: str, time: float) -> Future:
+        return self._enqueue('log_train_results', model_uuid, train_data, test_data, hyperparameters, config,
+                             metrics, component_name, component_type, hardware, model, time)
+
+    def log_test_results(self, questions: List[Dict[str, Union[str, float]]]) -> Future:
+        return self._enqueue('log_test_results', questions)
+
+    def log_annotation(self, model_uuid: str, question: str, predicted_target: str, qanary_graph_id: str) -> Future:
+        return self._enqueue('log_annotation', model_uuid, question, predicted_target, qanary_graph_id)
+
+    @property
+    def queue_size(self) -> int:
+        """Number of waiting records"""
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the counters of the logger"""
+        return {'enqueued': self.enqueued, 'logged': self.logged, 'dropped': self.dropped, 'failed': self.failed,
+                'waiting': self.queue_size}
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until all queued records are logged
+
+        :param timeout: maximum seconds to wait, None to wait forever
+        :return: True, if all records are logged, else False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = None) -> bool:
+        """
+        Logs the queued records and stops the background thread, further records are dropped
+
+        :param timeout: maximum seconds to wait for the queued records, None to wait forever
+        :return: True, if all records are logged, else False
+        """
+        with self._lock:
+            if self._closed:
+                return True
+            self._closed = True
+        flushed = self.flush(timeout)
+        # no record is queued after _closed is set, so the worker stops after the queued records
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        # records waiting for a free place with the BLOCK policy are dropped
+        with self._lock:
+            self._not_full.notify_all()
+        self._worker.join(timeout)
+        atexit.unregister(self.close)
+        return flushed
+
+    def _enqueue(self, method: str, *args) -> Future:
+        future = Future()
+        deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+        # the record is queued under the lock, so close() cannot enqueue its sentinel before it
+        with self._lock:
+            while True:
+                if self._closed:
+                    exception = RuntimeError('The logger is closed')
+                    break
+                try:
+                    self._queue.put_nowait((method, args, future))
+                except queue.Full as e:
+                    exception = e
+                else:
+                    self.enqueued += 1
+                    return future
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if self.policy != BLOCK or (remaining is not None and remaining <= 0):
+                    break
+                # releases the lock while waiting for a free place
+                self._not_full.wait(remaining)
+        self._drop(future, method, exception)
+        return future
+
+    def _drop(self, future: Future, method: str, exception: Exception):
+        with self._lock:
+            self.dropped += 1
+        logging.debug('QueuedLogger: dropped %s record (%s)', method, type(exception).__name__)
+        future.set_exception(exception)
+
+    def _drain(self):
+        while True:
+            record = self._queue.get()
+            with self._lock:
+                self._not_full.notify()
+            try:
+                if record is None:
+                    return
+                method, args, future = record
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = getattr(self.logger, method)(*args)
+                except Exception as e:
+                    self.failed += 1
+                    logging.warning('QueuedLogger: %s failed: %s', method, e)
+                    future.set_exception(e)
+                else:
+                    self.logged += 1
+                    future.set_result(result)
+            finally:
+                self._queue.task_done()
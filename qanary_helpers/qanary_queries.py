@@ -1,8 +1,18 @@
 import logging
-from SPARQLWrapper import SPARQLWrapper, JSON
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
 from urllib.parse import urlparse
-import re
+from qanary_helpers.query_templates import register_query
+from qanary_helpers.results import SPARQL_RESULTS_TSV, decode_select_results, iter_tsv_rows, split_lines
+from qanary_helpers.text_cache import get_question_text_cache
+from qanary_helpers.triplestore import get_triplestore_client
+
+
+class QuestionTextResult(NamedTuple):
+    """Result of fetching one question text in bulk, either text or error is set"""
+    uri: str
+    text: Optional[str]
+    error: Optional[Exception] = None
 
 
 def get_text_question_from_uri(triplestore_endpoint: str, question_uri: str) -> str:
@@ -15,48 +25,131 @@ def get_text_question_from_uri(triplestore_endpoint: str, question_uri: str) ->
     Returns:
     str -- The question text
 
+    Raises:
+    requests.HTTPError -- if the question text could not be retrieved
     """
+    cache = get_question_text_cache()
+    if cache is not None:
+        question_text = cache.get(question_uri)
+        if question_text is not None:
+            return question_text
+
+    url = _raw_question_url(triplestore_endpoint, question_uri)
+    # error pages raise and are therefore never cached as question texts
+    question_text = get_triplestore_client(triplestore_endpoint).fetch_text(url)
+    if cache is not None:
+        cache.put(question_uri, question_text)
+    return question_text
+
+
+def _raw_question_url(triplestore_endpoint: str, question_uri: str) -> str:
+    """Returns the URL of the raw question text, reachable at the host of the triplestore endpoint"""
     question_raw = question_uri + "/raw"
-    logging.info("found: questionURI={0}  questionURIraw={1}".format(
-        question_uri,
-        question_raw
-    ))
+    logging.debug("found: questionURI=%s  questionURIraw=%s", question_uri, question_raw)
     hostname = urlparse(triplestore_endpoint).hostname
     if hostname is None:
         raise ValueError("No valid host name could be extracted from the supplied triplestore_endpoint: {0}"
                          .format(triplestore_endpoint))
-    question_text = requests.get(question_raw.replace("localhost", hostname))
-    return question_text.text
+    return question_raw.replace("localhost", hostname)
+
 
+def get_text_questions_from_uris(triplestore_endpoint: str, question_uris: list, max_workers: int = 8) -> list:
+    """Retrieves the textual representations of many questions concurrently
+
+    The texts are fetched by a bounded pool of worker threads through the pooled session of the triplestore
+    client, texts in the question text cache are not fetched again. A failing fetch does not fail the whole
+    batch, its error is reported in the corresponding result.
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint
+    question_uris (list) -- URIs of the questions
+    max_workers (int) -- maximum number of concurrent fetches
 
-def get_text_question_in_graph(triplestore_endpoint, graph):
+    Returns:
+    list -- QuestionTextResult objects in the order of question_uris
+    """
+    client = get_triplestore_client(triplestore_endpoint)
+    cache = get_question_text_cache()
+
+    def fetch(question_uri):
+        if cache is not None:
+            question_text = cache.get(question_uri)
+            if question_text is not None:
+                return QuestionTextResult(question_uri, question_text)
+        try:
+            question_text = client.fetch_text(_raw_question_url(triplestore_endpoint, question_uri))
+        except Exception as e:
+            logging.warning("fetching the text of question %s failed: %s", question_uri, e)
+            return QuestionTextResult(question_uri, None, e)
+        if cache is not None:
+            cache.put(question_uri, question_text)
+        return QuestionTextResult(question_uri, question_text)
+
+    if len(question_uris) <= 1:
+        return [fetch(question_uri) for question_uri in question_uris]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(question_uris))) as executor:
+        return list(executor.map(fetch, question_uris))
+
+
+def get_text_question_in_graph(triplestore_endpoint, graph, max_workers=None):
     """
     Retrieves the questions from the triplestore returns an array
 
     Keyword arguments:
     triplestore_endpoint -- URL of the triplestore endpoint
     graph -- URI of the graph to query inside of the triplestore
+    max_workers -- if set, the question texts are fetched concurrently by get_text_questions_from_uris
+                   and every question gets an "error" entry (None, or the exception if its text could not be fetched)
     """
     questions = list()
-    query = """
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        SELECT DISTINCT ?questionURI
-        FROM <{uri}>
-        WHERE {{
-            ?questionURI rdf:type <http://www.wdaqua.eu/qa#Question> .
-        }}
-    """.format(uri=graph)
+    results = select_from_triplestore(triplestore_endpoint, _question_uris_query(graph))
+    if max_workers is not None:
+        question_uris = [result['questionURI']['value'] for result in results["results"]["bindings"]]
+        for result in get_text_questions_from_uris(triplestore_endpoint, question_uris, max_workers):
+            questions.append({"uri": result.uri, "text": result.text, "error": result.error})
+        return questions
 
-    results = select_from_triplestore(triplestore_endpoint, query)
     for result in results["results"]["bindings"]:
         question_uri = result['questionURI']['value']
         question_text = get_text_question_from_uri(triplestore_endpoint, question_uri)
-        logging.info("found question: \"{0}\"".format(question_text))
+        logging.info("found question: \"%s\"", question_text)
         questions.append({"uri": question_uri, "text": question_text})
 
     return questions
 
 
+_QUESTION_URIS = register_query("question_uris", """
+        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+        SELECT DISTINCT ?questionURI
+        FROM {graph}
+        WHERE {{
+            ?questionURI rdf:type <http://www.wdaqua.eu/qa#Question> .
+        }}
+    """, graph="iri")
+
+
+_QUESTION_URIS_IN_GRAPHS = register_query("question_uris_in_graphs", """
+        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+        SELECT DISTINCT ?graph ?questionURI
+        WHERE {{
+            VALUES ?graph {{ {graphs} }}
+            GRAPH ?graph {{
+                ?questionURI rdf:type <http://www.wdaqua.eu/qa#Question> .
+            }}
+        }}
+    """, graphs="iris")
+
+
+def _question_uris_query(graph):
+    """Returns the SELECT query for the URIs of all questions in a graph"""
+    return _QUESTION_URIS.bind(graph=graph)
+
+
+def _question_uris_in_graphs_query(graphs):
+    """Returns the SELECT query for the URIs of the questions in several graphs"""
+    return _QUESTION_URIS_IN_GRAPHS.bind(graphs=graphs)
+
+
 def select_from_triplestore(triplestore_endpoint, sparql_query):
     """
     Executes SELECT query on triplestore and returns the result object
@@ -69,6 +162,32 @@ def select_from_triplestore(triplestore_endpoint, sparql_query):
     return query_triplestore(triplestore_endpoint+"/query", sparql_query)
 
 
+def select_rows_from_triplestore(triplestore_endpoint, sparql_query):
+    """
+    Executes SELECT query on triplestore and returns the results as list of rows, see qanary_helpers.results
+
+    Keyword arguments:
+    triplestore_endpoint -- URL of the triplestore endpoint
+    sparql_query -- a query to execute on the endpoint
+    """
+    return decode_select_results(select_from_triplestore(triplestore_endpoint, sparql_query))
+
+
+def iter_select_from_triplestore(triplestore_endpoint, sparql_query, encoding="utf-8"):
+    """
+    Executes SELECT query on triplestore and yields the result rows while the response is received, so large
+    results are never held in memory (requests the SPARQL TSV results format, see qanary_helpers.results)
+
+    Keyword arguments:
+    triplestore_endpoint -- URL of the triplestore endpoint
+    sparql_query -- a query to execute on the endpoint
+    encoding -- character encoding of the response
+    """
+    client = get_triplestore_client(triplestore_endpoint + "/query")
+    with client.stream_query(sparql_query, SPARQL_RESULTS_TSV) as response:
+        yield from iter_tsv_rows(split_lines(response.iter_content(chunk_size=65536), encoding))
+
+
 def insert_into_triplestore(triplestore_endpoint, sparql_query):
     """
     Executes INSERT query on triplestore and returns the result object
@@ -89,32 +208,4 @@ def query_triplestore(triplestore_endpoint, sparql_query):
     triplestore_endpoint -- URL of the triplestore endpoint
     sparql_query -- a query to execute on the endpoint
     """
-    triplestore_endpoint_parsed = urlparse(triplestore_endpoint)
-    triplestore_endpoint_parsed_split = re.split(
-        r"^(\w+):(\w+)@(.*)$", triplestore_endpoint_parsed.netloc)
-    if len(triplestore_endpoint_parsed_split) > 1:
-        # qanary v2 and lower
-        username = triplestore_endpoint_parsed_split[1]
-        password = triplestore_endpoint_parsed_split[2]
-        triplestore_endpoint_new = triplestore_endpoint_parsed.scheme + "://" + triplestore_endpoint_parsed_split[3] + \
-            triplestore_endpoint_parsed.path
-        sparql = SPARQLWrapper(triplestore_endpoint_new)
-        sparql.setCredentials(username, password)
-        logging.info("found: endpoint=%s,  username=%s,  password=%s" %
-                     (triplestore_endpoint_new, username, password))
-    else:
-        # qanary v3
-        triplestore_endpoint_new = re.sub('/query$', '', triplestore_endpoint)
-        triplestore_endpoint_new = re.sub(
-            '/update$', '', triplestore_endpoint_new)
-        sparql = SPARQLWrapper(triplestore_endpoint_new)
-        logging.info("found: endpoint=%s" % triplestore_endpoint_new)
-
-    logging.info("execute SPARQL query:\n%s" % sparql_query)
-
-    sparql.setQuery(sparql_query)
-    sparql.setReturnFormat(JSON)
-    sparql.setMethod("POST")
-    results = sparql.query().convert()
-    logging.debug(results)
-    return results
+    return get_triplestore_client(triplestore_endpoint).query(sparql_query)
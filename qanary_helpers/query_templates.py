@@ -0,0 +1,165 @@
+"""
+Registry of named SPARQL query templates. A template is parsed once when it is registered; binding typed
+parameters (IRIs, literals, language tags, integers and lists of them) only escapes the values and joins the precompiled parts.
+The bound queries remember their template and parameters, so the triplestore clients log them by name instead
+of the full query text and record the number of executions and their latency per template.
+"""
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from string import Formatter
+
+# characters that must be escaped in quoted literals of SPARQL and N-Triples
+_LITERAL_ESCAPES = str.maketrans({"\\": "\\\\", "\"": "\\\"", "\n": "\\n", "\r": "\\r", "\t": "\\t"})
+# characters that are not allowed in IRIs of SPARQL and N-Triples, percent-encoded
+_IRI_ESCAPES = str.maketrans({c: "%{0:02X}".format(ord(c)) for c in [chr(i) for i in range(0x21)] + list("<>\"{}|^`\\")})
+_LANGUAGE_TAG = re.compile(r"^[a-zA-Z]+(-[a-zA-Z0-9]+)*$")
+
+
+def escape_literal(value: str) -> str:
+    """Returns the value as quoted string literal with escaped special characters"""
+    return "\"" + value.translate(_LITERAL_ESCAPES) + "\""
+
+
+def escape_iri(value: str) -> str:
+    """Returns the IRI enclosed in angle brackets with characters that are not allowed percent-encoded"""
+    return "<" + value.translate(_IRI_ESCAPES) + ">"
+
+
+def escape_language(value: str) -> str:
+    """Returns the language tag as quoted string literal, raises ValueError for invalid tags"""
+    if not _LANGUAGE_TAG.match(value):
+        raise ValueError("Invalid language tag: {0}".format(value))
+    return escape_literal(value)
+
+
+PARAMETER_TYPES = {
+    "iri": escape_iri,
+    "iris": lambda values: " ".join(escape_iri(value) for value in sorted(values)),
+    "literal": escape_literal,
+    "lang": escape_language,
+    "langs": lambda values: ", ".join(escape_language(value) for value in sorted(values)),
+    "integer": lambda value: str(int(value)),
+}
+
+
+class PreparedQuery(str):
+    """The text of a query bound from a template, with the template and the parameters it was bound with"""
+
+    def __new__(cls, text, template, params):
+        query = super().__new__(cls, text)
+        query.template = template
+        query.params = params
+        return query
+
+
+class QueryTemplate:
+    """A named SPARQL query with typed {placeholders}, literal braces are written as {{ and }}"""
+
+    def __init__(self, name: str, text: str, /, **parameter_types):
+        """
+        Keyword arguments:
+        name (str) -- name of the template, used in log messages and statistics
+        text (str) -- the query with one {placeholder} per parameter
+        parameter_types -- type of each parameter, a key of PARAMETER_TYPES
+        """
+        self.name = name
+        self.parameter_types = parameter_types
+        self.calls = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        self._parts = []
+        for literal_text, field_name, format_spec, conversion in Formatter().parse(text):
+            if field_name is not None and (format_spec or conversion):
+                raise ValueError("Template {0}: format specs are not supported: {1}".format(name, field_name))
+            if field_name is not None and field_name not in parameter_types:
+                raise ValueError("Template {0}: no type for parameter {1}".format(name, field_name))
+            self._parts.append((literal_text, field_name))
+        for parameter, parameter_type in parameter_types.items():
+            if parameter_type not in PARAMETER_TYPES:
+                raise ValueError("Template {0}: unknown type {1} of parameter {2}".format(name, parameter_type,
+                                                                                       parameter))
+
+    def bind(self, **params) -> PreparedQuery:
+        """Returns the query with the escaped parameter values
+
+        Keyword arguments:
+        params -- one value per parameter of the template
+        """
+        if params.keys() != self.parameter_types.keys():
+            raise ValueError("Template {0} expects the parameters {1}, got {2}".format(
+                self.name, sorted(self.parameter_types), sorted(params)))
+        values = {parameter: PARAMETER_TYPES[parameter_type](params[parameter])
+                  for parameter, parameter_type in self.parameter_types.items()}
+        text = "".join(literal_text + (values[field_name] if field_name is not None else "")
+                       for literal_text, field_name in self._parts)
+        return PreparedQuery(text, self, params)
+
+    def record(self, seconds: float):
+        """Records one execution of a query bound from the template"""
+        with self._lock:
+            self.calls += 1
+            self.seconds += seconds
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def register_query(name: str, text: str, /, **parameter_types) -> QueryTemplate:
+    """Registers a named query template, see QueryTemplate
+
+    Returns:
+    QueryTemplate -- The registered template
+    """
+    template = QueryTemplate(name, text, **parameter_types)
+    with _templates_lock:
+        if name in _templates:
+            raise ValueError("A query template named {0} is already registered".format(name))
+        _templates[name] = template
+    return template
+
+
+def get_query_template(name: str) -> QueryTemplate:
+    """Returns the registered template with the given name, raises KeyError for unknown names"""
+    return _templates[name]
+
+
+def query_template_stats() -> dict:
+    """Returns {template name: {"calls": executions, "seconds": total latency, "mean_seconds": mean latency}}"""
+    with _templates_lock:
+        templates = list(_templates.values())
+    return {template.name: {"calls": template.calls, "seconds": template.seconds,
+                            "mean_seconds": template.seconds / template.calls if template.calls else 0.0}
+            for template in templates}
+
+
+def reset_query_template_stats():
+    """Resets the execution statistics of all templates"""
+    with _templates_lock:
+        for template in _templates.values():
+            with template._lock:
+                template.calls = 0
+                template.seconds = 0.0
+
+
+@contextmanager
+def track_query(sparql_query):
+    """Logs the execution of a query and records its latency if it was bound from a template
+
+    Keyword arguments:
+    sparql_query -- the query, a PreparedQuery or str
+    """
+    template = getattr(sparql_query, "template", None)
+    if template is None:
+        logging.debug("execute SPARQL query:\n%s", sparql_query)
+        yield
+        return
+    logging.info("execute SPARQL query %s %r", template.name, sparql_query.params)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        template.record(time.perf_counter() - start)
@@ -0,0 +1,64 @@
+from functools import cached_property
+
+from qanary_helpers.language_queries import get_detected_languages_of_question, get_translations_of_question
+from qanary_helpers.qanary_queries import _question_uris_query, get_text_question_from_uri, select_from_triplestore
+
+
+class QanaryQuestionContext:
+    """
+    Holds the data of the question processed by one /annotatequestion request. The question URI, the raw text,
+    the detected languages and the translations are fetched lazily on first access and cached for the lifetime
+    of the context, so each piece of data costs at most one round trip.
+    """
+
+    def __init__(self, triplestore_endpoint: str, graph_uri: str):
+        """
+        Keyword arguments:
+        triplestore_endpoint (str) -- URL of the triplestore endpoint
+        graph_uri (str) -- URI of the graph of the current question answering process
+        """
+        self.triplestore_endpoint = triplestore_endpoint
+        self.graph_uri = graph_uri
+
+    @classmethod
+    def from_request(cls, request_json: dict) -> "QanaryQuestionContext":
+        """Creates the context from the JSON payload of an /annotatequestion request
+
+        Keyword arguments:
+        request_json (dict) -- payload containing "urn:qanary#endpoint" and "urn:qanary#inGraph" in "values"
+        """
+        values = request_json["values"]
+        return cls(values["urn:qanary#endpoint"], values["urn:qanary#inGraph"])
+
+    @cached_property
+    def question_uri(self) -> str:
+        """URI of the question in the graph"""
+        results = select_from_triplestore(self.triplestore_endpoint, _question_uris_query(self.graph_uri))
+        bindings = results["results"]["bindings"]
+        if not bindings:
+            raise ValueError("No question found in graph {0}".format(self.graph_uri))
+        return bindings[0]["questionURI"]["value"]
+
+    @cached_property
+    def question_text(self) -> str:
+        """Raw text of the question"""
+        return get_text_question_from_uri(self.triplestore_endpoint, self.question_uri)
+
+    @cached_property
+    def detected_languages(self) -> list[str]:
+        """Languages detected for the question by previous components"""
+        return get_detected_languages_of_question(self.triplestore_endpoint, self.graph_uri, self.question_uri)
+
+    @cached_property
+    def translations(self) -> dict[str, str]:
+        """Translations of the question created by previous components as {language: text}"""
+        return {translation.get_language(): translation.get_text() for translation in
+                get_translations_of_question(self.triplestore_endpoint, self.graph_uri, self.question_uri)}
+
+    def get_translation(self, lang: str):
+        """Returns the translation of the question into a language, or None if there is no such translation
+
+        Keyword arguments:
+        lang (str) -- language of the translation
+        """
+        return self.translations.get(lang)
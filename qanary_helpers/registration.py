@@ -1,20 +1,69 @@
+import json
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
 class Registration:
     """
     A similar implementation of the corresponding Spring Boot Admin class
     c.f,. https://github.com/codecentric/spring-boot-admin/blob/master/spring-boot-admin-server/src/main/java/de/codecentric/boot/admin/server/domain/values/Registration.java
+
+    Registrations are immutable, use replace() to create a changed registration.
     """
 
-    name = None
-    managementUrl = None
-    healthUrl = None
-    serviceUrl = None
-    source = None
-    metadata = {}
-
-    def __init__(self, name, healthUrl, source=None, managementUrl=None, serviceUrl=None, metadata={}):
-        self.name = name
-        self.managementUrl = managementUrl
-        self.healthUrl = healthUrl
-        self.serviceUrl = serviceUrl
-        self.source = source
-        self.metadata = metadata
\ No newline at end of file
+    __slots__ = ("name", "managementUrl", "healthUrl", "serviceUrl", "source", "metadata", "_payload")
+
+    _fields = ("name", "managementUrl", "healthUrl", "serviceUrl", "source", "metadata")
+
+    def __init__(self, name, healthUrl, source=None, managementUrl=None, serviceUrl=None, metadata=None):
+        if isinstance(metadata, Mapping):
+            # copied, so the registration does not share state with the caller
+            metadata = MappingProxyType(dict(metadata))
+        for field, value in (("name", name), ("managementUrl", managementUrl), ("healthUrl", healthUrl),
+                             ("serviceUrl", serviceUrl), ("source", source),
+                             ("metadata", MappingProxyType({}) if metadata is None else metadata),
+                             ("_payload", None)):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Registration is immutable, use replace() to change {0}".format(name))
+
+    def __delattr__(self, name):
+        raise AttributeError("Registration is immutable")
+
+    def _values(self):
+        return tuple(getattr(self, field) for field in self._fields)
+
+    def __eq__(self, other):
+        if not isinstance(other, Registration):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self):
+        # metadata is left out as it may contain unhashable values
+        return hash(self._values()[:-1])
+
+    def __repr__(self):
+        return "Registration({0})".format(", ".join("{0}={1!r}".format(field, value) for field, value in
+                                                   zip(self._fields, self._values())))
+
+    def replace(self, **changes):
+        """Returns a copy of the registration with the given fields changed"""
+        values = dict(zip(self._fields, self._values()))
+        unknown = set(changes) - set(values)
+        if unknown:
+            raise ValueError("Unknown registration fields: {0}".format(", ".join(sorted(unknown))))
+        values.update(changes)
+        return Registration(**values)
+
+    def to_dict(self) -> dict:
+        """Returns the fields of the registration that are not None, as sent to the Spring Boot Admin Server"""
+        return {field: dict(value) if isinstance(value, Mapping) else value
+                for field, value in zip(self._fields, self._values()) if value is not None}
+
+    @property
+    def payload(self) -> str:
+        """The JSON payload of the registration, serialized once"""
+        if self._payload is None:
+            object.__setattr__(self, "_payload", json.dumps(self.to_dict()))
+        return self._payload
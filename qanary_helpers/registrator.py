@@ -1,9 +1,48 @@
+import asyncio
+import base64
 import threading
 import time
+import random
 import requests
 import json
 import logging
+import aiohttp
+from typing import NamedTuple, Optional
 from requests.auth import HTTPBasicAuth
+from qanary_helpers.instrumentation import measure_call
+
+
+def registration_delay(interval, failures=0, backoff_base=1.0, max_backoff=300, jitter=0.1):
+    """
+    Returns the seconds to wait before the next registration call: the interval with +/- jitter after a successful
+    call, an exponentially growing delay (with jitter, at most max_backoff) after failed calls
+
+    Keyword arguments:
+    interval -- seconds between successful registration calls
+    failures -- number of consecutive failed calls
+    backoff_base -- delay after the first failed call
+    max_backoff -- maximum delay after failed calls
+    jitter -- relative random variation of the delay, so replicas do not register in lockstep
+    """
+    if failures == 0:
+        return interval * random.uniform(1 - jitter, 1 + jitter)
+    delay = min(max_backoff, backoff_base * 2 ** (failures - 1))
+    return delay * random.uniform(1 - jitter, 1)
+
+
+def _instance_id(content):
+    """Returns the instance id from the response of the admin server to a registration"""
+    try:
+        return json.loads(content).get("id")
+    except (ValueError, AttributeError):
+        return None
+
+
+def _admin_server_session(admin_server_user, admin_server_password):
+    session = requests.Session()
+    session.headers.update(Registrator.json_headers)
+    session.auth = HTTPBasicAuth(admin_server_user, admin_server_password)
+    return session
 
 
 class Registrator(threading.Thread):
@@ -14,10 +53,15 @@ class Registrator(threading.Thread):
     json_headers = {"Content-type": "application/json",
                     "Accept": "application/json"}
 
-    def __init__(self, admin_server_url, admin_server_user, admin_server_password, registration, interval=10):
+    def __init__(self, admin_server_url, admin_server_user, admin_server_password, registration, interval=10,
+                 timeout=(5, 10), backoff_base=1.0, max_backoff=300, jitter=0.1, heartbeat=False, session=None):
         """
-        registration = None  # passed dict containing relevant information
+        registration = None  # passed Registration containing relevant information
         interval = None  # in seconds
+        timeout = (5, 10)  # seconds to wait for the admin server, (connect, read)
+        backoff_base, max_backoff, jitter  # see registration_delay
+        heartbeat = False  # only check the registered instance, register again if it is unknown to the admin server
+        session = None  # shared requests.Session with the JSON headers and credentials, created if None
         """
         threading.Thread.__init__(self)
         self.admin_server_url = admin_server_url + "/instances"
@@ -25,13 +69,30 @@ class Registrator(threading.Thread):
         self.admin_server_password = admin_server_password
         self.registration = registration
         self.interval = interval
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.heartbeat = heartbeat
+        self.instance_id = None
+        self.failures = 0
+        self.last_success = None
+        self._owns_session = session is None
+        self.session = session if session is not None else _admin_server_session(admin_server_user,
+                                                                                  admin_server_password)
         self._stop_event = threading.Event()
         logging.basicConfig(level=logging.DEBUG)
 
     def run(self):
-        while not self.is_stopped():
-            self.call_admin_server()
-            time.sleep(self.interval)
+        try:
+            while not self.is_stopped():
+                self.call_admin_server()
+                # returns as soon as stop() is called
+                self._stop_event.wait(registration_delay(self.interval, self.failures, self.backoff_base,
+                                                         self.max_backoff, self.jitter))
+        finally:
+            if self._owns_session:
+                self.session.close()
 
     def stop(self):
         self._stop_event.set()
@@ -40,19 +101,281 @@ class Registrator(threading.Thread):
         return self._stop_event.is_set()
 
     def call_admin_server(self):
+        """Registers the component once (in heartbeat mode only if the admin server does not know the instance),
+        returns whether the call succeeded"""
+        ok = False
+        try:
+            status = self._check_instance() if self.heartbeat and self.instance_id is not None else 404
+            if status == 404:
+                ok = self._register()
+            else:
+                ok = status < 400
+                if not ok:
+                    logging.warning("registration: heartbeat failed at %s with HTTP status code %d",
+                                    self.admin_server_url, status)
+        except Exception as e:
+            logging.warning("registration: failed at %s with exception \"%s\"", self.admin_server_url, e)
+        self.failures = 0 if ok else self.failures + 1
+        if ok:
+            self.last_success = time.time()
+        return ok
+
+    def _check_instance(self):
+        url = "{0}/{1}".format(self.admin_server_url, self.instance_id)
+        with measure_call("heartbeat", self.admin_server_url) as call:
+            response = self.session.get(url=url, timeout=self.timeout)
+            call.status = response.status_code
+            call.bytes_in = len(response.content)
+        if response.status_code == 404:
+            logging.info("registration: instance %s is unknown at %s", self.instance_id, self.admin_server_url)
+            self.instance_id = None
+        return response.status_code
+
+    def _register(self):
+        # the payload is serialized once per registration (None values are not sent)
+        request_data = self.registration.payload
+        with measure_call("registration", self.admin_server_url, len(request_data.encode("utf-8"))) as call:
+            response = self.session.post(url=self.admin_server_url, data=request_data, timeout=self.timeout)
+            call.status = response.status_code
+            call.bytes_in = len(response.content)
+        if not response:
+            logging.warning("registration: failed at %s with HTTP status code %d",
+                            self.admin_server_url, response.status_code)
+            return False
+        logging.debug("registration: ok on %s (%d)", self.admin_server_url, response.status_code)
+        self.instance_id = _instance_id(response.content)
+        return True
+
+
+class AsyncRegistrator:
+    """
+    Registers a component at the Spring Boot Admin Server periodically from an asyncio task within the event
+    loop of the component, using the shared aiohttp session of qanary_helpers.aio
+    """
+
+    json_headers = Registrator.json_headers
+
+    def __init__(self, admin_server_url, admin_server_user, admin_server_password, registration, interval=10,
+                 timeout=10, backoff_base=1.0, max_backoff=300, jitter=0.1, heartbeat=False):
+        """
+        Keyword arguments:
+        admin_server_url -- URL of the Spring Boot Admin Server
+        admin_server_user -- admin username
+        admin_server_password -- admin password
+        registration -- the Registration
+        interval -- seconds between the registration calls
+        timeout -- seconds to wait for the admin server
+        backoff_base, max_backoff, jitter -- see registration_delay
+        heartbeat -- only check the registered instance, register again if it is unknown to the admin server
+        """
+        self.admin_server_url = admin_server_url + "/instances"
+        credentials = "{0}:{1}".format(admin_server_user or "", admin_server_password or "").encode("utf-8")
+        self.headers = dict(self.json_headers, Authorization="Basic " + base64.b64encode(credentials).decode("ascii"))
+        self.registration = registration
+        self.interval = interval
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.heartbeat = heartbeat
+        self.instance_id = None
+        self.failures = 0
+        self.last_success = None
+        self._task = None
+
+    def start(self):
+        """Starts the registration task in the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stops the registration task"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def is_stopped(self):
+        return self._task is None or self._task.done()
+
+    async def _run(self):
+        while True:
+            await self.call_admin_server()
+            await asyncio.sleep(registration_delay(self.interval, self.failures, self.backoff_base,
+                                                   self.max_backoff, self.jitter))
+
+    async def call_admin_server(self):
+        """Registers the component once (in heartbeat mode only if the admin server does not know the instance),
+        returns whether the call succeeded"""
+        ok = False
         try:
-            # prepare POST request data (None values should not been send)
-            request_data = {k: v for k, v in vars(self.registration).items() if v is not None}
-            response = requests.post(
-                url=self.admin_server_url, headers=self.json_headers,
-                data=json.dumps(request_data), auth=HTTPBasicAuth(self.admin_server_user, self.admin_server_password)
-            )
-            if response:
-                logging.debug("registration: ok on %s (%d)" %
-                              (self.admin_server_url, response.status_code))
+            status = await self._check_instance() if self.heartbeat and self.instance_id is not None else 404
+            if status == 404:
+                ok = await self._register()
             else:
-                logging.warning("registration: failed at %s with HTTP status code %d" % (
-                    self.admin_server_url, response.status_code))
+                ok = status < 400
+                if not ok:
+                    logging.warning("registration: heartbeat failed at %s with HTTP status code %d",
+                                    self.admin_server_url, status)
         except Exception as e:
-            logging.warning("registration: failed at %s with exception \"%s\"" % (
-                self.admin_server_url, e))
+            logging.warning("registration: failed at %s with exception \"%s\"", self.admin_server_url, e)
+        self.failures = 0 if ok else self.failures + 1
+        if ok:
+            self.last_success = time.time()
+        return ok
+
+    async def _check_instance(self):
+        from qanary_helpers.aio import get_session
+
+        url = "{0}/{1}".format(self.admin_server_url, self.instance_id)
+        with measure_call("heartbeat", self.admin_server_url) as call:
+            async with get_session().get(url, headers=self.headers, timeout=self.timeout) as response:
+                call.status = response.status
+                call.bytes_in = len(await response.read())
+        if response.status == 404:
+            logging.info("registration: instance %s is unknown at %s", self.instance_id, self.admin_server_url)
+            self.instance_id = None
+        return response.status
+
+    async def _register(self):
+        from qanary_helpers.aio import get_session
+
+        request_data = self.registration.payload
+        with measure_call("registration", self.admin_server_url, len(request_data.encode("utf-8"))) as call:
+            async with get_session().post(self.admin_server_url, data=request_data, headers=self.headers,
+                                          timeout=self.timeout) as response:
+                content = await response.read()
+                call.status = response.status
+                call.bytes_in = len(content)
+        if response.status >= 400:
+            logging.warning("registration: failed at %s with HTTP status code %d",
+                            self.admin_server_url, response.status)
+            return False
+        logging.debug("registration: ok on %s (%d)", self.admin_server_url, response.status)
+        self.instance_id = _instance_id(content)
+        return True
+
+
+class RegistrationStatus(NamedTuple):
+    """Status of a registration managed by a RegistrationManager"""
+    registered: bool
+    instance_id: Optional[str]
+    failures: int
+    last_success: Optional[float]
+    next_call: float
+
+
+class RegistrationManager(threading.Thread):
+    """
+    Registers many components at the Spring Boot Admin Server from one thread using one keep-alive session, e.g.,
+    from a sidecar. The calls of the registrations are spread evenly over the interval.
+
+        manager = RegistrationManager(admin_server_url, admin_server_user, admin_server_password)
+        manager.add(Registration(name="component-a", healthUrl="http://a:5000/health"))
+        manager.start()
+    """
+
+    def __init__(self, admin_server_url, admin_server_user, admin_server_password, interval=10, timeout=(5, 10),
+                 backoff_base=1.0, max_backoff=300, jitter=0.1, heartbeat=False):
+        """
+        Keyword arguments:
+        admin_server_url -- URL of the Spring Boot Admin Server
+        admin_server_user -- admin username
+        admin_server_password -- admin password
+        interval -- seconds between the registration calls of each registration
+        timeout, backoff_base, max_backoff, jitter, heartbeat -- see Registrator
+        """
+        threading.Thread.__init__(self)
+        self.admin_server_url = admin_server_url
+        self.admin_server_user = admin_server_user
+        self.admin_server_password = admin_server_password
+        self.interval = interval
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.heartbeat = heartbeat
+        self.session = _admin_server_session(admin_server_user, admin_server_password)
+        self._registrators = {}
+        self._next_calls = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def add(self, registration, key=None):
+        """Adds a registration, returns its key
+
+        Keyword arguments:
+        registration -- the Registration
+        key -- unique key of the registration, defaults to its name
+        """
+        key = registration.name if key is None else key
+        with self._condition:
+            if key in self._registrators:
+                raise ValueError("A registration with the key {0!r} is already managed".format(key))
+            self._registrators[key] = Registrator(
+                self.admin_server_url, self.admin_server_user, self.admin_server_password, registration,
+                self.interval, self.timeout, self.backoff_base, self.max_backoff, self.jitter, self.heartbeat,
+                session=self.session)
+            self._spread()
+            self._condition.notify()
+        return key
+
+    def remove(self, key):
+        """Stops registering the registration with the given key"""
+        with self._condition:
+            del self._registrators[key]
+            del self._next_calls[key]
+            self._spread()
+            self._condition.notify()
+
+    def status(self) -> dict:
+        """Returns the RegistrationStatus of each registration by key"""
+        with self._condition:
+            return {key: RegistrationStatus(registrator.last_success is not None and registrator.failures == 0,
+                                            registrator.instance_id, registrator.failures, registrator.last_success,
+                                            self._next_calls[key])
+                    for key, registrator in self._registrators.items()}
+
+    def _spread(self):
+        # registrations that are not backing off get evenly spaced calls within the next interval
+        now = time.time()
+        healthy = [key for key, registrator in self._registrators.items() if registrator.failures == 0]
+        for index, key in enumerate(healthy):
+            self._next_calls[key] = now + index * self.interval / len(healthy)
+
+    def run(self):
+        try:
+            while True:
+                with self._condition:
+                    while not self._stopped:
+                        now = time.time()
+                        due = [key for key, next_call in self._next_calls.items() if next_call <= now]
+                        if due:
+                            break
+                        self._condition.wait(min(self._next_calls.values(), default=now + self.interval) - now)
+                    if self._stopped:
+                        return
+                    registrators = [(key, self._registrators[key]) for key in due]
+                for key, registrator in registrators:
+                    registrator.call_admin_server()
+                    with self._condition:
+                        if key in self._next_calls:
+                            self._next_calls[key] = self._next_call(self._next_calls[key], registrator)
+        finally:
+            self.session.close()
+
+    def _next_call(self, previous_call, registrator):
+        if registrator.failures:
+            return time.time() + registration_delay(self.interval, registrator.failures, self.backoff_base,
+                                                    self.max_backoff, self.jitter)
+        # keeps the slot of the registration within the interval (instead of a jitter, which would make the slots
+        # drift into each other)
+        return max(previous_call + self.interval, time.time())
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def is_stopped(self):
+        return self._stopped
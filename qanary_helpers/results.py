@@ -0,0 +1,186 @@
+"""
+Compact decoding of SPARQL SELECT results. Rows are named tuples with one field per projected variable, RDF terms
+are converted to Python values: IRIs and blank nodes to str, literals with a language tag to LangLiteral and typed
+literals (xsd:integer, xsd:decimal, xsd:float, xsd:double, xsd:boolean, xsd:dateTime, xsd:date) to the
+corresponding Python type. Unbound variables are None.
+"""
+import re
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+SPARQL_RESULTS_TSV = "text/tab-separated-values"
+
+_LITERAL_CONVERTERS = {
+    XSD + "boolean": lambda value: value.strip() in ("true", "1"),
+    XSD + "decimal": Decimal,
+    XSD + "float": float,
+    XSD + "double": float,
+    XSD + "dateTime": lambda value: datetime.fromisoformat(value.replace("Z", "+00:00")),
+    XSD + "date": date.fromisoformat,
+}
+for _integer_type in ("integer", "int", "long", "short", "byte", "nonNegativeInteger", "positiveInteger",
+                      "negativeInteger", "nonPositiveInteger", "unsignedLong", "unsignedInt", "unsignedShort",
+                      "unsignedByte"):
+    _LITERAL_CONVERTERS[XSD + _integer_type] = int
+
+
+class LangLiteral(str):
+    """A string literal with a language tag"""
+
+    def __new__(cls, value, lang):
+        literal = super().__new__(cls, value)
+        literal.lang = lang
+        return literal
+
+    def __repr__(self):
+        return "LangLiteral({0}, {1!r})".format(str.__repr__(self), self.lang)
+
+
+def convert_literal(value: str, datatype=None, lang=None):
+    """Converts a literal to a Python value, values that cannot be converted are returned as str
+
+    Keyword arguments:
+    value (str) -- lexical form of the literal
+    datatype (str) -- datatype IRI of the literal
+    lang (str) -- language tag of the literal
+    """
+    if lang:
+        return LangLiteral(value, lang)
+    converter = _LITERAL_CONVERTERS.get(datatype)
+    if converter is not None:
+        try:
+            return converter(value)
+        except ValueError:
+            pass
+    return value
+
+
+def convert_term(term):
+    """Converts an RDF term of the SPARQL JSON results format to a Python value
+
+    Keyword arguments:
+    term (dict) -- the term, e.g. {"type": "literal", "value": "1", "datatype": "...#integer"}
+    """
+    if term is None:
+        return None
+    if term.get("type") in ("literal", "typed-literal"):
+        return convert_literal(term["value"], term.get("datatype"), term.get("xml:lang"))
+    return term["value"]
+
+
+@lru_cache(maxsize=256)
+def row_type(variables: tuple):
+    """Returns the named tuple type for rows with the given variables"""
+    return namedtuple("Row", variables, rename=True)
+
+
+def decode_select_results(results: dict) -> list:
+    """Decodes SELECT results in the SPARQL JSON results format into a list of rows
+
+    Keyword arguments:
+    results (dict) -- results as returned by select_from_triplestore
+    """
+    variables = tuple(results["head"]["vars"])
+    row = row_type(variables)
+    return [row._make(convert_term(binding.get(variable)) for variable in variables)
+            for binding in results["results"]["bindings"]]
+
+
+def decode_select_columns(results: dict) -> dict:
+    """Decodes SELECT results in the SPARQL JSON results format into one list of values per variable
+
+    Keyword arguments:
+    results (dict) -- results as returned by select_from_triplestore
+    """
+    bindings = results["results"]["bindings"]
+    return {variable: [convert_term(binding.get(variable)) for binding in bindings]
+            for variable in results["head"]["vars"]}
+
+
+_TSV_LITERAL = re.compile(r'^(?:"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\')(?:@([a-zA-Z]+(?:-[a-zA-Z0-9]+)*)|\^\^<([^>]*)>)?$')
+_TSV_ESCAPE = re.compile(r"\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)")
+_TSV_ESCAPES = {"t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f", "\"": "\"", "'": "'", "\\": "\\"}
+_TSV_INTEGER = re.compile(r"^[+-]?\d+$")
+_TSV_DECIMAL = re.compile(r"^[+-]?\d*\.\d+$")
+_TSV_DOUBLE = re.compile(r"^[+-]?(?:\d+\.?\d*|\.\d+)[eE][+-]?\d+$")
+
+
+def _unescape(value: str) -> str:
+    if "\\" not in value:
+        return value
+    return _TSV_ESCAPE.sub(lambda match: chr(int(match.group(1)[1:], 16)) if match.group(1)[0] in "uU"
+                           else _TSV_ESCAPES.get(match.group(1), match.group(1)), value)
+
+
+def parse_tsv_term(term: str):
+    """Converts an RDF term of the SPARQL TSV results format (Turtle syntax) to a Python value
+
+    Keyword arguments:
+    term (str) -- the term, e.g. "\\"Hello\\"@en" or "<http://example.org/a>"
+    """
+    if not term:
+        return None
+    if term[0] == "<" and term[-1] == ">":
+        return _unescape(term[1:-1])
+    if term.startswith("_:"):
+        return term
+    match = _TSV_LITERAL.match(term)
+    if match is not None:
+        value = match.group(1) if match.group(1) is not None else match.group(2)
+        return convert_literal(_unescape(value), match.group(4), match.group(3))
+    if _TSV_INTEGER.match(term):
+        return int(term)
+    if _TSV_DECIMAL.match(term):
+        return Decimal(term)
+    if _TSV_DOUBLE.match(term):
+        return float(term)
+    if term in ("true", "false"):
+        return term == "true"
+    return term
+
+
+def split_lines(chunks, encoding="utf-8"):
+    """Splits a stream of byte chunks into decoded lines without the line break
+
+    Keyword arguments:
+    chunks -- iterable of bytes, e.g. response.iter_content()
+    encoding -- character encoding of the stream
+    """
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode(encoding)
+    if pending:
+        yield pending.decode(encoding)
+
+
+def parse_tsv_header(line: str):
+    """Returns the row type for the header line of SELECT results in the SPARQL TSV results format"""
+    return row_type(tuple(variable.lstrip("?$") for variable in line.rstrip("\r\n").split("\t")))
+
+
+def parse_tsv_row(row, line: str):
+    """Decodes one line of SELECT results in the SPARQL TSV results format into a row of the given row type"""
+    # an empty line is a row in which no variable is bound
+    values = line.rstrip("\r\n").split("\t")
+    return row._make(parse_tsv_term(value) for value in values + [""] * (len(row._fields) - len(values)))
+
+
+def iter_tsv_rows(lines):
+    """Decodes SELECT results in the SPARQL TSV results format line by line, yielding one row per line
+
+    Keyword arguments:
+    lines -- iterable of the lines (str) of the response body, the first line is the header
+    """
+    lines = iter(lines)
+    header = next(lines, None)
+    if header is None:
+        return
+    row = parse_tsv_header(header)
+    for line in lines:
+        yield parse_tsv_row(row, line)
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class QuestionTextCache:
+    """
+    Bounded cache for raw question texts keyed by question URI. The least recently used texts are evicted when
+    the maximum number of entries or bytes is exceeded; with a TTL, entries expire after the given time.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024, ttl=None):
+        """
+        Keyword arguments:
+        max_entries -- maximum number of cached texts
+        max_bytes -- maximum total size of the cached texts (UTF-8 encoded)
+        ttl -- seconds after which a cached text expires, None for no expiry
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, question_uri):
+        """
+        Returns the cached text of a question, or None if it is not cached
+
+        Keyword arguments:
+        question_uri -- URI of the question
+        """
+        with self._lock:
+            entry = self._entries.get(question_uri)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove(question_uri)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(question_uri)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, question_uri, text):
+        """
+        Caches the text of a question, texts larger than max_bytes are not cached
+
+        Keyword arguments:
+        question_uri -- URI of the question
+        text -- text of the question
+        """
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if question_uri in self._entries:
+                self._remove(question_uri)
+            self._entries[question_uri] = (text, size, expires_at)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """Removes all cached texts and resets the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Returns the number of entries, their total size in bytes and the hit/miss counters"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, question_uri):
+        self.size -= self._entries.pop(question_uri)[1]
+
+
+_cache = None
+
+
+def enable_question_text_cache(max_entries=10000, max_bytes=16 * 1024 * 1024, ttl=None) -> QuestionTextCache:
+    """
+    Enables the process-wide question text cache used by the helpers fetching raw question texts
+
+    Keyword arguments:
+    max_entries -- maximum number of cached texts
+    max_bytes -- maximum total size of the cached texts (UTF-8 encoded)
+    ttl -- seconds after which a cached text expires, None for no expiry
+    """
+    global _cache
+    _cache = QuestionTextCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+    return _cache
+
+
+def disable_question_text_cache():
+    """Disables the process-wide question text cache"""
+    global _cache
+    _cache = None
+
+
+def get_question_text_cache():
+    """Returns the process-wide question text cache, or None if it is not enabled"""
+    return _cache
@@ -0,0 +1,220 @@
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from qanary_helpers.instrumentation import measure_call, measure_query
+from qanary_helpers.query_templates import track_query
+
+SPARQL_RESULTS_JSON = "application/sparql-results+json"
+
+_UPDATE_OPERATIONS = {"INSERT", "DELETE", "LOAD", "CLEAR", "CREATE", "DROP", "COPY", "MOVE", "ADD", "WITH"}
+# prologue of a SPARQL request: comments, PREFIX and BASE declarations
+_PROLOGUE = re.compile(r"(?:\s+|#[^\n]*|PREFIX\s+[^\s:]*:\s*<[^>]*>|BASE\s*<[^>]*>)*", re.IGNORECASE)
+_OPERATION = re.compile(r"[A-Za-z]+")
+_CREDENTIALS = re.compile(r"^(\w+):(\w+)@(.*)$")
+
+
+def parse_triplestore_endpoint(triplestore_endpoint: str) -> tuple:
+    """Splits a triplestore endpoint URL into the URL to be called and optional credentials
+
+    Keyword arguments:
+    triplestore_endpoint (str) -- URL of the triplestore endpoint, optionally with user:password@ (qanary v2)
+
+    Returns:
+    tuple -- (endpoint, username, password), username and password are None if no credentials are given
+    """
+    triplestore_endpoint_parsed = urlparse(triplestore_endpoint)
+    match = _CREDENTIALS.match(triplestore_endpoint_parsed.netloc)
+    if match is not None:
+        # qanary v2 and lower
+        username, password, netloc = match.groups()
+        endpoint = triplestore_endpoint_parsed.scheme + "://" + netloc + triplestore_endpoint_parsed.path
+        return endpoint, username, password
+
+    # qanary v3
+    endpoint = re.sub('/query$', '', triplestore_endpoint)
+    endpoint = re.sub('/update$', '', endpoint)
+    return endpoint, None, None
+
+
+def is_update_query(sparql_query: str) -> bool:
+    """Returns True if the SPARQL request is an update operation (INSERT, DELETE, ...), False for queries
+
+    Keyword arguments:
+    sparql_query (str) -- the SPARQL request
+    """
+    prologue = _PROLOGUE.match(sparql_query)
+    operation = _OPERATION.match(sparql_query, prologue.end())
+    return operation is not None and operation.group(0).upper() in _UPDATE_OPERATIONS
+
+
+class TriplestoreClient:
+    """
+    Client for one triplestore endpoint. The endpoint URL and credentials are parsed once and all requests
+    share a keep-alive connection pool, so repeated queries do not pay for connection setup and TLS handshakes.
+    """
+
+    def __init__(self, triplestore_endpoint, pool_size=10, timeout=(5, 60), retries=3, backoff_factor=0.1):
+        """
+        Keyword arguments:
+        triplestore_endpoint -- URL of the triplestore endpoint
+        pool_size -- maximum number of kept-alive connections per host
+        timeout -- seconds to wait for the server, either a single value or a (connect, read) tuple
+        retries -- number of retries on connection errors (requests that reached the server are never retried)
+        backoff_factor -- factor for the exponential delay between retries
+        """
+        self.endpoint, self.username, self.password = parse_triplestore_endpoint(triplestore_endpoint)
+        self.auth = (self.username, self.password) if self.username is not None else None
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=Retry(total=retries, read=0, backoff_factor=backoff_factor)
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        if self.username is not None:
+            logging.info("found: endpoint=%s,  username=%s,  password=%s",
+                         self.endpoint, self.username, self.password)
+        else:
+            logging.info("found: endpoint=%s", self.endpoint)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Closes all pooled connections"""
+        self.session.close()
+
+    def query(self, sparql_query):
+        """
+        Executes a SPARQL query or update on the endpoint and returns the result object
+
+        Keyword arguments:
+        sparql_query -- a query to execute on the endpoint
+        """
+        if is_update_query(sparql_query):
+            operation = "update"
+            data = {"update": sparql_query}
+            headers = None
+        else:
+            operation = "select"
+            data = {"query": sparql_query}
+            headers = {"Accept": SPARQL_RESULTS_JSON}
+
+        with track_query(sparql_query), measure_query(operation, self.endpoint, sparql_query) as call:
+            response = self.session.post(self.endpoint, data=data, headers=headers, auth=self.auth,
+                                         timeout=self.timeout)
+            call.status = response.status_code
+            response.raise_for_status()
+            call.bytes_in = len(response.content)
+
+            if "json" in response.headers.get("Content-Type", ""):
+                results = response.json()
+            else:
+                results = response.text
+        logging.debug("SPARQL results: %s", results)
+        return results
+
+    @contextmanager
+    def stream_query(self, sparql_query, accept):
+        """
+        Executes a SPARQL query and yields the response without reading its body, e.g., to iterate over lines
+        or chunks of large results with constant memory. The connection is released when the context is left.
+
+        Keyword arguments:
+        sparql_query -- a query to execute on the endpoint
+        accept -- the requested result format (e.g., "text/tab-separated-values")
+        """
+        with track_query(sparql_query), measure_query("select", self.endpoint, sparql_query) as call:
+            response = self.session.post(self.endpoint, data={"query": sparql_query}, headers={"Accept": accept},
+                                         auth=self.auth, timeout=self.timeout, stream=True)
+            call.status = response.status_code
+            try:
+                response.raise_for_status()
+                yield response
+            finally:
+                # bytes read from the connection (before content decoding)
+                call.bytes_in = response.raw.tell()
+                response.close()
+
+    def fetch_text(self, url):
+        """
+        Retrieves a text resource (e.g., a raw question text) through the pooled session
+
+        Keyword arguments:
+        url -- URL of the resource
+        """
+        with measure_call("raw_text", url) as call:
+            response = self.session.get(url, timeout=self.timeout)
+            call.status = response.status_code
+            response.raise_for_status()
+            call.bytes_in = len(response.content)
+        return response.text
+
+    def select(self, sparql_query):
+        """
+        Executes a SELECT (or ASK) query and returns the result object
+
+        Keyword arguments:
+        sparql_query -- a query to execute on the endpoint
+        """
+        return self.query(sparql_query)
+
+    def update(self, sparql_query):
+        """
+        Executes an update (e.g., INSERT) and returns the result object
+
+        Keyword arguments:
+        sparql_query -- an update to execute on the endpoint
+        """
+        return self.query(sparql_query)
+
+
+_clients = {}
+_clients_by_url = {}
+_clients_lock = threading.Lock()
+
+
+def get_triplestore_client(triplestore_endpoint, **client_options) -> TriplestoreClient:
+    """
+    Returns the shared client for a triplestore endpoint, creating it on first use
+
+    Keyword arguments:
+    triplestore_endpoint -- URL of the triplestore endpoint
+    client_options -- options passed to TriplestoreClient when the client is created (ignored afterwards)
+    """
+    client = _clients_by_url.get(triplestore_endpoint)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients_by_url.get(triplestore_endpoint)
+        if client is None:
+            key = parse_triplestore_endpoint(triplestore_endpoint)
+            client = _clients.get(key)
+            if client is None:
+                client = TriplestoreClient(triplestore_endpoint, **client_options)
+                _clients[key] = client
+            _clients_by_url[triplestore_endpoint] = client
+    return client
+
+
+def close_triplestore_clients():
+    """Closes and forgets all shared triplestore clients (e.g., on component shutdown)"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _clients_by_url.clear()
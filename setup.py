@@ -39,5 +39,7 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     python_requires='>=3.7',
+    # the component server (qanary_helpers.component): pip install qanary-helpers[component]
+    extras_require={'component': ['fastapi', 'uvicorn']},
     **read_requirements()
 )
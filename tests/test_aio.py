@@ -0,0 +1,209 @@
+"""Tests for the asyncio API against a local aiohttp server that plays both the
+triplestore endpoint and the question /raw service."""
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from qanary_helpers import aio
+from qanary_helpers.text_cache import disable_question_text_cache, enable_question_text_cache
+
+QUESTIONS = {"1": "What is the capital of France?", "2": "Who wrote Faust?"}
+
+
+async def start_server(received):
+    async def sparql(request):
+        form = await request.post()
+        received.append(dict(form))
+        if "update" in form:
+            return web.Response(text="ok")
+        if request.headers.get("Accept") == "text/tab-separated-values":
+            return web.Response(text="?s\t?n\n<urn:q1>\t1\n<urn:q2>\t2\n", content_type="text/tab-separated-values")
+        port = request.url.port
+        if "VALUES ?graph" in form["query"]:
+            bindings = [{"graph": {"value": graph}, "questionURI": {"value": f"http://localhost:{port}/question/{key}"}}
+                        for graph, key in (("urn:g1", "1"), ("urn:g2", "2"))]
+        elif "UNION" in form["query"]:
+            bindings = [{"lang": {"value": "de"}, "hasTarget": {"value": "urn:q1"}, "translation": {"value": "Hallo"}},
+                        {"lang": {"value": "de"}, "hasTarget": {"value": f"http://localhost:{port}/question/2"}},
+                        {"lang": {"value": "en"}, "hasTarget": {"value": f"http://localhost:{port}/question/2"}}]
+        elif "AnnotationOfQuestionTranslation" in form["query"]:
+            bindings = [{"hasTarget": {"value": "urn:q1"}, "hasBody": {"value": "Hallo"}}]
+        elif "AnnotationOfQuestionLanguage" in form["query"]:
+            bindings = [{"hasTarget": {"value": f"http://localhost:{port}/question/2"}}]
+        else:
+            bindings = [{"questionURI": {"value": f"http://localhost:{port}/question/{key}"}} for key in QUESTIONS]
+        if "urn:broken" in form["query"]:
+            key = "hasTarget" if "AnnotationOfQuestionLanguage" in form["query"] else "questionURI"
+            bindings.append({key: {"value": f"http://localhost:{port}/missing/1"}})
+        return web.json_response({"results": {"bindings": bindings}}, content_type="application/sparql-results+json")
+
+    async def raw(request):
+        return web.Response(text=QUESTIONS[request.match_info["id"]])
+
+    app = web.Application()
+    app.router.add_post("/", sparql)
+    app.router.add_get("/question/{id}/raw", raw)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def run(coroutine_function):
+    async def main():
+        received = []
+        runner, endpoint = await start_server(received)
+        try:
+            return await coroutine_function(endpoint, received)
+        finally:
+            await aio.close_session()
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def test_get_text_question_in_graph_fetches_all_texts():
+    async def scenario(endpoint, received):
+        return await aio.get_text_question_in_graph(endpoint, "urn:graph")
+
+    questions = run(scenario)
+    assert [question["text"] for question in questions] == list(QUESTIONS.values())
+
+
+def test_get_text_question_in_graph_leaves_out_failed_texts(caplog):
+    errors = {}
+    questions = run(lambda endpoint, received: aio.get_text_question_in_graph(endpoint, "urn:broken", errors=errors))
+
+    assert [question["text"] for question in questions] == list(QUESTIONS.values())
+    assert [uri.rsplit("/", 2)[1:] for uri in errors] == [["missing", "1"]]
+    assert "is left out" in caplog.text
+
+
+def test_get_text_questions_from_uris_reports_errors():
+    async def scenario(endpoint, received):
+        port = endpoint.rsplit(":", 1)[1]
+        uris = [f"http://localhost:{port}/question/2", f"http://localhost:{port}/missing/1"]
+        return await aio.get_text_questions_from_uris(endpoint, uris, max_concurrency=1)
+
+    results = run(scenario)
+    assert results[0].text == "Who wrote Faust?"
+    assert results[1].text is None and results[1].error is not None
+
+
+def test_error_responses_are_not_cached():
+    cache = enable_question_text_cache(ttl=None)
+
+    async def scenario(endpoint, received):
+        port = endpoint.rsplit(":", 1)[1]
+        with pytest.raises(aiohttp.ClientResponseError) as error:
+            await aio.get_text_question_from_uri(endpoint, f"http://localhost:{port}/question/unknown")
+        return error.value.status
+
+    try:
+        assert run(scenario) == 500
+        assert len(cache) == 0
+    finally:
+        disable_question_text_cache()
+
+
+def test_iter_select_from_triplestore_streams_rows():
+    async def scenario(endpoint, received):
+        return [row async for row in aio.iter_select_from_triplestore(endpoint, "SELECT ?s ?n {}")]
+
+    assert [tuple(row) for row in run(scenario)] == [("urn:q1", 1), ("urn:q2", 2)]
+
+
+def test_insert_is_sent_as_update():
+    async def scenario(endpoint, received):
+        await aio.insert_into_triplestore(endpoint, "INSERT DATA { <urn:a> <urn:b> <urn:c> }")
+        return received
+
+    received = run(scenario)
+    assert received == [{"update": "INSERT DATA { <urn:a> <urn:b> <urn:c> }"}]
+
+
+def test_language_helpers():
+    async def scenario(endpoint, received):
+        detected = await aio.get_texts_with_detected_language_in_triplestore(endpoint, "urn:graph", "de")
+        translated = await aio.get_translated_texts_in_triplestore(endpoint, "urn:graph", "de")
+        return detected, translated
+
+    detected, translated = run(scenario)
+    assert [q.get_text() for q in detected] == ["Who wrote Faust?"]
+    assert [(q.get_uri(), q.get_text(), q.get_language()) for q in translated] == [("urn:q1", "Hallo", "de")]
+
+
+def test_detected_language_leaves_out_failed_texts():
+    errors = {}
+    detected = run(lambda endpoint, received: aio.get_texts_with_detected_language_in_triplestore(
+        endpoint, "urn:broken", "de", max_concurrency=1, errors=errors))
+
+    assert [q.get_text() for q in detected] == ["Who wrote Faust?"]
+    assert len(errors) == 1
+
+
+def test_texts_in_languages():
+    async def scenario(endpoint, received):
+        return await aio.get_texts_in_languages_in_triplestore(endpoint, "urn:graph", {"de", "en"}), received
+
+    texts, received = run(scenario)
+    assert {lang: [q.get_text() for q in questions] for lang, questions in texts.items()} == {
+        "de": ["Hallo", "Who wrote Faust?"], "en": ["Who wrote Faust?"]}
+    assert len(received) == 1
+
+
+def test_question_context_fetches_each_piece_once():
+    async def scenario(endpoint, received):
+        context = aio.QanaryQuestionContext.from_request(
+            {"values": {"urn:qanary#endpoint": endpoint, "urn:qanary#inGraph": "urn:graph"}})
+        texts = await asyncio.gather(*(context.get_question_text() for _ in range(5)))
+        return texts, await context.get_question_uri(), received
+
+    texts, question_uri, received = run(scenario)
+    assert texts == ["What is the capital of France?"] * 5
+    assert question_uri.endswith("/question/1")
+    assert len(received) == 1
+
+
+def test_session_is_shared_within_a_loop():
+    async def scenario():
+        session = aio.get_session()
+        assert aio.get_session() is session
+        await aio.close_session()
+        assert aio.get_session() is not session
+        await aio.close_session()
+
+    asyncio.run(scenario())
+
+
+def test_calls_are_instrumented():
+    from qanary_helpers.instrumentation import add_instrument, remove_instrument
+
+    records = []
+    add_instrument(records.append)
+    try:
+        run(lambda endpoint, received: aio.get_text_question_in_graph(endpoint, "urn:graph"))
+    finally:
+        remove_instrument(records.append)
+    assert [(record.operation, record.status) for record in records] == \
+        [("select", "200"), ("raw_text", "200"), ("raw_text", "200")]
+    assert records[0].template == "question_uris"
+    assert all(record.bytes_in > 0 for record in records)
+
+
+def test_prefetch_question_contexts_resolves_all_questions_with_one_query():
+    async def scenario(endpoint, received):
+        contexts = [aio.QanaryQuestionContext(endpoint, graph) for graph in ("urn:g1", "urn:g2", "urn:g3")]
+        await aio.prefetch_question_contexts(contexts)
+        queries = len(received)
+        texts = [await context.get_question_text() for context in contexts[:2]]
+        return queries, texts, len(received), contexts
+
+    queries, texts, total_queries, contexts = run(scenario)
+    assert queries == 1
+    assert texts == [QUESTIONS["1"], QUESTIONS["2"]]
+    assert total_queries == 1
+    assert "question_uri" not in contexts[2]._tasks
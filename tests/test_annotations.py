@@ -0,0 +1,144 @@
+"""Unit tests for the annotation model and AnnotationBatch (insert_into_triplestore
+faked). Generated updates are executed against an in-memory rdflib dataset to
+check that they are valid SPARQL and write the expected triples."""
+import pytest
+from rdflib import Dataset, Literal, URIRef
+from rdflib.namespace import XSD
+
+from qanary_helpers import annotations
+from qanary_helpers.annotations import (
+    OA,
+    QA,
+    Annotation,
+    AnnotationBatch,
+    AnswerSPARQLAnnotation,
+    InstanceAnnotation,
+    QuestionLanguageAnnotation,
+    QuestionTranslationAnnotation,
+    escape_iri,
+    escape_literal,
+)
+
+
+def execute(update):
+    dataset = Dataset()
+    dataset.update(update)
+    return dataset
+
+
+@pytest.fixture
+def inserts(monkeypatch):
+    inserts = []
+    monkeypatch.setattr(annotations, "insert_into_triplestore", lambda endpoint, query: inserts.append(query))
+    return inserts
+
+
+def test_flush_sends_one_update_for_all_annotations(inserts):
+    batch = AnnotationBatch("http://ts")
+    batch.add_question_language("urn:graph", "urn:q1", "de", "LD")
+    batch.add_question_translation("urn:graph", "urn:q1", "Hello", "en", "MT")
+    assert len(batch) == 2
+    assert batch.flush() == 10
+    assert len(inserts) == 1
+    assert "AnnotationOfQuestionLanguage" in inserts[0] and "AnnotationOfQuestionTranslation" in inserts[0]
+    assert len(execute(inserts[0]).graph(URIRef("urn:graph"))) == 10
+    assert batch.flush() == 0
+    assert batch.triples_written == 10
+
+
+def test_flush_size_triggers_flush(inserts):
+    batch = AnnotationBatch("http://ts", flush_size=2)
+    for i in range(5):
+        batch.add("INSERT DATA { <urn:s> <urn:p> %d }" % i, triples=1)
+    assert len(inserts) == 2
+    assert len(batch) == 1
+
+
+def test_context_manager_flushes_on_success_only(inserts):
+    with AnnotationBatch("http://ts") as batch:
+        batch.add("INSERT DATA { <urn:s> <urn:p> 1 }", triples=1)
+    assert len(inserts) == 1
+
+    with pytest.raises(RuntimeError):
+        with AnnotationBatch("http://ts") as batch:
+            batch.add("INSERT DATA { <urn:s> <urn:p> 2 }", triples=1)
+            raise RuntimeError()
+    assert len(inserts) == 1
+
+
+def test_failed_flush_keeps_annotations(monkeypatch):
+    def failing_insert(endpoint, query):
+        raise ConnectionError()
+
+    monkeypatch.setattr(annotations, "insert_into_triplestore", failing_insert)
+    batch = AnnotationBatch("http://ts")
+    batch.add("INSERT DATA { <urn:s> <urn:p> 1 }", triples=1)
+    with pytest.raises(ConnectionError):
+        batch.flush()
+    assert len(batch) == 1
+
+
+def test_batch_merges_annotations_and_raw_updates_across_graphs(inserts):
+    batch = AnnotationBatch("http://ts")
+    batch.add_annotation("urn:g1", QuestionLanguageAnnotation("urn:q1", "de", "LD"))
+    batch.add_annotation("urn:g2", InstanceAnnotation("urn:q2", "http://dbpedia.org/resource/Faust", 9, 14, "NER", 0.8))
+    batch.add("INSERT DATA { GRAPH <urn:g3> { <urn:s> <urn:p> <urn:o> } }", triples=1)
+    assert batch.flush() == 5 + 12 + 1
+
+    dataset = execute(inserts[0])
+    assert len(dataset.graph(URIRef("urn:g1"))) == 5
+    assert len(dataset.graph(URIRef("urn:g2"))) == 12
+    assert len(dataset.graph(URIRef("urn:g3"))) == 1
+
+
+def test_literals_and_iris_are_escaped():
+    assert escape_literal('say "hi"\n\\') == '"say \\"hi\\"\\n\\\\"'
+    assert escape_iri("urn:qanary:My App<1>") == "<urn:qanary:My%20App%3C1%3E>"
+
+
+def test_translation_with_special_characters_round_trips():
+    translation = 'He said "hello"\nand left \\o/'
+    update = QuestionTranslationAnnotation("urn:q1", translation, "en", "My Translator").to_insert_query("urn:graph")
+    graph = execute(update).graph(URIRef("urn:graph"))
+    assert list(graph.objects(predicate=URIRef(OA + "hasBody"))) == [Literal(translation, lang="en")]
+    assert list(graph.objects(predicate=URIRef(OA + "annotatedBy"))) == [URIRef("urn:qanary:My%20Translator")]
+
+
+def test_answer_sparql_annotation():
+    query = 'SELECT * WHERE { ?s ?p "o" }\n'
+    graph = execute(AnswerSPARQLAnnotation("urn:q1", query, "QB").to_insert_query("urn:graph")).graph(
+        URIRef("urn:graph"))
+    assert list(graph.objects(predicate=URIRef(OA + "hasBody"))) == [Literal(query, datatype=XSD.string)]
+    assert list(graph.objects(predicate=URIRef(QA + "score"))) == [Literal("1.0", datatype=XSD.float)]
+
+
+def test_scores_are_xsd_floats():
+    for score in (0.8, 1e-05, 1e+16):
+        update = InstanceAnnotation("urn:q1", "urn:r1", 0, 5, "NER", score).to_insert_query("urn:graph")
+        (literal,) = execute(update).graph(URIRef("urn:graph")).objects(predicate=URIRef(QA + "score"))
+        assert literal.datatype == XSD.float and literal.toPython() == score
+    for score in (float("nan"), float("inf")):
+        with pytest.raises(ValueError):
+            InstanceAnnotation("urn:q1", "urn:r1", 0, 5, "NER", score).to_insert_query("urn:graph")
+        with pytest.raises(ValueError):
+            AnswerSPARQLAnnotation("urn:q1", "SELECT * {}", "QB", score).to_insert_query("urn:graph")
+
+
+def test_body_triples_must_be_implemented():
+    class IncompleteAnnotation(Annotation):
+        annotation_type = "AnnotationOfIncomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteAnnotation()
+
+
+def test_invalid_language_tag_is_rejected():
+    with pytest.raises(ValueError):
+        QuestionTranslationAnnotation("urn:q1", "Hallo", "de DE", "MT").to_insert_query("urn:graph")
+
+
+def test_ntriples_use_full_iris():
+    ntriples = QuestionLanguageAnnotation("urn:q1", "en", "LD").to_ntriples()
+    assert "<http://www.wdaqua.eu/qa#AnnotationOfQuestionLanguage>" in ntriples
+    assert '"en"^^<http://www.w3.org/2001/XMLSchema#string>' in ntriples
+    assert len(ntriples.splitlines()) == 5
@@ -0,0 +1,240 @@
+"""Tests for the component server base: request handling, annotation writing,
+backpressure, health and graceful shutdown."""
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from qanary_helpers import aio
+from qanary_helpers.annotations import AnswerSPARQLAnnotation
+from qanary_helpers.component import QanaryComponent
+
+REQUEST = {"values": {"urn:qanary#endpoint": "http://ts:8080", "urn:qanary#inGraph": "urn:graph"}}
+
+
+class EchoComponent(QanaryComponent):
+    async def process(self, context):
+        self.contexts = getattr(self, "contexts", []) + [context]
+        return [AnswerSPARQLAnnotation("urn:q1", "SELECT * {}", self.app_name)]
+
+
+def test_annotate_question_writes_returned_annotations(monkeypatch):
+    updates = []
+
+    async def fake_insert(endpoint, query):
+        updates.append((endpoint, query))
+
+    monkeypatch.setattr(aio, "insert_into_triplestore", fake_insert)
+    component = EchoComponent("Echo Component", metrics=False)
+    with TestClient(component.app) as client:
+        response = client.post("/annotatequestion", json=REQUEST)
+        assert response.status_code == 200
+        assert response.json() == REQUEST
+    assert component.contexts[0].graph_uri == "urn:graph"
+    assert len(updates) == 1
+    assert updates[0][0] == "http://ts:8080"
+    assert "GRAPH <urn:graph>" in updates[0][1] and "urn:qanary:Echo-Component" in updates[0][1]
+
+
+def test_invalid_requests_and_failures():
+    class FailingComponent(QanaryComponent):
+        async def process(self, context):
+            raise RuntimeError("model failed")
+
+    with TestClient(FailingComponent("Failing").app) as client:
+        assert client.post("/annotatequestion", json={"values": {}}).status_code == 400
+        assert client.post("/annotatequestion", content=b"not json").status_code == 400
+        assert client.post("/annotatequestion", json=REQUEST).status_code == 500
+
+
+def test_health_and_metrics():
+    component = EchoComponent("Echo")
+    with TestClient(component.app) as client:
+        assert client.get("/health").text == "alive"
+        assert client.get("/metrics").status_code == 200
+    assert component.accepting is False
+
+
+def test_requests_beyond_max_in_flight_are_rejected():
+    release = asyncio.Event()
+
+    class SlowComponent(QanaryComponent):
+        async def process(self, context):
+            await release.wait()
+
+    component = SlowComponent("Slow", max_in_flight=2, metrics=False)
+
+    async def scenario():
+        async with component._lifespan(component.app):
+            transport = httpx.ASGITransport(app=component.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://component") as client:
+                pending = [asyncio.ensure_future(client.post("/annotatequestion", json=REQUEST)) for _ in range(2)]
+                while component.in_flight < 2:
+                    await asyncio.sleep(0.01)
+                rejected = await client.post("/annotatequestion", json=REQUEST)
+                release.set()
+                accepted = await asyncio.gather(*pending)
+        return rejected, accepted
+
+    rejected, accepted = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+    assert [response.status_code for response in accepted] == [200, 200]
+
+
+def test_shutdown_waits_for_requests_in_flight():
+    events = []
+
+    class SlowComponent(QanaryComponent):
+        async def process(self, context):
+            await asyncio.sleep(0.1)
+            events.append("processed")
+
+        async def shutdown(self):
+            events.append("shutdown")
+
+    component = SlowComponent("Slow", metrics=False)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=component.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://component") as client:
+            async with component._lifespan(component.app):
+                pending = asyncio.ensure_future(client.post("/annotatequestion", json=REQUEST))
+                while component.in_flight < 1:
+                    await asyncio.sleep(0.01)
+            return await pending
+
+    assert asyncio.run(scenario()).status_code == 200
+    assert events == ["processed", "shutdown"]
+
+
+def test_registration():
+    component = EchoComponent("Echo", description="echoes", service_url="http://echo:5000", metadata={"a": 1})
+    registration = component.registration()
+    assert registration.healthUrl == "http://echo:5000/health"
+    assert registration.metadata["description"] == "echoes" and registration.metadata["a"] == 1
+
+
+def test_from_env_requires_the_component_settings(monkeypatch):
+    for variable in ("SERVICE_NAME_COMPONENT", "SERVICE_HOST", "SPRING_BOOT_ADMIN_URL"):
+        monkeypatch.delenv(variable, raising=False)
+    with pytest.raises(KeyError, match="SERVICE_NAME_COMPONENT"):
+        EchoComponent.from_env()
+
+    monkeypatch.setenv("SERVICE_NAME_COMPONENT", "Echo")
+    monkeypatch.setenv("SPRING_BOOT_ADMIN_URL", "http://pipeline:8080")
+    with pytest.raises(KeyError, match="SERVICE_HOST"):
+        EchoComponent.from_env()
+    assert EchoComponent.from_env(service_url="http://echo:5000").app_name == "Echo"
+
+
+def test_process_must_be_implemented():
+    class IncompleteComponent(QanaryComponent):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteComponent("Incomplete")
+
+
+def test_executor_lifecycle_and_full_queue():
+    class FullExecutor:
+        events = []
+
+        async def start(self):
+            self.events.append("start")
+
+        async def close(self, timeout=None):
+            self.events.append("close")
+
+        async def submit(self, item):
+            raise asyncio.QueueFull()
+
+    class ModelComponent(QanaryComponent):
+        async def process(self, context):
+            return await self.executor.submit(context.graph_uri)
+
+    component = ModelComponent("Model", metrics=False, executor=FullExecutor())
+    with TestClient(component.app) as client:
+        response = client.post("/annotatequestion", json=REQUEST)
+    assert response.status_code == 503
+    assert FullExecutor.events == ["start", "close"]
+
+
+def test_failed_startup_stops_the_executor(monkeypatch):
+    events = []
+
+    class Executor:
+        async def start(self):
+            events.append("start")
+
+        async def close(self, timeout=None):
+            events.append("close")
+
+    class BrokenComponent(EchoComponent):
+        async def startup(self):
+            raise RuntimeError("model not found")
+
+        async def shutdown(self):
+            events.append("shutdown")
+
+    async def close_session():
+        events.append("close_session")
+
+    monkeypatch.setattr(aio, "close_session", close_session)
+    component = BrokenComponent("Broken", metrics=False, executor=Executor())
+    with pytest.raises(RuntimeError, match="model not found"):
+        with TestClient(component.app):
+            pass
+    assert events == ["start", "close", "close_session"]
+
+
+def test_concurrent_requests_are_processed_as_one_batch(monkeypatch):
+    prefetched, updates = [], []
+
+    async def fake_prefetch(contexts):
+        prefetched.append([context.graph_uri for context in contexts])
+
+    async def fake_insert(endpoint, query):
+        updates.append(query)
+
+    monkeypatch.setattr(aio, "prefetch_question_contexts", fake_prefetch)
+    monkeypatch.setattr(aio, "insert_into_triplestore", fake_insert)
+
+    class BatchedComponent(QanaryComponent):
+        async def process(self, context):
+            if context.graph_uri == "urn:broken":
+                raise RuntimeError("model failed")
+            return [AnswerSPARQLAnnotation("urn:q", "SELECT * {}", self.app_name)]
+
+    component = BatchedComponent("Batched", metrics=False, batch_window=0.05, max_batch_size=10)
+    graphs = ["urn:g1", "urn:g2", "urn:broken", "urn:g3"]
+
+    async def scenario():
+        async with component._lifespan(component.app):
+            transport = httpx.ASGITransport(app=component.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://component") as client:
+                return await asyncio.gather(*(client.post("/annotatequestion", json={"values": {
+                    "urn:qanary#endpoint": "http://ts:8080", "urn:qanary#inGraph": graph}}) for graph in graphs))
+
+    responses = asyncio.run(scenario())
+    assert [response.status_code for response in responses] == [200, 200, 500, 200]
+    assert prefetched == [graphs]
+    assert len(updates) == 1
+    assert all("GRAPH <{0}>".format(graph) in updates[0] for graph in ("urn:g1", "urn:g2", "urn:g3"))
+    assert "urn:broken" not in updates[0]
+    assert component._batcher.batches == 1
+
+
+def test_failed_batch_write_fails_the_requests_with_annotations(monkeypatch):
+    async def fake_prefetch(contexts):
+        pass
+
+    async def failing_insert(endpoint, query):
+        raise ConnectionError("triplestore unavailable")
+
+    monkeypatch.setattr(aio, "prefetch_question_contexts", fake_prefetch)
+    monkeypatch.setattr(aio, "insert_into_triplestore", failing_insert)
+    component = EchoComponent("Echo", metrics=False, batch_window=0.01)
+    with TestClient(component.app) as client:
+        assert client.post("/annotatequestion", json=REQUEST).status_code == 500
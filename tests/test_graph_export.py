@@ -0,0 +1,100 @@
+"""Unit tests for the streaming graph export (the triplestore's CONSTRUCT
+responses are faked from an ordered list of N-Triples lines)."""
+import re
+from contextlib import contextmanager
+
+import pytest
+
+from qanary_helpers.graph_export import TURTLE, construct_graph_query, export_graph_to_file, iter_graph_export
+from qanary_helpers.triplestore import TriplestoreClient, close_triplestore_clients
+
+LINES = [b"<urn:s%02d> <urn:p> \"o\" .\n" % i for i in range(10)]
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    queries = []
+
+    class FakeResponse:
+        def __init__(self, data):
+            self.data = data
+
+        def iter_content(self, chunk_size):
+            return (self.data[i:i + chunk_size] for i in range(0, len(self.data), chunk_size))
+
+    @contextmanager
+    def fake_stream_query(self, sparql_query, accept):
+        queries.append(sparql_query)
+        limit = re.search(r"LIMIT (\d+)", sparql_query)
+        offset = re.search(r"OFFSET (\d+)", sparql_query)
+        start = int(offset.group(1)) if offset else 0
+        end = start + int(limit.group(1)) if limit else len(LINES)
+        yield FakeResponse(b"".join(LINES[start:end]))
+
+    def fake_select(self, sparql_query):
+        queries.append(sparql_query)
+        return {"boolean": False}
+
+    close_triplestore_clients()
+    monkeypatch.setattr(TriplestoreClient, "stream_query", fake_stream_query)
+    monkeypatch.setattr(TriplestoreClient, "select", fake_select)
+    yield queries
+    close_triplestore_clients()
+
+
+def test_construct_graph_query():
+    query = construct_graph_query("urn:graph", limit=5, offset=10)
+    assert "GRAPH <urn:graph>" in query
+    assert "ORDER BY ?s ?p ?o" in query
+    assert "LIMIT 5" in query and "OFFSET 10" in query
+
+
+def test_export_in_chunks(queries):
+    chunks = list(iter_graph_export("http://ts", "urn:graph", chunk_size=7))
+    assert max(len(chunk) for chunk in chunks) <= 7
+    assert b"".join(chunks) == b"".join(LINES)
+    assert len(queries) == 1
+
+
+def test_paged_export(queries):
+    chunks = list(iter_graph_export("http://ts", "urn:graph", page_size=4, start_page=1))
+    assert b"".join(chunks) == b"".join(LINES[4:])
+    assert "isBlank" in queries[0]
+    assert len(queries) == 3
+
+
+def test_paged_export_rejects_blank_nodes(monkeypatch):
+    monkeypatch.setattr(TriplestoreClient, "select", lambda self, sparql_query: {"boolean": True})
+    with pytest.raises(ValueError, match="blank nodes"):
+        list(iter_graph_export("http://ts", "urn:graph", page_size=4))
+
+
+def test_paged_export_requires_ntriples(queries):
+    with pytest.raises(ValueError):
+        list(iter_graph_export("http://ts", "urn:graph", rdf_format=TURTLE, page_size=4))
+
+
+def test_resume_requires_paged_ntriples(queries, tmp_path):
+    path = tmp_path / "graph.nt"
+    path.write_bytes(b"".join(LINES)[:50])
+    with pytest.raises(ValueError):
+        export_graph_to_file("http://ts", "urn:graph", str(path), resume=True)
+    with pytest.raises(ValueError):
+        export_graph_to_file("http://ts", "urn:graph", str(path), rdf_format=TURTLE, resume=True, page_size=4)
+    assert path.read_bytes() == b"".join(LINES)[:50]
+
+
+def test_export_to_file_resumes_paged_export(queries, tmp_path):
+    path = tmp_path / "graph.nt"
+    # 5 complete triples and a partial one: page 1 (triples 4-7) is fetched again
+    path.write_bytes(b"".join(LINES[:5]) + LINES[5][:10])
+    export_graph_to_file("http://ts", "urn:graph", str(path), resume=True, page_size=4)
+    assert path.read_bytes() == b"".join(LINES)
+    assert "OFFSET 4" in queries[1]
+
+
+def test_export_to_file_overwrites_without_resume(queries, tmp_path):
+    path = tmp_path / "graph.nt"
+    path.write_bytes(b"old content")
+    export_graph_to_file("http://ts", "urn:graph", str(path))
+    assert path.read_bytes() == b"".join(LINES)
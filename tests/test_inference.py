@@ -0,0 +1,109 @@
+"""Tests for the process pool inference executor: per-worker initialization,
+batching, backpressure and error propagation."""
+import asyncio
+import os
+import time
+
+import pytest
+
+from qanary_helpers.inference import InferenceExecutor
+
+
+def load_model(name):
+    return {"name": name, "pid": os.getpid()}
+
+
+def predict(model, items):
+    return [(model["name"], model["pid"], len(items), item.upper()) for item in items]
+
+
+def slow_predict(model, items):
+    time.sleep(0.2)
+    return items
+
+
+def hung_predict(model, items):
+    time.sleep(60)
+    return items
+
+
+def broken_predict(model, items):
+    if "fail" in items:
+        raise RuntimeError("model failed")
+    return items[1:]
+
+
+def run(executor, scenario):
+    async def main():
+        await executor.start()
+        try:
+            return await scenario()
+        finally:
+            await executor.close()
+    return asyncio.run(main())
+
+
+def test_concurrent_items_are_batched_in_warm_workers():
+    executor = InferenceExecutor(predict, initializer=load_model, initargs=("ner",), max_workers=1,
+                                 max_batch_size=4, max_batch_delay=0.05)
+    items = ["a", "b", "c", "d", "e"]
+    results = run(executor, lambda: asyncio.gather(*(executor.submit(item) for item in items)))
+
+    assert [result[3] for result in results] == ["A", "B", "C", "D", "E"]
+    assert {result[0] for result in results} == {"ner"}
+    assert {result[1] for result in results} != {os.getpid()}
+    assert [result[2] for result in results] == [4, 4, 4, 4, 1]
+    assert executor.batches == 2
+
+
+def test_submit_raises_queue_full_beyond_max_queue_size():
+    executor = InferenceExecutor(slow_predict, max_workers=1, max_batch_size=1, max_queue_size=1)
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.submit("running"))
+        await asyncio.sleep(0)
+        while executor.queue_size:
+            await asyncio.sleep(0.01)
+        waiting = asyncio.ensure_future(executor.submit("waiting"))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.QueueFull):
+            await executor.submit("rejected")
+        return await asyncio.gather(running, waiting)
+
+    assert run(executor, scenario) == ["running", "waiting"]
+
+
+def test_errors_are_propagated_to_the_batch():
+    executor = InferenceExecutor(broken_predict, max_workers=1, max_batch_size=1)
+
+    async def scenario():
+        with pytest.raises(RuntimeError, match="model failed"):
+            await executor.submit("fail")
+        with pytest.raises(ValueError):
+            await executor.submit("ok")
+
+    run(executor, scenario)
+
+
+def test_close_fails_pending_items_after_timeout():
+    executor = InferenceExecutor(hung_predict, max_workers=1, max_batch_size=1)
+
+    async def main():
+        await executor.start()
+        running = asyncio.ensure_future(executor.submit("running"))
+        waiting = asyncio.ensure_future(executor.submit("waiting"))
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        completed = await executor.close(timeout=0.2)
+        results = await asyncio.gather(running, waiting, return_exceptions=True)
+        return completed, time.monotonic() - started, results
+
+    completed, duration, results = asyncio.run(main())
+    assert not completed
+    assert duration < 5
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_submit_requires_start():
+    with pytest.raises(RuntimeError):
+        asyncio.run(InferenceExecutor(predict).submit("a"))
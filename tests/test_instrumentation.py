@@ -0,0 +1,111 @@
+"""Unit tests for the instrumentation of outbound calls: measurement,
+histogram collection, Prometheus export and the /metrics route."""
+import pytest
+
+from qanary_helpers.instrumentation import (
+    CallRecord,
+    HistogramCollector,
+    add_instrument,
+    export_prometheus,
+    measure_call,
+    mount_metrics,
+    remove_instrument,
+)
+
+
+@pytest.fixture
+def records():
+    records = []
+    add_instrument(records.append)
+    yield records
+    remove_instrument(records.append)
+
+
+def test_measure_call_reports_status_and_bytes(records):
+    with measure_call("raw_text", "http://ts/q/1/raw", bytes_out=3) as call:
+        call.status = 200
+        call.bytes_in = 42
+    record = records[-1]
+    assert (record.operation, record.target, record.bytes_out, record.bytes_in, record.status) == \
+        ("raw_text", "http://ts/q/1/raw", 3, 42, "200")
+    assert record.duration >= 0
+
+
+def test_measure_call_reports_exceptions(records):
+    with pytest.raises(ConnectionError):
+        with measure_call("select", "http://ts"):
+            raise ConnectionError()
+    assert records[-1].status == "ConnectionError"
+
+
+def test_failing_instrument_does_not_fail_the_call(records, caplog):
+    def broken(record):
+        raise RuntimeError("broken")
+
+    add_instrument(broken)
+    try:
+        with measure_call("select", "http://ts") as call:
+            call.status = 200
+    finally:
+        remove_instrument(broken)
+    assert records[-1].status == "200"
+    assert "broken" in caplog.text
+
+
+def test_client_calls_are_measured(records, monkeypatch):
+    from qanary_helpers.qanary_queries import _question_uris_query
+    from qanary_helpers.triplestore import TriplestoreClient
+
+    class FakeResponse:
+        headers = {"Content-Type": "application/sparql-results+json"}
+        status_code = 200
+        content = b'{"results": {"bindings": []}}'
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"results": {"bindings": []}}
+
+    client = TriplestoreClient("http://ts:8080")
+    monkeypatch.setattr(client.session, "post", lambda *args, **kwargs: FakeResponse())
+    query = _question_uris_query("urn:graph")
+    client.query(query)
+    client.close()
+    assert records[-1] == records[-1]._replace(operation="select", target="http://ts:8080",
+                                               bytes_out=len(query.encode()), bytes_in=len(FakeResponse.content),
+                                               status="200", template="question_uris")
+
+
+def test_histogram_collector_and_prometheus_export():
+    collector = HistogramCollector(buckets=(0.1, 1.0))
+    collector(CallRecord("select", "http://ts", 0.05, 10, 100, "200", "question_uris"))
+    collector(CallRecord("select", "http://ts", 0.5, 10, 200, "200", "question_uris"))
+    collector(CallRecord("update", "http://ts", 5.0, 30, 0, "500"))
+
+    snapshot = collector.snapshot()
+    assert snapshot["select", "question_uris", "200"]["buckets"] == [1, 2, 2]
+    assert snapshot["select", "question_uris", "200"]["bytes_in"] == 300
+
+    text = export_prometheus(collector)
+    labels = 'operation="select",template="question_uris",status="200"'
+    assert "# TYPE qanary_outbound_call_duration_seconds histogram" in text
+    assert 'qanary_outbound_call_duration_seconds_bucket{%s,le="0.1"} 1' % labels in text
+    assert 'qanary_outbound_call_duration_seconds_bucket{%s,le="+Inf"} 2' % labels in text
+    assert "qanary_outbound_call_duration_seconds_count{%s} 2" % labels in text
+    assert "qanary_outbound_response_bytes_total{%s} 300" % labels in text
+    assert 'qanary_outbound_request_bytes_total{operation="update",template="",status="500"} 30' in text
+
+
+def test_mount_metrics():
+    fastapi = pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+
+    collector = HistogramCollector()
+    collector(CallRecord("registration", "http://admin/instances", 0.2, 100, 20, "201"))
+    app = fastapi.FastAPI()
+    mount_metrics(app, collector=collector)
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'operation="registration"' in response.text
@@ -1,6 +1,12 @@
 """Unit tests for language_queries: the value object, the SPARQL annotation
 builders, and the triplestore-reading helpers (with select_from_triplestore
 faked)."""
+import dataclasses
+import pickle
+
+import pytest
+import rdflib
+
 from qanary_helpers import language_queries as lq
 from qanary_helpers.language_queries import QuestionTextWithLanguage
 
@@ -12,6 +18,26 @@ def test_question_text_with_language_getters():
     assert q.get_language() == "de"
 
 
+def test_question_text_with_language_is_an_immutable_value():
+    q = QuestionTextWithLanguage("urn:q", "Hallo", "de")
+    assert q == QuestionTextWithLanguage(uri="urn:q", text="Hallo", lang="de")
+    assert len({q, QuestionTextWithLanguage("urn:q", "Hallo", "de")}) == 1
+    assert not hasattr(q, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        q.text = "Hello"
+    assert pickle.loads(pickle.dumps(q)) == q
+
+
+def test_question_text_with_language_from_bindings():
+    bindings = [
+        {"hasTarget": {"value": "urn:q1"}, "hasBody": {"value": "Hello", "xml:lang": "en"}},
+        {"hasTarget": {"value": "urn:q2"}, "hasBody": {"value": "Bonjour", "xml:lang": "fr"}},
+    ]
+    assert QuestionTextWithLanguage.from_bindings(bindings) == [
+        QuestionTextWithLanguage("urn:q1", "Hello", "en"), QuestionTextWithLanguage("urn:q2", "Bonjour", "fr")]
+    assert [q.lang for q in QuestionTextWithLanguage.from_bindings(bindings, "de")] == ["de", "de"]
+
+
 def test_create_annotation_of_question_translation_contains_fields():
     query = lq.create_annotation_of_question_translation(
         graph_uri="urn:graph",
@@ -63,3 +89,117 @@ def test_get_translated_texts(monkeypatch):
     assert len(result) == 1
     assert result[0].get_text() == "Hello"
     assert result[0].get_language() == "en"
+
+
+def test_get_texts_with_detected_language_bulk_reports_failed(monkeypatch, caplog):
+    from qanary_helpers.qanary_queries import QuestionTextResult
+
+    monkeypatch.setattr(
+        lq, "select_from_triplestore",
+        lambda ep, q: {"results": {"bindings": [{"hasTarget": {"value": "urn:q1"}},
+                                                {"hasTarget": {"value": "urn:q2"}}]}},
+    )
+    monkeypatch.setattr(lq, "get_text_questions_from_uris", lambda ep, uris, max_workers: [
+        QuestionTextResult("urn:q1", "Bonjour"), QuestionTextResult("urn:q2", None, ValueError())])
+    errors = {}
+    result = lq.get_texts_with_detected_language_in_triplestore("http://ts", "urn:graph", "fr", max_workers=2,
+                                                                errors=errors)
+    assert [(q.get_uri(), q.get_text()) for q in result] == [("urn:q1", "Bonjour")]
+    assert list(errors) == ["urn:q2"] and isinstance(errors["urn:q2"], ValueError)
+    assert any(record.levelname == "WARNING" and "urn:q2" in record.getMessage() for record in caplog.records)
+
+
+def test_get_detected_languages_of_question(monkeypatch):
+    queries = []
+    monkeypatch.setattr(lq, "select_from_triplestore", lambda ep, q: queries.append(q) or {
+        "results": {"bindings": [{"hasBody": {"value": "de"}}]}})
+    assert lq.get_detected_languages_of_question("http://ts", "urn:graph", "urn:q1") == ["de"]
+    assert "<urn:q1>" in queries[0]
+
+
+def test_get_translations_of_question(monkeypatch):
+    monkeypatch.setattr(lq, "select_from_triplestore", lambda ep, q: {"results": {"bindings": [
+        {"hasBody": {"type": "literal", "value": "Hello", "xml:lang": "en"}}]}})
+    result = lq.get_translations_of_question("http://ts", "urn:graph", "urn:q1")
+    assert [(q.get_uri(), q.get_text(), q.get_language()) for q in result] == [("urn:q1", "Hello", "en")]
+
+
+def test_get_texts_with_detected_language_projects_and_deduplicates(monkeypatch):
+    queries = []
+    monkeypatch.setattr(lq, "select_from_triplestore", lambda ep, q: queries.append(q) or {"results": {"bindings": [
+        {"hasTarget": {"value": "urn:q1"}},
+        {"hasTarget": {"value": "urn:q2"}, "text": {"value": "Bonjour"}},
+        {"hasTarget": {"value": "urn:q1"}},
+    ]}})
+    fetched = []
+    monkeypatch.setattr(lq, "get_text_question_from_uri",
+                        lambda triplestore_endpoint, question_uri: fetched.append(question_uri) or "Salut")
+    result = lq.get_texts_with_detected_language_in_triplestore("http://ts", "urn:graph", "fr",
+                                                                text_predicate="urn:hasText")
+    assert [(q.get_uri(), q.get_text()) for q in result] == [("urn:q1", "Salut"), ("urn:q2", "Bonjour")]
+    assert fetched == ["urn:q1"]
+    assert "SELECT DISTINCT ?hasTarget ?text" in queries[0]
+    assert "OPTIONAL { ?hasTarget <urn:hasText> ?text }" in queries[0]
+    assert "annotatedBy" not in queries[0]
+
+
+def test_get_texts_in_languages_shares_text_fetches(monkeypatch):
+    queries = []
+    monkeypatch.setattr(lq, "select_from_triplestore", lambda ep, q: queries.append(q) or {"results": {"bindings": [
+        {"lang": {"value": "en"}, "hasTarget": {"value": "urn:q1"}},
+        {"lang": {"value": "en"}, "hasTarget": {"value": "urn:q2"},
+         "translation": {"type": "literal", "value": "Hello", "xml:lang": "en"}},
+        {"lang": {"value": "de"}, "hasTarget": {"value": "urn:q1"}},
+    ]}})
+    fetched = []
+    monkeypatch.setattr(lq, "get_text_question_from_uri",
+                        lambda triplestore_endpoint, question_uri: fetched.append(question_uri) or "Hallo Welt")
+    result = lq.get_texts_in_languages_in_triplestore("http://ts", "urn:graph", {"en", "de", "fr"})
+    assert result == {
+        "en": [QuestionTextWithLanguage("urn:q2", "Hello", "en"), QuestionTextWithLanguage("urn:q1", "Hallo Welt", "en")],
+        "de": [QuestionTextWithLanguage("urn:q1", "Hallo Welt", "de")],
+        "fr": [],
+    }
+    assert fetched == ["urn:q1"]
+    assert len(queries) == 1
+    assert 'IN ("de", "en", "fr")' in queries[0]
+
+
+def test_get_texts_in_languages_bulk_reports_failed(monkeypatch, caplog):
+    from qanary_helpers.qanary_queries import QuestionTextResult
+
+    monkeypatch.setattr(lq, "select_from_triplestore", lambda ep, q: {"results": {"bindings": [
+        {"lang": {"value": "en"}, "hasTarget": {"value": "urn:q1"}},
+        {"lang": {"value": "de"}, "hasTarget": {"value": "urn:q2"}},
+    ]}})
+    monkeypatch.setattr(lq, "get_text_questions_from_uris", lambda ep, uris, max_workers: [
+        QuestionTextResult("urn:q1", "Hello"), QuestionTextResult("urn:q2", None, ConnectionError())])
+    errors = {}
+    result = lq.get_texts_in_languages_in_triplestore("http://ts", "urn:graph", {"en", "de"}, max_workers=2,
+                                                      errors=errors)
+    assert result == {"en": [QuestionTextWithLanguage("urn:q1", "Hello", "en")], "de": []}
+    assert list(errors) == ["urn:q2"]
+    assert any(record.levelname == "WARNING" and "urn:q2" in record.getMessage() for record in caplog.records)
+
+
+def test_texts_in_languages_query_matches_both_annotation_types():
+    graph = rdflib.Graph()
+    graph.parse(format="turtle", data="""
+        @prefix qa: <http://www.wdaqua.eu/qa#> .
+        @prefix oa: <http://www.w3.org/ns/openannotation/core/> .
+        <urn:a1> a qa:AnnotationOfQuestionTranslation ; oa:hasTarget <urn:q1> ; oa:hasBody "Hello"@en ;
+                 oa:annotatedBy <urn:qanary:translator> ; oa:annotatedAt "2024-01-01T00:00:00Z" .
+        <urn:a2> a qa:AnnotationOfQuestionTranslation ; oa:hasTarget <urn:q1> ; oa:hasBody "Bonjour"@fr ;
+                 oa:annotatedBy <urn:qanary:translator> ; oa:annotatedAt "2024-01-01T00:00:00Z" .
+        <urn:a3> a qa:AnnotationOfQuestionLanguage ; oa:hasTarget <urn:q1> ; oa:hasBody "de" .
+        <urn:a4> a qa:AnnotationOfQuestionLanguage ; oa:hasTarget <urn:q2> ; oa:hasBody "it" .
+        <urn:a5> a qa:AnnotationOfQuestionTranslation ; oa:hasTarget <urn:q2> ; oa:hasBody "Goodbye"@en .
+    """)
+    query = lq._texts_in_languages_query("urn:graph", {"en", "de"}).replace("FROM <urn:graph>", "")
+    rows = {(str(row.lang), str(row.hasTarget), None if row.translation is None else str(row.translation))
+            for row in graph.query(query)}
+    assert rows == {("en", "urn:q1", "Hello"), ("de", "urn:q1", None)}
+
+    # the same translations as the per-language query
+    query = lq._translated_texts_query("urn:graph", "en").replace("FROM <urn:graph>", "")
+    assert {(str(row.hasTarget), str(row.hasBody)) for row in graph.query(query)} == {("urn:q1", "Hello")}
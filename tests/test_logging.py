@@ -1,8 +1,14 @@
+import asyncio
+import gzip
+import hashlib
+import json
 import unittest
-from qanary_helpers.logging import MLFlowLogger
+from qanary_helpers.logging import AsyncMLFlowLogger, MLFlowLogger
+from qanary_helpers.logging.component_logging import ANNOTATION_EXPERIMENT, log_batch
 import mlflow
 import os
 from subprocess import Popen
+from uuid import uuid4
 
 
 class MyTestCase(unittest.TestCase):
@@ -53,9 +59,31 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(8, len(run.data.params))
         self.assertEqual('test:latest', run.data.params['model_uuid'])
         self.assertEqual('CPU', run.data.params['hardware'])
+        self.assertEqual({'acc': 0.9, 'F1': 0.7}, run.data.metrics)
+
+    def test_unchanged_datasets_are_uploaded_once(self):
+        logger = MLFlowLogger(deduplicate_datasets=True)
+        train = f'{uuid4()}\n0,1\n2,3'
+        run_ids = [logger.log_train_results('test:latest', train, 'test dataset', {}, {}, {'acc': 0.9},
+                                            'basic_component', 'NED', 'CPU', 'SVM', 1.0) for _ in range(2)]
+
+        self.assertEqual(f'runs:/{run_ids[0]}/datasets/dataset_train.txt',
+                         logger.artifact_uri(run_ids[1], 'datasets/dataset_train.txt'))
+        self.assertEqual([], mlflow.artifacts.list_artifacts(run_id=run_ids[1], artifact_path='datasets'))
+        self.assertEqual(mlflow.get_run(run_ids[0]).data.tags['artifact_sha256.datasets/dataset_train.txt'],
+                         hashlib.sha256(train.encode('utf-8')).hexdigest())
+
+    def test_compressed_artifact_from_iterable(self):
+        with self.logger.start_run(ANNOTATION_EXPERIMENT) as run_id:
+            artifact_uri = self.logger.log_artifact_data(run_id, (f'line {i}\n' for i in range(1000)),
+                                                         'data/lines.txt', compression='gzip')
+
+        self.assertEqual(f'runs:/{run_id}/data/lines.txt.gz', artifact_uri)
+        with gzip.open(mlflow.artifacts.download_artifacts(artifact_uri=artifact_uri), 'rt') as f:
+            self.assertEqual(''.join(f'line {i}\n' for i in range(1000)), f.read())
 
     def test_test_logging(self):
-        run_ids = self.logger.log_test_results([
+        run_id = self.logger.log_test_results([
             {
                 'input': 'How much is the fish?',
                 'true_target': {'value': 'Scooter'},
@@ -72,15 +100,17 @@ class MyTestCase(unittest.TestCase):
             }
         ])
 
-        self.assertEqual(2, len(run_ids))
-
-        run = mlflow.get_run(run_ids[0])
+        run = mlflow.get_run(run_id)
 
-        artifact_uri = run.info.artifact_uri
-        load_dict = mlflow.artifacts.load_dict(f'{artifact_uri}/true_target.json')
+        artifact = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path='test_results.jsonl')
+        with open(artifact) as f:
+            questions = [json.loads(line) for line in f]
 
-        self.assertEqual(3, len(run.data.params))
-        self.assertEqual({'value': 'Scooter'}, load_dict)
+        self.assertEqual(2, len(questions))
+        self.assertEqual({'value': 'Scooter'}, questions[0]['true_target'])
+        self.assertEqual('Who made Thriller?', questions[1]['input'])
+        self.assertEqual('MusicianAnnotator:latest', run.data.params['model_uuid'])
+        self.assertEqual(2, run.data.metrics['questions'])
 
     def test_annotation_logging(self):
         run_id = self.logger.log_annotation('MusicianAnnotator:latest', 'How much is the fish?', 'Scooter',
@@ -89,6 +119,73 @@ class MyTestCase(unittest.TestCase):
         run = mlflow.get_run(run_id)
 
         self.assertEqual(4, len(run.data.params))
+        self.assertEqual(self.logger.experiment_id(ANNOTATION_EXPERIMENT), run.info.experiment_id)
+        self.assertEqual(ANNOTATION_EXPERIMENT, mlflow.get_experiment(run.info.experiment_id).name)
+        self.assertEqual('FINISHED', run.info.status)
+
+    def test_parallel_annotation_logging(self):
+        async_logger = AsyncMLFlowLogger(self.logger, max_workers=4)
+
+        async def log_annotations():
+            return await asyncio.gather(*(async_logger.log_annotation('MusicianAnnotator:latest', f'Question {i}?',
+                                                                      f'Target {i}', f'graph-{i}')
+                                          for i in range(8)))
+
+        try:
+            run_ids = asyncio.run(log_annotations())
+        finally:
+            async_logger.close()
+
+        self.assertEqual(8, len(set(run_ids)))
+        for i, run_id in enumerate(run_ids):
+            run = mlflow.get_run(run_id)
+            self.assertEqual(f'Question {i}?', run.data.params['input'])
+            self.assertEqual(f'Target {i}', run.data.params['predicted_target'])
+
+    def test_failed_run_is_terminated_as_failed(self):
+        with self.assertRaises(RuntimeError):
+            with self.logger.start_run(ANNOTATION_EXPERIMENT) as run_id:
+                raise RuntimeError('component failed')
+
+        self.assertEqual('FAILED', mlflow.get_run(run_id).info.status)
+
+
+class LogBatchTestCase(unittest.TestCase):
+    def test_log_batch_splits_requests_at_the_batch_limits(self):
+        class FakeClient:
+            batches = []
+
+            def log_batch(self, run_id, metrics=(), params=(), tags=()):
+                self.batches.append((run_id, len(metrics), len(params), len(tags)))
+
+        log_batch(FakeClient(), 'run', params={f'p{i}': i for i in range(250)}, metrics={'acc': 0.9},
+                  tags={'source': 'test'})
+
+        self.assertEqual([('run', 1, 100, 1), ('run', 0, 100, 0), ('run', 0, 50, 0)], FakeClient.batches)
+
+
+class ExperimentCacheTestCase(unittest.TestCase):
+    def test_experiment_ids_are_resolved_once(self):
+        class FakeClient:
+            calls = []
+
+            def get_experiment_by_name(self, name):
+                self.calls.append(('get', name))
+                return None
+
+            def create_experiment(self, name):
+                self.calls.append(('create', name))
+                return f'id-{name}'
+
+        logger = MLFlowLogger()
+        logger.client = FakeClient()
+
+        for _ in range(3):
+            self.assertEqual('id-Training', logger.experiment_id('Training'))
+        self.assertEqual('id-Testing', logger.experiment_id('Testing'))
+
+        self.assertEqual([('get', 'Training'), ('create', 'Training'), ('get', 'Testing'), ('create', 'Testing')],
+                         FakeClient.calls)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,62 @@
+import builtins
+import gzip
+import hashlib
+import io
+
+import pytest
+
+from qanary_helpers.logging.artifacts import iter_chunks, spool_artifact
+
+CONTENT = 'input,target\nWhat is the capital of France?,Paris\n' * 100
+
+
+@pytest.mark.parametrize('data', [
+    CONTENT,
+    CONTENT.encode('utf-8'),
+    io.StringIO(CONTENT),
+    io.BytesIO(CONTENT.encode('utf-8')),
+    CONTENT.splitlines(keepends=True),
+    (line.encode('utf-8') for line in CONTENT.splitlines(keepends=True)),
+])
+def test_iter_chunks_supports_strings_bytes_files_and_iterables(data):
+    assert b''.join(bytes(chunk) for chunk in iter_chunks(data, chunk_size=100)) == CONTENT.encode('utf-8')
+
+
+def test_iter_chunks_limits_the_chunk_size():
+    assert {len(chunk) for chunk in iter_chunks(CONTENT, chunk_size=1000)} <= {1000, len(CONTENT) % 1000}
+
+
+def test_spool_artifact_hashes_the_uncompressed_content(tmp_path):
+    digest = hashlib.sha256(CONTENT.encode('utf-8')).hexdigest()
+
+    path, plain_digest = spool_artifact(io.StringIO(CONTENT), str(tmp_path), 'dataset.txt')
+    gzip_path, gzip_digest = spool_artifact(CONTENT, str(tmp_path), 'dataset.txt', compression='gzip')
+
+    assert path.endswith('dataset.txt') and gzip_path.endswith('dataset.txt.gz')
+    assert plain_digest == gzip_digest == digest
+    with open(path) as f:
+        assert f.read() == CONTENT
+    with gzip.open(gzip_path, 'rt') as f:
+        assert f.read() == CONTENT
+    # reproducible compression
+    again_path, _ = spool_artifact(CONTENT, str(tmp_path), 'again.txt', compression='gzip')
+    with open(gzip_path, 'rb') as f, open(again_path, 'rb') as g:
+        assert f.read() == g.read()
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        spool_artifact(CONTENT, str(tmp_path), 'dataset.txt', compression='bzip2')
+
+
+def test_zstd_requires_zstandard(tmp_path, monkeypatch):
+    real_import = builtins.__import__
+
+    def fake_import(name, *args, **kwargs):
+        if name == 'zstandard':
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', fake_import)
+    with pytest.raises(ImportError, match='pip install zstandard'):
+        spool_artifact(CONTENT, str(tmp_path), 'dataset.txt', compression='zstd')
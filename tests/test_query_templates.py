@@ -0,0 +1,90 @@
+"""Unit tests for the query template registry: typed binding, validation,
+lazy logging and the per-template statistics."""
+import logging
+
+import pytest
+
+from qanary_helpers import query_templates
+from qanary_helpers.qanary_queries import _question_uris_query
+from qanary_helpers.query_templates import (
+    PreparedQuery,
+    QueryTemplate,
+    get_query_template,
+    query_template_stats,
+    register_query,
+    track_query,
+)
+
+
+def test_bind_escapes_typed_parameters():
+    template = QueryTemplate("test", "SELECT * FROM {graph} WHERE {{ ?s ?p {text} FILTER(?l IN ({langs})) }} LIMIT {n}",
+                             graph="iri", text="literal", langs="langs", n="integer")
+    query = template.bind(graph="urn:g x", text='say "hi"\n', langs={"en", "de"}, n="3")
+    assert query == ('SELECT * FROM <urn:g%20x> WHERE { ?s ?p "say \\"hi\\"\\n" '
+                     'FILTER(?l IN ("de", "en")) } LIMIT 3')
+    assert isinstance(query, PreparedQuery)
+    assert query.template is template
+    assert query.params["n"] == "3"
+
+
+@pytest.mark.parametrize("text, types", [
+    ("SELECT * FROM {graph}", {}),
+    ("SELECT * FROM {graph}", {"graph": "uri"}),
+    ("SELECT * FROM {graph!r}", {"graph": "iri"}),
+])
+def test_invalid_templates_are_rejected(text, types):
+    with pytest.raises(ValueError):
+        QueryTemplate("invalid", text, **types)
+
+
+def test_bind_rejects_missing_parameters_and_invalid_language_tags():
+    template = QueryTemplate("test", "FILTER(lang(?x) = {lang})", lang="lang")
+    with pytest.raises(ValueError):
+        template.bind()
+    with pytest.raises(ValueError):
+        template.bind(lang='en") || true || ("')
+
+
+def test_registry_rejects_duplicate_names():
+    with pytest.raises(ValueError):
+        register_query("question_uris", "SELECT * {{}}")
+    assert get_query_template("question_uris").name == "question_uris"
+
+
+def test_track_query_logs_by_name_and_records_latency(caplog):
+    template = get_query_template("question_uris")
+    calls = template.calls
+    query = template.bind(graph="urn:graph")
+    with caplog.at_level(logging.INFO):
+        with track_query(query):
+            pass
+        with track_query("SELECT * { ?s ?p ?o }"):
+            pass
+    assert [record.getMessage() for record in caplog.records] == \
+        ["execute SPARQL query question_uris {'graph': 'urn:graph'}"]
+    assert query_template_stats()["question_uris"]["calls"] == calls + 1
+
+
+def test_client_records_executions(monkeypatch):
+    from qanary_helpers.triplestore import TriplestoreClient
+
+    class FakeResponse:
+        headers = {"Content-Type": "application/sparql-results+json"}
+        status_code = 200
+        content = b'{"results": {"bindings": []}}'
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"results": {"bindings": []}}
+
+    query_templates.reset_query_template_stats()
+    client = TriplestoreClient("http://ts:8080")
+    monkeypatch.setattr(client.session, "post", lambda *args, **kwargs: FakeResponse())
+    client.query(_question_uris_query("urn:graph"))
+    client.query(_question_uris_query("urn:graph"))
+    stats = query_template_stats()["question_uris"]
+    assert stats["calls"] == 2
+    assert stats["seconds"] >= 0 and stats["mean_seconds"] == stats["seconds"] / 2
+    client.close()
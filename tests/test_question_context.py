@@ -0,0 +1,55 @@
+"""Unit tests for QanaryQuestionContext: every piece of question data is fetched
+at most once per context (select_from_triplestore and the text fetch faked)."""
+import pytest
+
+from qanary_helpers import question_context
+from qanary_helpers.language_queries import QuestionTextWithLanguage
+from qanary_helpers.question_context import QanaryQuestionContext
+
+REQUEST = {"values": {"urn:qanary#endpoint": "http://ts:8080", "urn:qanary#inGraph": "urn:graph"}}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def fake_select(endpoint, query):
+        calls.append("select")
+        return {"results": {"bindings": [{"questionURI": {"value": "urn:q1"}}]}}
+
+    def fake_text(endpoint, question_uri):
+        calls.append("text")
+        return "Wer schrieb Faust?"
+
+    monkeypatch.setattr(question_context, "select_from_triplestore", fake_select)
+    monkeypatch.setattr(question_context, "get_text_question_from_uri", fake_text)
+    monkeypatch.setattr(question_context, "get_detected_languages_of_question",
+                        lambda endpoint, graph, uri: calls.append("languages") or ["de"])
+    monkeypatch.setattr(question_context, "get_translations_of_question",
+                        lambda endpoint, graph, uri: calls.append("translations") or
+                        [QuestionTextWithLanguage(uri, "Who wrote Faust?", "en")])
+    return calls
+
+
+def test_from_request():
+    context = QanaryQuestionContext.from_request(REQUEST)
+    assert context.triplestore_endpoint == "http://ts:8080"
+    assert context.graph_uri == "urn:graph"
+
+
+def test_question_data_is_fetched_once(calls):
+    context = QanaryQuestionContext.from_request(REQUEST)
+    for _ in range(3):
+        assert context.question_uri == "urn:q1"
+        assert context.question_text == "Wer schrieb Faust?"
+        assert context.detected_languages == ["de"]
+        assert context.get_translation("en") == "Who wrote Faust?"
+        assert context.get_translation("fr") is None
+    assert calls == ["select", "text", "languages", "translations"]
+
+
+def test_missing_question_raises(monkeypatch):
+    monkeypatch.setattr(question_context, "select_from_triplestore",
+                        lambda endpoint, query: {"results": {"bindings": []}})
+    with pytest.raises(ValueError):
+        QanaryQuestionContext("http://ts:8080", "urn:graph").question_uri
@@ -0,0 +1,120 @@
+import threading
+import queue
+
+import pytest
+
+from qanary_helpers.logging import QueuedLogger, QanaryComponentLogger
+
+
+class RecordingLogger(QanaryComponentLogger):
+    def __init__(self):
+        self.records = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def log_train_results(self, *args):
+        self.release.wait()
+        self.records.append(('train', args))
+        return 'train-run'
+
+    def log_test_results(self, questions):
+        raise ConnectionError('tracking server unavailable')
+
+    def log_annotation(self, model_uuid, question, predicted_target, qanary_graph_id):
+        self.release.wait()
+        self.records.append(('annotation', question))
+        return f'run-{question}'
+
+
+def test_records_are_logged_in_the_background():
+    logger = RecordingLogger()
+    queued = QueuedLogger(logger, flush_on_exit=False)
+
+    futures = [queued.log_annotation('model:latest', f'q{index}', 'target', 'graph') for index in range(3)]
+
+    assert queued.close(timeout=5)
+    assert [future.result() for future in futures] == ['run-q0', 'run-q1', 'run-q2']
+    assert [record[1] for record in logger.records] == ['q0', 'q1', 'q2']
+    assert queued.stats() == {'enqueued': 3, 'logged': 3, 'dropped': 0, 'failed': 0, 'waiting': 0}
+
+
+def test_failures_are_counted():
+    queued = QueuedLogger(RecordingLogger(), flush_on_exit=False)
+
+    future = queued.log_test_results([{'input': 'q'}])
+
+    assert queued.flush(timeout=5)
+    with pytest.raises(ConnectionError):
+        future.result()
+    assert queued.failed == 1
+    queued.close()
+
+
+def test_drop_policy_drops_records_beyond_max_queue_size():
+    logger = RecordingLogger()
+    logger.release.clear()
+    queued = QueuedLogger(logger, max_queue_size=1, flush_on_exit=False)
+
+    first = queued.log_annotation('model:latest', 'running', 'target', 'graph')
+    while queued.queue_size:
+        pass
+    waiting = queued.log_annotation('model:latest', 'waiting', 'target', 'graph')
+    dropped = queued.log_annotation('model:latest', 'dropped', 'target', 'graph')
+
+    assert not queued.flush(timeout=0.05)
+    logger.release.set()
+    assert queued.close(timeout=5)
+    assert first.result() == 'run-running' and waiting.result() == 'run-waiting'
+    with pytest.raises(queue.Full):
+        dropped.result()
+    assert queued.stats()['dropped'] == 1
+    assert isinstance(queued.log_annotation('model:latest', 'late', 'target', 'graph').exception(), RuntimeError)
+
+
+def test_block_policy_waits_for_a_free_place():
+    logger = RecordingLogger()
+    logger.release.clear()
+    queued = QueuedLogger(logger, max_queue_size=1, policy='block', block_timeout=0.05, flush_on_exit=False)
+
+    queued.log_annotation('model:latest', 'running', 'target', 'graph')
+    while queued.queue_size:
+        pass
+    queued.log_annotation('model:latest', 'waiting', 'target', 'graph')
+    timed_out = queued.log_annotation('model:latest', 'timed out', 'target', 'graph')
+    assert isinstance(timed_out.exception(), queue.Full)
+
+    threading.Timer(0.05, logger.release.set).start()
+    queued.block_timeout = None
+    assert queued.log_annotation('model:latest', 'blocked', 'target', 'graph').result(timeout=5) == 'run-blocked'
+    queued.close()
+
+
+def test_records_enqueued_while_closing_are_logged_or_dropped():
+    logger = RecordingLogger()
+    queued = QueuedLogger(logger, max_queue_size=2, policy='block', flush_on_exit=False)
+    futures = []
+
+    def enqueue(thread):
+        for index in range(50):
+            futures.append(queued.log_annotation('model:latest', f'q{thread}-{index}', 'target', 'graph'))
+
+    threads = [threading.Thread(target=enqueue, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    assert queued.close(timeout=5)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert all(future.done() for future in futures)
+    dropped = [future for future in futures if future.exception() is not None]
+    assert all(isinstance(future.exception(), RuntimeError) for future in dropped)
+    assert queued.stats() == {'enqueued': len(futures) - len(dropped), 'logged': len(logger.records),
+                              'dropped': len(dropped), 'failed': 0, 'waiting': 0}
+    assert queued.logged == queued.enqueued
+    assert queued.flush(timeout=1)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        QueuedLogger(RecordingLogger(), policy='spill')
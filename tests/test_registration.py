@@ -1,3 +1,7 @@
+import json
+
+import pytest
+
 from qanary_helpers.registration import Registration
 
 
@@ -24,3 +28,37 @@ def test_registration():
     assert registration.serviceUrl == serviceUrl
     assert registration.source == source
     assert registration.metadata == metadata
+
+
+def test_registration_is_immutable_and_does_not_share_metadata():
+    metadata = {"description": "echoes"}
+    registration = Registration(name="name", healthUrl="healthUrl", metadata=metadata)
+    metadata["description"] = "changed"
+
+    assert registration.metadata["description"] == "echoes"
+    assert Registration(name="other", healthUrl="healthUrl").metadata == {}
+    with pytest.raises(AttributeError):
+        registration.name = "other"
+    with pytest.raises(TypeError):
+        registration.metadata["description"] = "changed"
+    assert not hasattr(registration, "__dict__")
+
+
+def test_replace_and_equality():
+    registration = Registration(name="name", healthUrl="healthUrl", metadata={"a": 1})
+    changed = registration.replace(serviceUrl="serviceUrl")
+
+    assert registration.serviceUrl is None and changed.serviceUrl == "serviceUrl"
+    assert registration == Registration(name="name", healthUrl="healthUrl", metadata={"a": 1})
+    assert registration != changed
+    assert hash(registration) == hash(registration.replace(metadata={"b": 2}))
+    with pytest.raises(ValueError):
+        registration.replace(unknown="value")
+
+
+def test_payload_is_serialized_once_without_none_values():
+    registration = Registration(name="name", healthUrl="healthUrl", metadata={"a": 1})
+
+    assert json.loads(registration.payload) == {"name": "name", "healthUrl": "healthUrl", "metadata": {"a": 1}}
+    assert registration.payload is registration.payload
+    assert json.loads(registration.replace(name="other").payload)["name"] == "other"
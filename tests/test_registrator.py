@@ -1,4 +1,13 @@
-from qanary_helpers.registrator import Registrator
+import asyncio
+import json
+import time
+
+import pytest
+import requests
+from aiohttp import web
+
+from qanary_helpers import aio
+from qanary_helpers.registrator import AsyncRegistrator, RegistrationManager, Registrator, registration_delay
 from qanary_helpers.registration import Registration
 
 name = "name"
@@ -40,3 +49,138 @@ def test_admin_server_url():
 
 def test_is_stopped():
     assert registrator_thread.is_stopped() is False
+
+
+def test_registration_delay_jitter_and_backoff():
+    delays = [registration_delay(10, jitter=0.1) for _ in range(100)]
+    assert all(9 <= delay <= 11 for delay in delays)
+    assert len(set(delays)) > 1
+    assert 0.9 <= registration_delay(10, failures=1) <= 1
+    assert 7.2 <= registration_delay(10, failures=4) <= 8
+    assert registration_delay(10, failures=30, max_backoff=60) <= 60
+
+
+class FakeResponse:
+    content = b"{}"
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def __bool__(self):
+        return self.status_code < 400
+
+
+def test_run_backs_off_on_failure_and_stops_promptly(monkeypatch):
+    calls = []
+
+    def fake_post(url, data, timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise requests.ConnectionError("admin server unavailable")
+        return FakeResponse(200)
+
+    registrator = Registrator("http://admin:8080", "user", "password", registration, interval=30,
+                              timeout=(1, 2), backoff_base=0.01)
+    monkeypatch.setattr(registrator.session, "post", fake_post)
+    registrator.start()
+    while len(calls) < 3:
+        time.sleep(0.01)
+    assert registrator.failures == 0
+    started = time.monotonic()
+    registrator.stop()
+    registrator.join(5)
+    assert not registrator.is_alive()
+    assert time.monotonic() - started < 1
+    assert calls == [(1, 2)] * 3
+
+
+def test_async_registrator_registers_and_retries():
+    async def scenario():
+        received = []
+
+        async def instances(request):
+            received.append((await request.json(), request.headers["Authorization"]))
+            return web.json_response({"id": "1"}, status=503 if len(received) == 1 else 201)
+
+        app = web.Application()
+        app.router.add_post("/instances", instances)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        registrator = AsyncRegistrator(f"http://127.0.0.1:{runner.addresses[0][1]}", "user", "password",
+                                       registration, interval=30, backoff_base=0.01)
+        try:
+            registrator.start()
+            while len(received) < 2:
+                await asyncio.sleep(0.01)
+            assert registrator.failures == 0
+            await registrator.stop()
+            assert registrator.is_stopped()
+        finally:
+            await aio.close_session()
+            await runner.cleanup()
+        return received
+
+    received = asyncio.run(scenario())
+    assert received[0][0]["name"] == name
+    assert received[0][1].startswith("Basic ")
+
+
+def test_heartbeat_registers_again_only_if_the_instance_is_unknown(monkeypatch):
+    calls, statuses = [], [200, 404]
+
+    def fake_post(url, data, timeout):
+        calls.append(("POST", url, data))
+        response = FakeResponse(201)
+        response.content = b'{"id": "abc"}'
+        return response
+
+    def fake_get(url, timeout):
+        calls.append(("GET", url))
+        return FakeResponse(statuses.pop(0))
+
+    registrator = Registrator("http://admin:8080", "user", "password", registration, heartbeat=True)
+    monkeypatch.setattr(registrator.session, "post", fake_post)
+    monkeypatch.setattr(registrator.session, "get", fake_get)
+    assert all(registrator.call_admin_server() for _ in range(3))
+
+    assert [call[0] for call in calls] == ["POST", "GET", "GET", "POST"]
+    assert calls[1][1] == "http://admin:8080/instances/abc"
+    assert calls[0][2] is registration.payload
+    assert registrator.instance_id == "abc"
+
+
+def test_registration_manager_spreads_calls_over_one_session(monkeypatch):
+    manager = RegistrationManager("http://admin:8080", "user", "password", interval=0.4)
+    calls = []
+
+    def fake_post(url, data, timeout):
+        calls.append((time.monotonic(), json.loads(data)["name"]))
+        if json.loads(data)["name"] == "broken":
+            raise requests.ConnectionError("admin server unavailable")
+        response = FakeResponse(201)
+        response.content = json.dumps({"id": json.loads(data)["name"]}).encode()
+        return response
+
+    monkeypatch.setattr(manager.session, "post", fake_post)
+    for index in range(4):
+        manager.add(registration.replace(name="component-{0}".format(index)))
+    manager.add(registration.replace(name="broken"), key="b")
+    with pytest.raises(ValueError):
+        manager.add(registration.replace(name="broken"), key="b")
+
+    manager.start()
+    time.sleep(0.5)
+    manager.stop()
+    manager.join(5)
+    assert not manager.is_alive()
+
+    status = manager.status()
+    assert set(status) == {"component-0", "component-1", "component-2", "component-3", "b"}
+    assert all(status["component-{0}".format(index)].registered for index in range(4))
+    assert status["component-0"].instance_id == "component-0"
+    assert not status["b"].registered and status["b"].failures >= 1
+    assert all(registrator.session is manager.session for registrator in manager._registrators.values())
+    first_calls = sorted(moment for moment, name in calls if name.startswith("component"))[:4]
+    assert first_calls[3] - first_calls[0] >= 0.2
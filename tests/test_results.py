@@ -0,0 +1,109 @@
+"""Unit tests for the compact SELECT result decoding (JSON and streamed TSV)."""
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from qanary_helpers import qanary_queries as qq
+from qanary_helpers.results import (
+    LangLiteral,
+    XSD,
+    decode_select_columns,
+    decode_select_results,
+    iter_tsv_rows,
+    parse_tsv_term,
+    split_lines,
+)
+from qanary_helpers.triplestore import TriplestoreClient, close_triplestore_clients
+
+RESULTS = {
+    "head": {"vars": ["s", "label", "score", "at", "missing"]},
+    "results": {"bindings": [
+        {
+            "s": {"type": "uri", "value": "urn:q1"},
+            "label": {"type": "literal", "value": "Hallo", "xml:lang": "de"},
+            "score": {"type": "literal", "value": "0.5", "datatype": XSD + "float"},
+            "at": {"type": "literal", "value": "2024-01-02T03:04:05Z", "datatype": XSD + "dateTime"},
+        },
+        {
+            "s": {"type": "bnode", "value": "b0"},
+            "score": {"type": "literal", "value": "not a number", "datatype": XSD + "float"},
+        },
+    ]},
+}
+
+TSV = (
+    '?s\t?label\t?n\t?flag\n'
+    '<urn:q1>\t"Hallo\\tWelt"@de\t42\ttrue\n'
+    '<urn:q2>\t"1.5"^^<http://www.w3.org/2001/XMLSchema#decimal>\t\t\n'
+)
+
+
+def test_decode_select_results_converts_terms():
+    rows = decode_select_results(RESULTS)
+    assert rows[0].s == "urn:q1"
+    assert rows[0].label == "Hallo" and isinstance(rows[0].label, LangLiteral) and rows[0].label.lang == "de"
+    assert rows[0].score == 0.5
+    assert rows[0].at == datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert rows[0].missing is None
+    # values that do not match their datatype are kept as strings
+    assert rows[1].score == "not a number"
+    assert rows[1].label is None
+
+
+def test_rows_share_one_type():
+    rows = decode_select_results(RESULTS)
+    assert type(rows[0]) is type(rows[1])
+    assert rows[0]._fields == ("s", "label", "score", "at", "missing")
+
+
+def test_decode_select_columns():
+    columns = decode_select_columns(RESULTS)
+    assert columns["s"] == ["urn:q1", "b0"]
+    assert columns["missing"] == [None, None]
+
+
+def test_parse_tsv_term():
+    assert parse_tsv_term("<urn:a>") == "urn:a"
+    assert parse_tsv_term('"a \\"quote\\"\\n"') == 'a "quote"\n'
+    assert parse_tsv_term('"\\u00e4"@de').lang == "de"
+    assert parse_tsv_term('"7"^^<http://www.w3.org/2001/XMLSchema#integer>') == 7
+    assert parse_tsv_term("1.25") == Decimal("1.25")
+    assert parse_tsv_term("1e3") == 1000.0
+    assert parse_tsv_term("false") is False
+    assert parse_tsv_term("_:b1") == "_:b1"
+    assert parse_tsv_term("") is None
+
+
+def test_iter_tsv_rows():
+    rows = list(iter_tsv_rows(TSV.splitlines()))
+    assert rows[0] == ("urn:q1", "Hallo\tWelt", 42, True)
+    assert rows[1].label == Decimal("1.5")
+    assert rows[1].n is None and rows[1].flag is None
+
+
+def test_split_lines_across_chunk_boundaries():
+    data = TSV.encode("utf-8")
+    chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+    assert list(split_lines(chunks)) == TSV.splitlines()
+
+
+def test_iter_select_from_triplestore_streams_rows(monkeypatch):
+    class FakeResponse:
+        def iter_content(self, chunk_size):
+            data = TSV.encode("utf-8")
+            return (data[i:i + 5] for i in range(0, len(data), 5))
+
+    requests = []
+
+    @contextmanager
+    def fake_stream_query(self, sparql_query, accept):
+        requests.append((self.endpoint, accept))
+        yield FakeResponse()
+
+    close_triplestore_clients()
+    monkeypatch.setattr(TriplestoreClient, "stream_query", fake_stream_query)
+    rows = qq.iter_select_from_triplestore("http://ts:8080", "SELECT * {?s ?p ?o}")
+    assert next(rows).s == "urn:q1"
+    assert [row.s for row in rows] == ["urn:q2"]
+    assert requests == [("http://ts:8080", "text/tab-separated-values")]
+    close_triplestore_clients()
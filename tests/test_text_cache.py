@@ -0,0 +1,110 @@
+"""Unit tests for the bounded question text cache and its use by the helpers
+fetching raw question texts."""
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from qanary_helpers import qanary_queries as qq
+from qanary_helpers import text_cache
+from qanary_helpers.text_cache import (
+    QuestionTextCache,
+    disable_question_text_cache,
+    enable_question_text_cache,
+    get_question_text_cache,
+)
+from qanary_helpers.triplestore import TriplestoreClient
+
+
+@pytest.fixture(autouse=True)
+def no_global_cache():
+    disable_question_text_cache()
+    yield
+    disable_question_text_cache()
+
+
+def test_hits_and_misses_are_counted():
+    cache = QuestionTextCache()
+    assert cache.get("urn:q1") is None
+    cache.put("urn:q1", "Hello")
+    assert cache.get("urn:q1") == "Hello"
+    assert cache.stats() == {"entries": 1, "bytes": 5, "hits": 1, "misses": 1}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QuestionTextCache(max_entries=2)
+    cache.put("urn:q1", "a")
+    cache.put("urn:q2", "b")
+    cache.get("urn:q1")
+    cache.put("urn:q3", "c")
+    assert cache.get("urn:q2") is None
+    assert cache.get("urn:q1") == "a"
+    assert len(cache) == 2
+
+
+def test_max_bytes_is_respected():
+    cache = QuestionTextCache(max_bytes=10)
+    cache.put("urn:q1", "12345")
+    cache.put("urn:q2", "äöü")  # 6 bytes in UTF-8
+    assert cache.get("urn:q1") is None
+    assert cache.size == 6
+    cache.put("urn:q3", "x" * 11)
+    assert cache.get("urn:q3") is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(text_cache.time, "monotonic", lambda: now[0])
+    cache = QuestionTextCache(ttl=5)
+    cache.put("urn:q1", "Hello")
+    now[0] = 104.0
+    assert cache.get("urn:q1") == "Hello"
+    now[0] = 105.0
+    assert cache.get("urn:q1") is None
+    assert len(cache) == 0
+
+
+def test_cache_is_opt_in():
+    assert get_question_text_cache() is None
+    cache = enable_question_text_cache(max_entries=5, ttl=60)
+    assert get_question_text_cache() is cache
+    assert cache.max_entries == 5
+
+
+def test_get_text_question_from_uri_uses_cache(monkeypatch):
+    fetched = []
+
+    def fake_get(self, url, timeout=None):
+        fetched.append(url)
+        return MagicMock(text="What is the capital of France?", status_code=200, content=b"")
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    cache = enable_question_text_cache()
+    for _ in range(3):
+        assert qq.get_text_question_from_uri("http://ts:8080", "http://localhost:8080/q/1") == \
+            "What is the capital of France?"
+    assert len(fetched) == 1
+    assert cache.hits == 2
+
+
+def test_bulk_fetch_skips_cached_texts(monkeypatch):
+    fetched = []
+    monkeypatch.setattr(TriplestoreClient, "fetch_text", lambda self, url: fetched.append(url) or "fetched")
+    enable_question_text_cache().put("urn:q1", "cached")
+    results = qq.get_text_questions_from_uris("http://ts:8080", ["urn:q1", "http://localhost/q/2"])
+    assert [result.text for result in results] == ["cached", "fetched"]
+    assert len(fetched) == 1
+
+
+def test_error_responses_are_not_cached(monkeypatch):
+    def fake_get(self, url, timeout=None):
+        response = requests.Response()
+        response.status_code = 500
+        response._content = b"Internal Server Error"
+        return response
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    cache = enable_question_text_cache(ttl=None)
+    with pytest.raises(requests.HTTPError):
+        qq.get_text_question_from_uri("http://ts:8080", "http://localhost:8080/q/1")
+    assert len(cache) == 0
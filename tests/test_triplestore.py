@@ -0,0 +1,63 @@
+"""Unit tests for the pooled triplestore client: endpoint parsing, query type
+detection and the per-endpoint client registry."""
+import pytest
+
+from qanary_helpers import triplestore
+from qanary_helpers.triplestore import (
+    TriplestoreClient,
+    close_triplestore_clients,
+    get_triplestore_client,
+    is_update_query,
+    parse_triplestore_endpoint,
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    close_triplestore_clients()
+    yield
+    close_triplestore_clients()
+
+
+def test_parse_v3_endpoint_strips_suffixes():
+    assert parse_triplestore_endpoint("http://ts:8080/query") == ("http://ts:8080", None, None)
+    assert parse_triplestore_endpoint("http://ts:8080/update") == ("http://ts:8080", None, None)
+
+
+def test_parse_v2_endpoint_extracts_credentials():
+    assert parse_triplestore_endpoint("http://admin:pw@stardog:5820/qanary/query") == \
+        ("http://stardog:5820/qanary/query", "admin", "pw")
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT * WHERE {?s ?p ?o}", False),
+    ("ASK {?s ?p ?o}", False),
+    ("PREFIX qa: <http://www.wdaqua.eu/qa#>\n# comment\nSELECT * {?s qa:x ?o}", False),
+    ("PREFIX qa: <http://www.wdaqua.eu/qa#>\n  INSERT { ?s ?p ?o } WHERE {}", True),
+    ("insert data { <urn:a> <urn:b> <urn:c> }", True),
+    ("WITH <urn:g> DELETE { ?s ?p ?o } WHERE { ?s ?p ?o }", True),
+])
+def test_is_update_query(query, expected):
+    assert is_update_query(query) is expected
+
+
+def test_client_pool_is_configurable():
+    client = TriplestoreClient("http://ts:8080", pool_size=3, retries=1)
+    adapter = client.session.get_adapter("http://ts:8080")
+    assert adapter._pool_maxsize == 3
+    assert adapter.max_retries.total == 1
+    client.close()
+
+
+def test_shared_client_per_endpoint():
+    client = get_triplestore_client("http://ts:8080/query")
+    assert get_triplestore_client("http://ts:8080/update") is client
+    assert get_triplestore_client("http://ts:8080") is client
+    assert get_triplestore_client("http://other:8080") is not client
+
+
+def test_close_triplestore_clients_forgets_clients():
+    client = get_triplestore_client("http://ts:8080")
+    close_triplestore_clients()
+    assert get_triplestore_client("http://ts:8080") is not client
+    assert triplestore._clients_by_url["http://ts:8080"] is not client